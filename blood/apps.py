@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class BloodConfig(AppConfig):
     name = 'blood'
+
+    def ready(self):
+        import blood.signals
+        from blood.utils.reverse_geocoder import gazetteer
+
+        # Build the reverse-geocoding index once per process rather than on the first request
+        gazetteer.load()
@@ -1,10 +1,38 @@
-from .models import BloodRequest  
-from donor.models import BloodDonate 
+from django.utils.functional import SimpleLazyObject
+
+from blood.utils.notifications import admin_badge_counts, cached_unread_count, user_role
+from donor.models import Donor
+from nurse.models import Nurse
+from patient.models import Patient
+
+
+def notification_counts(request):
+    """
+    Notification badge counts for the base templates, as lazy values.
+
+    Nothing is looked up (not even request.user) until a template reads a
+    count, so pages without badges cost no queries. The user's role is
+    worked out once per request and shared by every count that needs it.
+    """
+    role = SimpleLazyObject(lambda: user_role(request.user))
+
+    def unread_count():
+        # patientbase.html and nursebase.html both read 'unread_count'
+        if role == 'patient':
+            return cached_unread_count(request.user, Patient)
+        if role == 'nurse':
+            return cached_unread_count(request.user, Nurse)
+        return 0
+
+    def donor_unread_count():
+        return cached_unread_count(request.user, Donor) if role == 'donor' else 0
+
+    # Only the admin sidebar shows these badges
+    admin_counts = SimpleLazyObject(lambda: admin_badge_counts() if request.user.is_staff else {})
 
-def admin_notification_counts(request):
-    new_requests_count = BloodRequest.objects.filter(status='Pending', is_seen=False).count()
-    new_donations_count = BloodDonate.objects.filter(is_seen=False).count()
     return {
-        'new_requests_count': new_requests_count,
-        'new_donations_count': new_donations_count
+        'unread_count': SimpleLazyObject(unread_count),
+        'donor_unread_notification_count': SimpleLazyObject(donor_unread_count),
+        'new_requests_count': SimpleLazyObject(lambda: admin_counts.get('new_requests_count', 0)),
+        'new_donations_count': SimpleLazyObject(lambda: admin_counts.get('new_donations_count', 0)),
     }
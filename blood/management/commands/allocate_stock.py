@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blood.models import DonationCenter
+from blood.utils.allocation import allocate_all_centers, allocate_center_stock
+
+
+class Command(BaseCommand):
+    help = "Allocate batches across all approved requests per center and store them as reservations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--center', type=int, action='append', dest='centers',
+                            help="Only allocate this donation center id (repeatable).")
+        parser.add_argument('--exact-group-only', action='store_true',
+                            help="Do not serve requests from compatible substitute groups.")
+
+    def handle(self, *args, **options):
+        allow_substitutes = not options['exact_group_only']
+        if options['centers']:
+            centers = list(DonationCenter.objects.filter(id__in=options['centers']))
+            if len(centers) != len(set(options['centers'])):
+                raise CommandError("Unknown donation center id.")
+            results = {center.id: allocate_center_stock(center, allow_substitutes) for center in centers}
+        else:
+            results = allocate_all_centers(allow_substitutes)
+
+        for center_id, summary in results.items():
+            self.stdout.write(
+                f"Center {center_id}: {summary['allocated']}/{summary['requests']} request(s) reserved "
+                f"({summary['reserved_ml']}ml, {summary['substituted']} substituted), {summary['unfilled']} unfilled."
+            )
+        self.stdout.write(self.style.SUCCESS(f"Allocated stock for {len(results)} center(s)."))
@@ -0,0 +1,118 @@
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from blood.models import DonationCenter
+from blood.utils.reverse_geocoder import cache_key, gazetteer, resolve_location_names
+from donor.models import Donor
+from patient.models import Patient
+
+TARGETS = ('donor', 'patient', 'center')
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in location_name for donors/patients that have coordinates, and "
+        "coordinates for donation centers that only have an address, using the "
+        "local gazetteer. Streams rows in primary-key order; re-running resumes, "
+        "since filled rows no longer match (or pass --start-after)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=TARGETS, nargs='+', default=list(TARGETS))
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--start-after', type=int, default=0,
+                            help="Skip rows with a primary key up to this one (the last id a previous run reported; "
+                                 "use with a single --only target).")
+        parser.add_argument('--dry-run', action='store_true', help="Resolve and count without writing.")
+
+    def handle(self, *args, **options):
+        # Cell -> name, shared by donors and patients so each cell hits the cache table once
+        self.known = {}
+        self.dry_run = options['dry_run']
+        for target in options['only']:
+            if target == 'center':
+                self._run(DonationCenter, self._centers(options), self._locate_centers,
+                          ['latitude', 'longitude'], options, after_write=self._invalidate_centers)
+            else:
+                model = Donor if target == 'donor' else Patient
+                self._run(model, self._unnamed(model, options), self._name_rows(model),
+                          ['location_name'], options)
+
+    def _unnamed(self, model, options):
+        return (
+            model.objects.filter(latitude__isnull=False, longitude__isnull=False, pk__gt=options['start_after'])
+            .filter(Q(location_name__isnull=True) | Q(location_name=''))
+            .order_by('pk')
+            .values_list('pk', 'latitude', 'longitude')
+        )
+
+    def _centers(self, options):
+        return (
+            DonationCenter.objects.filter(Q(latitude__isnull=True) | Q(longitude__isnull=True))
+            .filter(pk__gt=options['start_after'])
+            .order_by('pk')
+            .values_list('pk', 'city', 'address')
+        )
+
+    def _name_rows(self, model):
+        def resolve(rows):
+            names = resolve_location_names(
+                [(lat, lng) for _, lat, lng in rows], self.known, record=not self.dry_run,
+            )
+            return [
+                model(pk=pk, location_name=name)
+                for pk, lat, lng in rows
+                if (name := names[cache_key(lat, lng)])
+            ]
+        return resolve
+
+    def _locate_centers(self, rows):
+        updates = []
+        for pk, city, address in rows:
+            point = gazetteer.locate(city, address)
+            if point:
+                lat, lng = point
+                updates.append(DonationCenter(pk=pk, latitude=lat, longitude=lng))
+        return updates
+
+    def _run(self, model, queryset, resolve, fields, options, after_write=None):
+        label = model._meta.verbose_name_plural
+        chunk_size = options['chunk_size']
+        # iterator() streams rows (a server-side cursor on PostgreSQL) instead of loading the table
+        rows = queryset.iterator(chunk_size=chunk_size)
+        scanned = updated = 0
+        last_id = options['start_after']
+        started = time.perf_counter()
+        while chunk := list(islice(rows, chunk_size)):
+            updates = resolve(chunk)
+            if updates and not options['dry_run']:
+                with transaction.atomic():
+                    model.objects.bulk_update(updates, fields)
+                if after_write:
+                    after_write([obj.pk for obj in updates])
+            scanned += len(chunk)
+            updated += len(updates)
+            last_id = chunk[-1][0]
+            rate = scanned / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(
+                f"{label}: {scanned} scanned, {updated} resolved, last id {last_id} ({rate:,.0f} rows/s)"
+            )
+
+        verb = "would update" if options['dry_run'] else "updated"
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {verb} {updated} of {scanned} in {elapsed:.1f}s; "
+            f"{scanned - updated} could not be resolved"
+        ))
+
+    @staticmethod
+    def _invalidate_centers(ids):
+        # bulk_update sends no post_save, so tell the center KD-tree directly
+        from blood.utils.spatial_index import center_index
+
+        for pk in ids:
+            center_index.mark_changed(pk)
@@ -0,0 +1,85 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blood.models import Stock
+from blood.utils.allocation import URGENCY_RANK, solve_allocation
+
+
+def _per_request_fifo(requests, batches):
+    """Baseline: serve requests as they arrive from their own group only, like deduct_stock_fifo."""
+    pools = {}
+    for batch in sorted(batches, key=lambda b: (b['expiry_date'], b['id'])):
+        pools.setdefault(batch['bloodgroup'], []).append([batch['id'], batch['unit']])
+    filled = set()
+    for req in sorted(requests, key=lambda r: r['created_at']):
+        pool = pools.get(req['bloodgroup'], [])
+        if sum(left for _, left in pool) < req['units']:
+            continue
+        needed = req['units']
+        for entry in pool:
+            take = min(entry[1], needed)
+            entry[1] -= take
+            needed -= take
+            if not needed:
+                break
+        filled.add(req['key'])
+    return filled
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare whole-queue allocation with per-request FIFO on synthetic queues "
+        "(in memory, no database writes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, nargs='+', default=[100, 1000, 5000])
+        parser.add_argument('--supply-ratio', type=float, default=0.8,
+                            help="Stock on hand as a fraction of total requested ml.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        groups = [bg for bg, _ in Stock.BLOOD_GROUP_CHOICES]
+        urgencies = list(URGENCY_RANK)
+        today = timezone.now().date()
+        start = datetime(today.year, today.month, today.day)
+
+        for size in options['requests']:
+            requests = [
+                {
+                    'key': i,
+                    'bloodgroup': rng.choice(groups),
+                    'units': rng.choice([450, 900, 1350]),
+                    'urgency': rng.choices(urgencies, weights=[1, 2, 5, 2])[0],
+                    'created_at': start + timedelta(minutes=i),
+                }
+                for i in range(size)
+            ]
+            supply = int(sum(r['units'] for r in requests) * options['supply_ratio'])
+            batches = []
+            while supply > 0:
+                unit = min(rng.choice([450, 450, 300, 200]), supply)
+                batches.append({
+                    'id': len(batches),
+                    'bloodgroup': rng.choice(groups),
+                    'unit': unit,
+                    'expiry_date': today + timedelta(days=rng.randint(0, 42)),
+                })
+                supply -= unit
+
+            started = time.perf_counter()
+            allocations, _ = solve_allocation(requests, batches)
+            elapsed = time.perf_counter() - started
+            baseline = _per_request_fifo(requests, batches)
+
+            urgent = {r['key'] for r in requests if r['urgency'] in ('Emergency', 'High')}
+            self.stdout.write(
+                f"{size:>6} requests, {len(batches)} batches: solved in {elapsed * 1000:.1f} ms | "
+                f"filled {len(allocations)} vs FIFO {len(baseline)} | "
+                f"urgent filled {len(urgent & set(allocations))}/{len(urgent)} vs FIFO {len(urgent & baseline)}"
+            )
@@ -0,0 +1,104 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blood.utils.blood_compatibility import BLOOD_GROUPS
+from blood.utils.coordinate_snapshot import donor_snapshot
+from blood.utils.geolocation import find_nearby_eligible_donors, haversine
+from donor.models import Donor, DonorEligibility
+
+# Donors are scattered over Kenya; searches are centred on Nairobi
+LAT_RANGE = (-4.7, 5.0)
+LNG_RANGE = (33.9, 41.9)
+SEARCH_POINT = (-1.2921, 36.8219)
+
+
+def _full_scan(lat, lng, max_distance_km):
+    """Baseline: load every donor with coordinates and check each one in Python, as before the snapshot."""
+    nearby = []
+    for donor in Donor.objects.filter(latitude__isnull=False, longitude__isnull=False):
+        distance = haversine(lat, lng, donor.latitude, donor.longitude)
+        if distance <= max_distance_km:
+            nearby.append((donor, round(distance, 2)))
+    return nearby
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure nearby donor search time (coordinate snapshot against a full table scan) as the donor table grows. "
+        "Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+        parser.add_argument('--radius', type=float, default=50)
+        parser.add_argument('--repeat', type=int, default=5, help="Timed searches per size.")
+        parser.add_argument('--baseline-max', type=int, default=100000,
+                            help="Skip the full-scan baseline above this many donors.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def _insert(self, start, count, rng):
+        """Bulk insert count donors (with users and approved eligibility) numbered from start."""
+        for offset in range(start, start + count, 5000):
+            size = min(5000, start + count - offset)
+            users = User.objects.bulk_create([
+                User(username=f"bench-donor-{offset + i}") for i in range(size)
+            ])
+            donors = []
+            for i, user in enumerate(users):
+                lat, lng = rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)
+                donors.append(Donor(
+                    user=user,
+                    address="-",
+                    mobile=f"bench-{offset + i}",
+                    bloodgroup=rng.choice(BLOOD_GROUPS),
+                    latitude=lat,
+                    longitude=lng,
+                ))
+            donors = Donor.objects.bulk_create(donors)
+            DonorEligibility.objects.bulk_create([
+                DonorEligibility(donor=donor, approved=True) for donor in donors
+            ])
+
+    def _time(self, search, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            found = search()
+        return (time.perf_counter() - started) / repeat * 1000, len(found)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        lat, lng = SEARCH_POINT
+        radius = options['radius']
+
+        try:
+            with transaction.atomic():
+                existing = previous_found = 0
+                for size in sorted(options['sizes']):
+                    self._insert(existing, size - existing, rng)
+                    existing = size
+                    # bulk_create sends no signals; rebuild the snapshot before timing it
+                    donor_snapshot.mark_all_changed()
+                    donor_snapshot.refresh()
+
+                    snapshot_ms, found = self._time(
+                        lambda: find_nearby_eligible_donors(lat, lng, 'AB+', radius), options['repeat']
+                    )
+                    line = f"{size:>8} donors: snapshot {snapshot_ms:8.1f} ms ({found} within {radius:g} km)"
+                    if size <= options['baseline_max']:
+                        scan_ms, _ = self._time(lambda: _full_scan(lat, lng, radius), options['repeat'])
+                        line += f" | full scan {scan_ms:8.1f} ms"
+                    self.stdout.write(line)
+                    if found <= previous_found:
+                        raise CommandError(
+                            f"{found} donors found at {size} after {previous_found} at the previous size; "
+                            f"the search is not seeing the seeded donors."
+                        )
+                    previous_found = found
+                transaction.set_rollback(True)
+        finally:
+            # The seeded donors are rolled back; drop them from every snapshot
+            donor_snapshot.mark_all_changed()
@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from blood.models import DonationCenter, StockUnit
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of a StockUnit write as the number of batches per "
+        "center/bloodgroup grows. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+        parser.add_argument('--writes', type=int, default=200, help="Timed writes per size.")
+
+    def handle(self, *args, **options):
+        expiry = timezone.now().date() + timedelta(days=30)
+
+        with transaction.atomic():
+            center = DonationCenter.objects.create(
+                name="Benchmark Center", address="-", city="Benchmark",
+                contact_number="0", open_hours="-",
+            )
+            existing = 0
+            for size in sorted(options['sizes']):
+                # Background batches are inserted in bulk so only the timed writes hit the signal
+                StockUnit.objects.bulk_create([
+                    StockUnit(center=center, bloodgroup='O+', unit=450, expiry_date=expiry,
+                              barcode=f"BENCH-{existing + i}")
+                    for i in range(size - existing)
+                ])
+                existing = size
+
+                started = time.perf_counter()
+                for i in range(options['writes']):
+                    StockUnit(center=center, bloodgroup='O+', unit=450, expiry_date=expiry,
+                              barcode=f"BENCH-W-{size}-{i}").save()
+                elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f"{size:>8} batches: {elapsed / options['writes'] * 1000:.3f} ms per write"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,88 @@
+import csv
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from blood.models import DonationCenter
+from blood.utils.stock_utils import BULK_STOCK_CHUNK_SIZE, bulk_add_stock
+
+
+def iter_csv_rows(fileobj):
+    """Yield one dict per CSV line (header: bloodgroup,unit,expiry_date[,barcode])."""
+    for row in csv.DictReader(fileobj):
+        yield {key.strip().lower(): value for key, value in row.items() if key}
+
+
+def iter_json_rows(fileobj, read_size=64 * 1024):
+    """
+    Yield objects from a JSON array or JSON Lines file without loading it whole.
+    The file is decoded object by object from a small rolling buffer.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,[]')
+        if not buffer:
+            if eof:
+                return
+            chunk = fileobj.read(read_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError("Invalid JSON in stock import file.")
+            chunk = fileobj.read(read_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield obj
+        buffer = buffer[end:]
+
+
+class Command(BaseCommand):
+    help = "Import blood stock batches for one donation center from a CSV or JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV, JSON array or JSON Lines file.")
+        parser.add_argument('--center', type=int, required=True, help="Receiving donation center id.")
+        parser.add_argument('--format', choices=['csv', 'json'], help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=BULK_STOCK_CHUNK_SIZE)
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help="Import valid rows and report the invalid ones.")
+
+    def handle(self, *args, **options):
+        try:
+            center = DonationCenter.objects.get(id=options['center'])
+        except DonationCenter.DoesNotExist:
+            raise CommandError(f"Donation center {options['center']} does not exist.")
+
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        reader = iter_csv_rows if fmt == 'csv' else iter_json_rows
+
+        started = time.perf_counter()
+        with open(path, newline='', encoding='utf-8-sig') as fileobj:
+            try:
+                created, errors = bulk_add_stock(
+                    center,
+                    reader(fileobj),
+                    chunk_size=options['chunk_size'],
+                    skip_invalid=options['skip_invalid'],
+                )
+            except ValidationError as e:
+                for message in e.messages:
+                    self.stderr.write(message)
+                raise CommandError("Import aborted; no stock was added.")
+        elapsed = time.perf_counter() - started
+
+        for number, message in errors:
+            self.stderr.write(f"Skipped row {number}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created} batch(es) into {center.name} in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blood.models import BloodRequest
+from blood.utils.mobilisation import EMERGENCY_PAGE_SIZE, EMERGENCY_RADIUS_KM, mobilise_donors
+
+
+class Command(BaseCommand):
+    help = (
+        "Page the next best-ranked nearby donors for a blood request. Donors "
+        "already paged for the request are never paged again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('request_id', type=int)
+        parser.add_argument('--limit', type=int, default=EMERGENCY_PAGE_SIZE)
+        parser.add_argument('--radius', type=float, default=EMERGENCY_RADIUS_KM)
+
+    def handle(self, *args, **options):
+        blood_request = (
+            BloodRequest.objects.select_related('donation_center', 'request_by_patient')
+            .filter(pk=options['request_id']).first()
+        )
+        if blood_request is None:
+            raise CommandError(f"Blood request {options['request_id']} does not exist.")
+        paged = mobilise_donors(blood_request, limit=options['limit'], max_distance_km=options['radius'])
+        self.stdout.write(f"Paged {paged} donors for blood request {blood_request.pk}")
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blood.models import DonationCenter
+from blood.utils.blood_compatibility import BLOOD_GROUPS
+from blood.utils.rebalancing import REBALANCE_MAX_DISTANCE_KM, create_draft_requests, plan_rebalancing
+
+
+class Command(BaseCommand):
+    help = "Plan stock transfers between centers and optionally raise them as draft nurse blood requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-distance', type=float, default=REBALANCE_MAX_DISTANCE_KM,
+                            help="Longest transfer to consider, in km.")
+        parser.add_argument('--bloodgroup', action='append', dest='bloodgroups',
+                            help="Only plan this blood group (repeatable).")
+        parser.add_argument('--create-drafts', action='store_true',
+                            help="Replace the planned groups' drafts with draft NurseBloodRequests for this plan.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        moves, summary = plan_rebalancing(max_distance_km=options['max_distance'],
+                                          bloodgroups=options['bloodgroups'])
+        elapsed = time.perf_counter() - started
+
+        names = dict(DonationCenter.objects.values_list('id', 'name'))
+        for move in moves:
+            self.stdout.write(
+                f"{move['units']:>6}ml {move['bloodgroup']:<3} {names[move['source_id']]} -> "
+                f"{names[move['dest_id']]} ({move['distance_km']} km, {move['reason']})"
+            )
+        self.stdout.write(
+            f"{len(moves)} transfer(s) across {summary['centers']} center(s) in {elapsed:.2f}s. "
+            f"Shortage {summary['shortage_ml']}ml -> {summary['shortage_after_ml']}ml; "
+            f"{summary['expiring_rescued_ml']}/{summary['expiring_ml']}ml of expiring stock rescued."
+        )
+
+        if options['create_drafts']:
+            created, skipped = create_draft_requests(moves, options['bloodgroups'] or BLOOD_GROUPS)
+            self.stdout.write(self.style.SUCCESS(f"Created {len(created)} draft nurse blood request(s)."))
+            if skipped:
+                self.stdout.write(self.style.WARNING(
+                    f"{len(skipped)} transfer(s) skipped: receiving center has no nurse."
+                ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from blood.models import Stock
+from blood.utils.stock_utils import refresh_stock_aggregates
+
+
+class Command(BaseCommand):
+    help = "Rebuild Stock aggregates from StockUnit batches (repair job)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--center', type=int, action='append', dest='centers',
+            help="Only rebuild this donation center id (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        pairs = None
+        if options['centers']:
+            blood_groups = [bg for bg, _ in Stock.BLOOD_GROUP_CHOICES]
+            pairs = [(center_id, bg) for center_id in options['centers'] for bg in blood_groups]
+
+        written = refresh_stock_aggregates(pairs)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stock aggregates: {written} row(s) changed."))
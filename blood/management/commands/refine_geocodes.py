@@ -0,0 +1,70 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from blood.models import GeocodeCache
+from blood.utils.reverse_geocoder import CACHE_KEY_SCALE, NOMINATIM_TIMEOUT, cell_bounds, nominatim_reverse
+from donor.models import Donor
+from patient.models import Patient
+
+LOCATION_MODELS = (Donor, Patient)
+
+
+class Command(BaseCommand):
+    help = (
+        "Refine gazetteer place names in the geocode cache with Nominatim, oldest "
+        "cells first, and update donors/patients still showing the gazetteer name. "
+        "Optional; meant to run periodically in the background."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help="Cells to refine in this run.")
+        # Nominatim's usage policy allows at most one request per second
+        parser.add_argument('--delay', type=float, default=1.0, help="Seconds between requests.")
+        parser.add_argument('--timeout', type=float, default=NOMINATIM_TIMEOUT)
+
+    def handle(self, *args, **options):
+        pending = list(
+            GeocodeCache.objects.filter(refined_at__isnull=True).order_by('created_at')[:options['limit']]
+        )
+        refined = failed = 0
+        for i, entry in enumerate(pending):
+            if i:
+                time.sleep(options['delay'])
+            lat, lng = entry.lat_key / CACHE_KEY_SCALE, entry.lng_key / CACHE_KEY_SCALE
+            try:
+                name = nominatim_reverse(lat, lng, timeout=options['timeout'])
+            except (requests.RequestException, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"({lat:.2f}, {lng:.2f}): {e}")
+                continue
+
+            previous = entry.name
+            with transaction.atomic():
+                if name:
+                    entry.name = name[:255]
+                    entry.source = 'nominatim'
+                entry.refined_at = timezone.now()
+                entry.save(update_fields=['name', 'source', 'refined_at'])
+                if name and entry.name != previous:
+                    self._propagate(entry, previous)
+            refined += 1
+
+        self.stdout.write(f"Refined {refined} of {len(pending)} cells ({failed} failed)")
+
+    def _propagate(self, entry, previous):
+        """Rename rows in the cell whose location_name is still the gazetteer's (or missing)."""
+        min_lat, max_lat, min_lng, max_lng = cell_bounds(entry.lat_key, entry.lng_key)
+        unchanged = Q(location_name__isnull=True) | Q(location_name='')
+        if previous:
+            unchanged |= Q(location_name=previous)
+        for model in LOCATION_MODELS:
+            model.objects.filter(
+                unchanged,
+                latitude__gte=min_lat, latitude__lt=max_lat,
+                longitude__gte=min_lng, longitude__lt=max_lng,
+            ).update(location_name=entry.name)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blood.utils.reservations import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Release stock holds that have expired or sit on expired/empty batches (run hourly)."
+
+    def handle(self, *args, **options):
+        released = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} stale stock hold(s)."))
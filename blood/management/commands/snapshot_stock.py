@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blood.utils.stock_history import take_stock_snapshot
+
+
+class Command(BaseCommand):
+    help = "Record today's stock level per center and blood group (run nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Snapshot date as YYYY-MM-DD (defaults to today).")
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date '{options['date']}'. Use YYYY-MM-DD.")
+
+        written = take_stock_snapshot(day)
+        self.stdout.write(self.style.SUCCESS(f"Stored {written} stock snapshot row(s)."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from blood.utils.stock_utils import EXPIRY_SWEEP_CHUNK_SIZE, sweep_expired_stock
+
+
+class Command(BaseCommand):
+    help = "Write off expired stock batches and refresh the affected Stock aggregates (run daily)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=EXPIRY_SWEEP_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Report what would expire without writing.")
+
+    def handle(self, *args, **options):
+        summary = sweep_expired_stock(chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        prefix = "Would expire" if options['dry_run'] else "Expired"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {summary['batches']} batch(es), {summary['units']} ml; "
+            f"{summary['aggregates']} stock aggregate(s) refreshed."
+        ))
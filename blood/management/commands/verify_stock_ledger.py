@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blood.utils.ledger import backfill_opening_entries, verify_stock_ledger
+
+
+class Command(BaseCommand):
+    help = "Replay the stock ledger and check it against StockUnit balances and Stock aggregates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help="Reset balances from the ledger on mismatch.")
+        parser.add_argument(
+            '--backfill-opening', action='store_true',
+            help="First give pre-ledger batches an opening entry matching their current balance.",
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill_opening']:
+            written = backfill_opening_entries()
+            self.stdout.write(f"Wrote {written} opening ledger entr{'y' if written == 1 else 'ies'}.")
+
+        report = verify_stock_ledger(repair=options['repair'])
+        for m in report['batches'][:20]:
+            self.stdout.write(
+                f"StockUnit {m['stockunit_id']}: unit {m['unit']} vs ledger {m['ledger_balance']}, "
+                f"received {m['received']} vs ledger {m['ledger_received']}"
+            )
+        for m in report['aggregates'][:20]:
+            self.stdout.write(
+                f"Stock center={m['center_id']} {m['bloodgroup']}: {m['unit']} vs ledger {m['ledger_balance']}"
+            )
+        if report['unledgered']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(report['unledgered'])} batch(es) have no ledger entries; run with --backfill-opening."
+            ))
+
+        problems = len(report['batches']) + len(report['aggregates'])
+        if not problems:
+            self.stdout.write(self.style.SUCCESS("Stock ledger and balances agree."))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {problems} mismatch(es) from the ledger."))
+        else:
+            raise CommandError(f"{problems} mismatch(es) between the ledger and stored balances.")
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.23 on 2026-10-18 04:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0015_stocktransaction_donor_blood_request_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarcodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+                ('center', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='barcode_sequence', to='blood.donationcenter')),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.23 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0016_barcodesequence'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='stocktransaction',
+            name='quantity_matches_transaction_type',
+        ),
+        migrations.AlterField(
+            model_name='stocktransaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('deduction', 'Deduction'), ('addition', 'Addition'), ('expiry', 'Expiry')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='stockunit',
+            index=models.Index(fields=['center', 'bloodgroup', 'expiry_date'], name='stockunit_fifo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockunit',
+            index=models.Index(condition=models.Q(('unit__gt', 0)), fields=['expiry_date'], name='stockunit_live_expiry_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocktransaction',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('quantity_added__isnull', False), ('quantity_deducted__isnull', True), ('transaction_type', 'addition')), models.Q(('quantity_added__isnull', True), ('quantity_deducted__isnull', False), ('transaction_type__in', ['deduction', 'expiry'])), _connector='OR'), name='quantity_matches_transaction_type'),
+        ),
+    ]
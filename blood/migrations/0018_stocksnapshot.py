@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-18 04:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0017_stockunit_indexes_expiry_transactions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bloodgroup', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('batches', models.PositiveIntegerField(default=0)),
+                ('center', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='blood.donationcenter')),
+            ],
+            options={
+                'ordering': ['date', 'center', 'bloodgroup'],
+                'unique_together': {('date', 'center', 'bloodgroup')},
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.23 on 2026-10-18 04:59
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_received(apps, schema_editor):
+    """Received = current balance + everything already taken out of the batch."""
+    StockUnit = apps.get_model('blood', 'StockUnit')
+    StockTransaction = apps.get_model('blood', 'StockTransaction')
+    taken_out = (
+        StockTransaction.objects.filter(stockunit=OuterRef('pk'), quantity_deducted__isnull=False)
+        .values('stockunit')
+        .annotate(total=Sum('quantity_deducted'))
+        .values('total')
+    )
+    StockUnit.objects.update(received=F('unit') + Coalesce(Subquery(taken_out), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0018_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='stocktransaction',
+            name='quantity_matches_transaction_type',
+        ),
+        migrations.AddField(
+            model_name='stockunit',
+            name='received',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_received, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='stocktransaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('deduction', 'Deduction'), ('addition', 'Addition'), ('expiry', 'Expiry'), ('transfer_in', 'Transfer In'), ('transfer_out', 'Transfer Out')], max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='stocktransaction',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('quantity_added__isnull', False), ('quantity_deducted__isnull', True), ('transaction_type__in', ['addition', 'transfer_in'])), models.Q(('quantity_added__isnull', True), ('quantity_deducted__isnull', False), ('transaction_type__in', ['deduction', 'expiry', 'transfer_out'])), _connector='OR'), name='quantity_matches_transaction_type'),
+        ),
+    ]
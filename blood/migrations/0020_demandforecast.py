@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0019_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bloodgroup', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('computed_on', models.DateField()),
+                ('daily_demand', models.FloatField(default=0)),
+                ('horizon_demand', models.PositiveIntegerField(default=0)),
+                ('on_hand', models.PositiveIntegerField(default=0)),
+                ('days_of_cover', models.FloatField(blank=True, null=True)),
+                ('center', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='demand_forecasts', to='blood.donationcenter')),
+            ],
+            options={
+                'ordering': ['days_of_cover'],
+                'unique_together': {('center', 'bloodgroup')},
+            },
+        ),
+    ]
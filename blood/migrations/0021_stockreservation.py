@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0020_demandforecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('units', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('blood_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='blood.bloodrequest')),
+                ('donor_blood_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='blood.donorbloodrequest')),
+                ('stockunit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='blood.stockunit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('blood_request__isnull', False), ('donor_blood_request__isnull', True)), models.Q(('blood_request__isnull', True), ('donor_blood_request__isnull', False)), _connector='OR'), name='reservation_has_one_request'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0021_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockreservation',
+            name='expires_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['stockunit', 'expires_at'], name='reservation_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ),
+    ]
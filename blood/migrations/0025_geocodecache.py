@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0022_stockreservation_expires_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lat_key', models.IntegerField()),
+                ('lng_key', models.IntegerField()),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('source', models.CharField(choices=[('gazetteer', 'Gazetteer'), ('nominatim', 'Nominatim')], default='gazetteer', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('refined_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refined_at', 'created_at'], name='geocode_pending_idx')],
+                'unique_together': {('lat_key', 'lng_key')},
+            },
+        ),
+    ]
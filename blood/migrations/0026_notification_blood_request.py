@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0025_geocodecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='blood_request',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='blood.bloodrequest'),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('action', 'emergency')), fields=('blood_request', 'recipient_content_type', 'recipient_object_id'), name='notification_emergency_once'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0026_notification_blood_request'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient_content_type', 'recipient_object_id', '-created_at'], name='notification_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['recipient_content_type', 'recipient_object_id', '-created_at'], name='notification_unread_idx'),
+        ),
+    ]
@@ -3,11 +3,7 @@ from django.contrib.contenttypes.fields import GenericRelation, GenericForeignKe
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-import uuid
 from nurse.models import Appointment
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from django.db.models import Sum
 from django.conf import settings
 
 # ------------------------
@@ -58,12 +54,38 @@ class StockUnit(models.Model):
     BLOOD_GROUP_CHOICES = Stock.BLOOD_GROUP_CHOICES
 
     bloodgroup = models.CharField(max_length=3, choices=BLOOD_GROUP_CHOICES)
-    unit = models.PositiveIntegerField(default=0)
+    unit = models.PositiveIntegerField(default=0)  # current balance in ml
+    received = models.PositiveIntegerField(default=0)  # total ml ever booked into this batch
     center = models.ForeignKey('blood.DonationCenter', on_delete=models.CASCADE)
     expiry_date = models.DateField()
     barcode = models.CharField(max_length=100, unique=True, blank=True, null=True)
     added_on = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # FIFO lookups: center + bloodgroup ordered by expiry
+            models.Index(fields=['center', 'bloodgroup', 'expiry_date'], name='stockunit_fifo_idx'),
+            # Expiry sweeps only ever look at batches that still hold blood
+            models.Index(fields=['expiry_date'], condition=models.Q(unit__gt=0), name='stockunit_live_expiry_idx'),
+        ]
+
+    STATE_FIELDS = ('center_id', 'bloodgroup', 'unit', 'expiry_date')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted state so the aggregate signal can apply a delta
+        instance._loaded_state = instance.stock_state()
+        return instance
+
+    def stock_state(self):
+        """
+        Return (center_id, bloodgroup, unit, expiry_date) as last seen by this
+        instance, with DEFERRED for fields that were never loaded. Reads
+        __dict__ so a deferred field is not fetched (which would call from_db again).
+        """
+        return tuple(self.__dict__.get(field, models.DEFERRED) for field in self.STATE_FIELDS)
+
     def clean(self):
         # Allow zero units, disallow negative
         if self.unit < 0:
@@ -72,12 +94,8 @@ class StockUnit(models.Model):
             raise ValidationError("Expiry date cannot be in the past.")
 
     def generate_unique_barcode(self):
-        for _ in range(10):
-            candidate = f"STK-{uuid.uuid4().hex[:10].upper()}"
-            if not StockUnit.objects.filter(barcode=candidate).exists():
-                self.barcode = candidate
-                return
-        raise ValidationError("Failed to generate a unique barcode for StockUnit after several attempts.")
+        from blood.utils.barcodes import allocate_barcode
+        self.barcode = allocate_barcode(self.center_id)
 
     def save(self, *args, **kwargs):
         self.clean()
@@ -88,28 +106,60 @@ class StockUnit(models.Model):
     def __str__(self):
         return f"{self.bloodgroup} - {self.unit}ml at {self.center.name} (Expires: {self.expiry_date})"
 
-# Signal to update Stock aggregate whenever StockUnit changes
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-
-@receiver(post_save, sender=StockUnit)
-@receiver(post_delete, sender=StockUnit)
-def update_stock_aggregate(sender, instance, **kwargs):
-    total_units = StockUnit.objects.filter(
-        center=instance.center,
-        bloodgroup=instance.bloodgroup,
-        expiry_date__gte=timezone.now().date()
-    ).aggregate(total=Sum('unit'))['total'] or 0
-
-    stock, created = Stock.objects.get_or_create(
-        center=instance.center,
-        bloodgroup=instance.bloodgroup,
-        defaults={'unit': total_units}
-    )
-    if not created:
-        stock.unit = total_units
-        stock.save()
-        
+
+# ------------------------
+# Stock Snapshot Model
+# ------------------------
+class StockSnapshot(models.Model):
+    """Nightly copy of Stock levels, one row per (date, center, bloodgroup)."""
+    date = models.DateField()
+    center = models.ForeignKey('blood.DonationCenter', on_delete=models.CASCADE, related_name='stock_snapshots')
+    bloodgroup = models.CharField(max_length=3, choices=Stock.BLOOD_GROUP_CHOICES)
+    units = models.PositiveIntegerField(default=0)  # ml available (non-expired) at snapshot time
+    batches = models.PositiveIntegerField(default=0)  # number of non-empty batches
+
+    class Meta:
+        # The unique index leads with date so history ranges are a single index scan
+        unique_together = ('date', 'center', 'bloodgroup')
+        ordering = ['date', 'center', 'bloodgroup']
+
+    def __str__(self):
+        return f"{self.date} {self.bloodgroup} - {self.units}ml at {self.center.name}"
+
+
+# ------------------------
+# Barcode Sequence Model
+# ------------------------
+class BarcodeSequence(models.Model):
+    """Per-center counter backing collision-free StockUnit barcodes."""
+    center = models.OneToOneField('blood.DonationCenter', on_delete=models.CASCADE, related_name='barcode_sequence')
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"Barcode sequence for {self.center.name} (next: {self.next_value})"
+
+
+# ------------------------
+# Demand Forecast Model
+# ------------------------
+class DemandForecast(models.Model):
+    """Latest nightly demand forecast, one row per (center, bloodgroup)."""
+    center = models.ForeignKey('blood.DonationCenter', on_delete=models.CASCADE, related_name='demand_forecasts')
+    bloodgroup = models.CharField(max_length=3, choices=Stock.BLOOD_GROUP_CHOICES)
+    computed_on = models.DateField()
+    daily_demand = models.FloatField(default=0)  # smoothed ml/day, before weekday adjustment
+    horizon_demand = models.PositiveIntegerField(default=0)  # ml expected over the forecast horizon
+    on_hand = models.PositiveIntegerField(default=0)  # ml in stock when the forecast was made
+    days_of_cover = models.FloatField(null=True, blank=True)  # None: stock outlasts the horizon
+
+    class Meta:
+        unique_together = ('center', 'bloodgroup')
+        ordering = ['days_of_cover']
+
+    def __str__(self):
+        cover = f"{self.days_of_cover:.1f} days" if self.days_of_cover is not None else "beyond horizon"
+        return f"{self.bloodgroup} at {self.center.name}: {cover} of cover"
+
 
 # ------------------------
 # Blood Request Model
@@ -283,6 +333,40 @@ class Notification(models.Model):
     appointment_date = models.DateTimeField(blank=True, null=True)
     bloodgroup = models.CharField(max_length=10, blank=True, null=True)
     unit = models.PositiveIntegerField(blank=True, null=True)
+    # Request an emergency page is about; see blood.utils.mobilisation
+    blood_request = models.ForeignKey(
+        'blood.BloodRequest', on_delete=models.CASCADE, null=True, blank=True, related_name='notifications'
+    )
+
+    class Meta:
+        indexes = [
+            # Inbox listing: one recipient's notifications, newest first (blood.utils.notifications.inbox_for)
+            models.Index(
+                fields=['recipient_content_type', 'recipient_object_id', '-created_at'],
+                name='notification_inbox_idx',
+            ),
+            # Unread counts and listings only touch the (small) unread part of an inbox
+            models.Index(
+                fields=['recipient_content_type', 'recipient_object_id', '-created_at'],
+                condition=models.Q(read=False),
+                name='notification_unread_idx',
+            ),
+        ]
+        constraints = [
+            # A donor is paged at most once per emergency request
+            models.UniqueConstraint(
+                fields=['blood_request', 'recipient_content_type', 'recipient_object_id'],
+                condition=models.Q(action='emergency'),
+                name='notification_emergency_once',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted read flag so the unread counter signal can apply a delta
+        instance._loaded_read = instance.__dict__.get('read')
+        return instance
 
     def __str__(self):
         if self.recipient:
@@ -293,7 +377,13 @@ class StockTransaction(models.Model):
     TRANSACTION_CHOICES = [
         ('deduction', 'Deduction'),
         ('addition', 'Addition'),
+        ('expiry', 'Expiry'),
+        ('transfer_in', 'Transfer In'),
+        ('transfer_out', 'Transfer Out'),
     ]
+    # Ledger directions: incoming entries use quantity_added, outgoing ones quantity_deducted
+    INCOMING_TYPES = ('addition', 'transfer_in')
+    OUTGOING_TYPES = ('deduction', 'expiry', 'transfer_out')
     
     stockunit = models.ForeignKey('StockUnit', on_delete=models.CASCADE)
     blood_request = models.ForeignKey('BloodRequest', on_delete=models.CASCADE, null=True, blank=True)
@@ -321,8 +411,8 @@ class StockTransaction(models.Model):
         constraints = [
             models.CheckConstraint(
                 check=(
-                    models.Q(transaction_type='addition', quantity_added__isnull=False, quantity_deducted__isnull=True) |
-                    models.Q(transaction_type='deduction', quantity_deducted__isnull=False, quantity_added__isnull=True)
+                    models.Q(transaction_type__in=['addition', 'transfer_in'], quantity_added__isnull=False, quantity_deducted__isnull=True) |
+                    models.Q(transaction_type__in=['deduction', 'expiry', 'transfer_out'], quantity_deducted__isnull=False, quantity_added__isnull=True)
                 ),
                 name='quantity_matches_transaction_type'
             )
@@ -330,29 +420,41 @@ class StockTransaction(models.Model):
 
     def clean(self):
         """Validate that quantity fields match transaction type"""
-        if self.transaction_type == 'addition':
+        if self.transaction_type in self.INCOMING_TYPES:
             if not self.quantity_added or self.quantity_deducted:
-                raise ValidationError("Addition transactions must have quantity_added and not quantity_deducted")
-        elif self.transaction_type == 'deduction':
+                raise ValidationError(f"{self.get_transaction_type_display()} transactions must have quantity_added and not quantity_deducted")
+        elif self.transaction_type in self.OUTGOING_TYPES:
             if not self.quantity_deducted or self.quantity_added:
-                raise ValidationError("Deduction transactions must have quantity_deducted and not quantity_added")
+                raise ValidationError(f"{self.get_transaction_type_display()} transactions must have quantity_deducted and not quantity_added")
 
     def save(self, *args, **kwargs):
+        # The stock ledger is append-only: corrections are new entries, never edits
+        if not self._state.adding:
+            raise ValidationError("Stock transactions are append-only and cannot be modified.")
         self.clean()
         super().save(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Stock transactions are append-only and cannot be deleted.")
+
     def __str__(self):
         if self.transaction_type == 'deduction':
             return f"Deducted {self.quantity_deducted}ml from {self.stockunit.barcode} for appointment {self.appointment_id}"
         elif self.transaction_type == 'addition':
             return f"Added {self.quantity_added}ml to {self.stockunit.barcode} from donation appointment {self.appointment_id}"
+        elif self.transaction_type == 'expiry':
+            return f"Expired {self.quantity_deducted}ml from {self.stockunit.barcode}"
+        elif self.transaction_type == 'transfer_in':
+            return f"Transferred {self.quantity_added}ml into {self.stockunit.barcode}"
+        elif self.transaction_type == 'transfer_out':
+            return f"Transferred {self.quantity_deducted}ml out of {self.stockunit.barcode}"
         else:
             return f"Stock transaction on {self.stockunit.barcode} @ {self.transaction_at}"
 
     @property
     def quantity(self):
         """Return the relevant quantity based on transaction type"""
-        return self.quantity_added if self.transaction_type == 'addition' else self.quantity_deducted
+        return self.quantity_added if self.transaction_type in self.INCOMING_TYPES else self.quantity_deducted
 
     @property
     def related_request(self):
@@ -455,4 +557,70 @@ class DonorBloodRequest(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"Request by Donor {self.request_by_donor.user.username} for Patient {self.patient_name} ({self.bloodgroup})"
\ No newline at end of file
+        return f"Request by Donor {self.request_by_donor.user.username} for Patient {self.patient_name} ({self.bloodgroup})"
+
+# ------------------------
+# Stock Reservation Model
+# ------------------------
+class StockReservation(models.Model):
+    """ml of a batch held for an approved request until its appointment is completed or the hold expires."""
+    stockunit = models.ForeignKey('StockUnit', on_delete=models.CASCADE, related_name='reservations')
+    blood_request = models.ForeignKey('BloodRequest', on_delete=models.CASCADE, null=True, blank=True,
+                                      related_name='reservations')
+    donor_blood_request = models.ForeignKey('DonorBloodRequest', on_delete=models.CASCADE, null=True, blank=True,
+                                            related_name='reservations')
+    units = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()  # stale holds are released by the sweeper after this
+
+    class Meta:
+        indexes = [
+            # Held ml per batch only ever sums holds that are still active
+            models.Index(fields=['stockunit', 'expires_at'], name='reservation_active_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=(
+                    models.Q(blood_request__isnull=False, donor_blood_request__isnull=True) |
+                    models.Q(blood_request__isnull=True, donor_blood_request__isnull=False)
+                ),
+                name='reservation_has_one_request'
+            )
+        ]
+
+    @property
+    def related_request(self):
+        return self.blood_request or self.donor_blood_request
+
+    def __str__(self):
+        return f"{self.units}ml of {self.stockunit.barcode} reserved for {self.related_request}"
+
+
+# ------------------------
+# Geocode Cache Model
+# ------------------------
+class GeocodeCache(models.Model):
+    """
+    Place name for one rounded-coordinate cell (see blood.utils.reverse_geocoder).
+    Rows start with the gazetteer name and are refined by the refine_geocodes command.
+    """
+    SOURCE_CHOICES = [
+        ('gazetteer', 'Gazetteer'),
+        ('nominatim', 'Nominatim'),
+    ]
+    lat_key = models.IntegerField()  # latitude in hundredths of a degree, rounded
+    lng_key = models.IntegerField()  # longitude in hundredths of a degree, rounded
+    name = models.CharField(max_length=255, blank=True, default='')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='gazetteer')
+    created_at = models.DateTimeField(auto_now_add=True)
+    refined_at = models.DateTimeField(null=True, blank=True)  # None until refinement has run
+
+    class Meta:
+        unique_together = ('lat_key', 'lng_key')
+        indexes = [
+            models.Index(fields=['refined_at', 'created_at'], name='geocode_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"({self.lat_key / 100:.2f}, {self.lng_key / 100:.2f}) {self.name or '-'} [{self.source}]"
@@ -1,34 +1,173 @@
+import logging
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import DEFERRED
+from django.db.models.expressions import Combinable
 from django.db.models.signals import post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.utils import timezone
-from django.db.models import Sum
 
-from blood.models import Stock, StockUnit
+from blood.models import BloodRequest, DonationCenter, Notification, StockUnit
+from blood.utils.blood_compatibility import BLOOD_GROUPS
+from blood.utils.coordinate_snapshot import donor_snapshot, patient_snapshot
+from blood.utils.mobilisation import mobilise_donors
+from blood.utils.notifications import (
+    adjust_unread_count, invalidate_admin_counts, invalidate_unread_counts, user_role_key,
+)
+from blood.utils.spatial_index import center_index
+from blood.utils.stock_utils import apply_stock_deltas, counted_units, refresh_stock_aggregates
+from donor.models import BloodDonate, Donor, DonorEligibility
+from nurse.models import Nurse
+from patient.models import Patient
+
+logger = logging.getLogger(__name__)
+
+
+def _stock_contribution(state, today):
+    center_id, bloodgroup, unit, expiry_date = state
+    return (center_id, bloodgroup), counted_units(unit, expiry_date, today)
+
+
+def _affected_pairs(*states):
+    """
+    (center_id, bloodgroup) aggregates a partially loaded batch may touch,
+    or None (every aggregate) when a state's center was never loaded.
+    """
+    pairs = set()
+    for state in filter(None, states):
+        center_id, bloodgroup = state[:2]
+        if center_id is DEFERRED:
+            return None
+        groups = BLOOD_GROUPS if bloodgroup is DEFERRED else [bloodgroup]
+        pairs.update((center_id, bg) for bg in groups)
+    return pairs
 
 
 @receiver(post_save, sender=StockUnit)
 @receiver(post_delete, sender=StockUnit)
 def update_stock_aggregate(sender, instance, **kwargs):
     """
-    Signal handler to update the aggregated Stock record whenever
-    a StockUnit is saved or deleted.
+    Signal handler that keeps the aggregated Stock record in step with
+    StockUnit writes.
 
-    It sums all non-expired StockUnit units for a given center and bloodgroup,
-    then updates or creates the Stock aggregate.
+    Instead of re-summing every batch for the center and bloodgroup, it
+    compares the batch's previous state with its new one and applies the
+    signed difference to Stock with an F() update. Batches loaded with
+    deferred fields have no known previous state, so their aggregates are
+    recounted instead.
     """
-    total_units = StockUnit.objects.filter(
-        center=instance.center,
-        bloodgroup=instance.bloodgroup,
-        expiry_date__gte=timezone.now().date()
-    ).aggregate(total=Sum('unit'))['total'] or 0
+    if isinstance(instance.__dict__.get('unit'), Combinable):
+        # Saved with an F() expression; read back the real value
+        instance.refresh_from_db(fields=['unit'])
+
+    today = timezone.now().date()
+    deltas = defaultdict(int)
+
+    deleted = kwargs.get('signal') is post_delete
+    previous = getattr(instance, '_loaded_state', None)
+    current = instance.stock_state()
+    instance._loaded_state = None if deleted else current
+
+    if DEFERRED in (previous or ()) or DEFERRED in current:
+        refresh_stock_aggregates(_affected_pairs(previous, current))
+        return
+
+    if deleted:
+        key, units = _stock_contribution(previous or current, today)
+        deltas[key] -= units
+    else:
+        if previous is not None:
+            key, units = _stock_contribution(previous, today)
+            deltas[key] -= units
+        key, units = _stock_contribution(current, today)
+        deltas[key] += units
+
+    apply_stock_deltas(deltas)
+
+
+@receiver(post_save, sender=Donor)
+@receiver(post_delete, sender=Donor)
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=DonorEligibility)
+@receiver(post_delete, sender=DonorEligibility)
+@receiver(post_save, sender=DonationCenter)
+@receiver(post_delete, sender=DonationCenter)
+def invalidate_coordinate_snapshot(sender, instance, **kwargs):
+    """
+    Mark the changed donor/patient/center in the coordinate snapshots once
+    the write commits, so workers never reload a row before it is visible.
+    """
+    if sender is Patient:
+        snapshot, pk = patient_snapshot, instance.pk
+    elif sender is DonationCenter:
+        snapshot, pk = center_index, instance.pk
+    else:
+        snapshot, pk = donor_snapshot, instance.donor_id if sender is DonorEligibility else instance.pk
+    transaction.on_commit(lambda: snapshot.mark_changed(pk))
+
+
+@receiver(post_save, sender=BloodRequest)
+def mobilise_for_emergency(sender, instance, created, **kwargs):
+    """Page nearby donors for a new emergency request once it is committed."""
+    if created and instance.urgency_level == 'Emergency':
+        transaction.on_commit(lambda: _mobilise(instance))
+
+
+def _mobilise(blood_request):
+    # Runs after the request is saved; a paging failure must not turn the patient's submission into an error
+    try:
+        paged = mobilise_donors(blood_request)
+    except Exception:
+        logger.exception(f"Emergency mobilisation failed for blood request {blood_request.pk}")
+        return
+    logger.info(f"Paged {paged} donors for emergency blood request {blood_request.pk}")
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def update_unread_counter(sender, instance, created=False, **kwargs):
+    """
+    Keep the recipient's cached unread count in step: +1 for a new unread
+    notification, -1 when one is marked read or deleted. Applied after commit,
+    like the snapshot invalidation above.
+    """
+    content_type_id, object_id = instance.recipient_content_type_id, instance.recipient_object_id
+    previous = getattr(instance, '_loaded_read', None)
+    instance._loaded_read = instance.read
+    if kwargs.get('signal') is post_delete:
+        delta = -1 if previous is False or (previous is None and not instance.read) else 0
+    elif created:
+        delta = 0 if instance.read else 1
+    elif previous is None:
+        # Saved without being loaded first: the old state is unknown, so recount on next read
+        transaction.on_commit(lambda: invalidate_unread_counts(content_type_id, [object_id]))
+        return
+    else:
+        delta = int(not instance.read) - int(not previous)
+    if delta:
+        transaction.on_commit(lambda: adjust_unread_count(content_type_id, object_id, delta))
+
+
+@receiver(post_save, sender=BloodRequest)
+@receiver(post_delete, sender=BloodRequest)
+@receiver(post_save, sender=BloodDonate)
+@receiver(post_delete, sender=BloodDonate)
+def refresh_admin_counts(sender, instance, **kwargs):
+    """New or changed requests/donations change the admin badges; recount them on next read."""
+    transaction.on_commit(invalidate_admin_counts)
 
-    stock, created = Stock.objects.get_or_create(
-        center=instance.center,
-        bloodgroup=instance.bloodgroup,
-        defaults={'unit': total_units}
-    )
 
-    # Update only if the unit count has changed to avoid unnecessary saves
-    if not created and stock.unit != total_units:
-        stock.unit = total_units
-        stock.save()
+@receiver(post_save, sender=Donor)
+@receiver(post_delete, sender=Donor)
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=Nurse)
+@receiver(post_delete, sender=Nurse)
+def forget_user_role(sender, instance, **kwargs):
+    """A profile was added, moved or removed; work out the user's role again on their next page."""
+    if instance.user_id is not None:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: cache.delete(user_role_key(user_id)))
@@ -1,3 +1,397 @@
-from django.test import TestCase
+import random
+import threading
+from datetime import timedelta
+from unittest import mock
 
+import numpy as np
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
 
+from blood.models import (
+    BarcodeSequence, BloodRequest, DonationCenter, Notification, Stock, StockSnapshot, StockTransaction, StockUnit,
+)
+from blood.utils.barcodes import allocate_barcodes, is_valid_barcode
+from blood.utils.blood_compatibility import compatible_supply
+from blood.utils.coordinate_snapshot import DonorSnapshot, donor_snapshot
+from blood.utils.forecasting import build_demand_matrix, days_of_cover
+from blood.utils.mobilisation import EMERGENCY_ACTION, mobilise_donors
+from blood.utils.notifications import (
+    ADMIN_COUNTS_KEY, RECIPIENT_MODELS, inbox_for, unread_count_key, user_role_key,
+)
+from blood.utils.rebalancing import create_draft_requests
+from blood.utils.reservations import deduct_for_request, hold_stock
+from blood.utils.stock_history import get_stock_history, take_stock_snapshot
+from donor.models import Donor, DonorEligibility
+from nurse.models import Nurse, NurseBloodRequest
+from patient.models import Patient
+
+
+def make_center(name='Central', city='Nairobi', **fields):
+    return DonationCenter.objects.create(
+        name=name, city=city, address=f"{name}, {city}", contact_number='0700000000', open_hours='8-5', **fields,
+    )
+
+
+def make_batch(center, bloodgroup='A+', unit=450, days=30):
+    return StockUnit.objects.create(
+        center=center, bloodgroup=bloodgroup, unit=unit, expiry_date=timezone.now().date() + timedelta(days=days),
+    )
+
+
+class StockAggregateTests(TestCase):
+    def setUp(self):
+        self.center = make_center()
+        self.batch = make_batch(self.center)
+
+    def stock(self, bloodgroup='A+'):
+        return Stock.objects.get(center=self.center, bloodgroup=bloodgroup).unit
+
+    def test_deferred_batches_save_without_recursing(self):
+        batch = StockUnit.objects.only('id').get(pk=self.batch.pk)
+        batch.unit = 300
+        batch.save()
+        self.assertEqual(self.stock(), 300)
+
+        batch = StockUnit.objects.defer('expiry_date').get(pk=self.batch.pk)
+        batch.bloodgroup = 'B+'
+        batch.save()
+        self.assertEqual((self.stock('A+'), self.stock('B+')), (0, 300))
+
+        batch.refresh_from_db(fields=['unit'])
+        self.assertEqual(batch.unit, 300)
+
+    def test_deleting_a_deferred_batch_removes_its_stock(self):
+        StockUnit.objects.only('id').get(pk=self.batch.pk).delete()
+        self.assertEqual(self.stock(), 0)
+
+
+class CompatibleSupplyTests(TestCase):
+    def test_no_centers_gives_an_empty_matrix(self):
+        self.assertEqual(compatible_supply([]).shape, (0, 8))
+        self.assertEqual(compatible_supply([[0] * 8]).shape, (1, 8))
+
+    def test_admin_blood_rows_cover_groups_without_own_stock(self):
+        make_batch(make_center(), bloodgroup='O-', unit=450)
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        [data] = self.client.get(reverse('admin-blood')).context['center_stock_map'].values()
+        rows = {bg: (units, compatible) for bg, units, compatible in data['rows']}
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows['AB+'], (0, 450))
+        self.assertEqual(rows['O-'], (450, 450))
+
+    def test_admin_blood_page_renders_without_stock(self):
+        admin = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get(reverse('admin-blood')).status_code, 200)
+
+
+class CoordinateSnapshotTests(TestCase):
+    def test_old_snapshots_reload_without_an_invalidation(self):
+        donor = Donor.objects.create(
+            user=User.objects.create_user('donor'), address='-', mobile='0733000000', bloodgroup='O-',
+            latitude=-1.29, longitude=36.82,
+        )
+        DonorEligibility.objects.create(donor=donor, approved=True)
+        snapshot = DonorSnapshot()
+        self.assertEqual(snapshot.search(-1.29, 36.82, 5)[0].tolist(), [donor.id])
+
+        # Moved by a write that sends no signal (or whose invalidation this worker never sees)
+        Donor.objects.filter(pk=donor.pk).update(latitude=0.52, longitude=35.27)
+        self.assertEqual(snapshot.search(0.52, 35.27, 5)[0].tolist(), [])
+        with mock.patch('blood.utils.coordinate_snapshot.SNAPSHOT_MAX_AGE', 0):
+            self.assertEqual(snapshot.search(0.52, 35.27, 5)[0].tolist(), [donor.id])
+
+
+class EmergencyMobilisationTests(TestCase):
+    def setUp(self):
+        self.center = make_center(latitude=-1.29, longitude=36.82)
+        self.donors = [
+            Donor.objects.create(user=User.objects.create_user(f'donor{i}'), address='-', mobile=f'07440000{i}')
+            for i in range(3)
+        ]
+        self.request = BloodRequest.objects.create(
+            request_by_patient=Patient.objects.create(mobile='0755000000'), patient_name='P', patient_age=30,
+            bloodgroup='O-', unit=450, donation_center=self.center, urgency_level='High',
+        )
+
+    def ranked(self, *donors):
+        ids = np.array([donor.id for donor in donors])
+        return ids, np.ones(len(ids)), np.zeros(len(ids))
+
+    def test_returns_only_the_pages_inserted(self):
+        with mock.patch('blood.utils.mobilisation.donor_snapshot') as snapshot:
+            snapshot.ranked.return_value = self.ranked(*self.donors[:2])
+            self.assertEqual(mobilise_donors(self.request), 2)
+            # A page that already exists (e.g. from a concurrent call) is dropped, not counted
+            snapshot.ranked.return_value = self.ranked(*self.donors[1:])
+            self.assertEqual(mobilise_donors(self.request), 1)
+        pages = Notification.objects.filter(blood_request=self.request, action=EMERGENCY_ACTION)
+        self.assertEqual(pages.count(), 3)
+
+
+@skipUnlessDBFeature('supports_partial_indexes', 'supports_explaining_query_execution')
+class NotificationInboxPlanTests(TestCase):
+    """The inbox and unread queries must be answered from their indexes, not a scan and sort."""
+    ROWS = 5000
+    RECIPIENTS = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        type_ids = [ContentType.objects.get_for_model(model).id for model in (Donor, Patient, Nurse)]
+        Notification.objects.bulk_create([
+            Notification(
+                title='Inbox', message='',
+                recipient_content_type_id=type_ids[i % 3],
+                recipient_object_id=1 + rng.randrange(cls.RECIPIENTS),
+                read=rng.random() >= 0.05,
+            )
+            for i in range(cls.ROWS)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Notification._meta.db_table}")
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # A test-sized table is cheap to scan; ask whether the index can serve the query at all
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        self.profile = Donor(pk=self.RECIPIENTS // 2)
+
+    def assertServedByIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        # Rows come out of the index already ordered by -created_at (SQLite / PostgreSQL wording)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_inbox_uses_inbox_index(self):
+        self.assertServedByIndex(inbox_for(self.profile)[:20], 'notification_inbox_idx')
+
+    def test_unread_uses_partial_unread_index(self):
+        self.assertServedByIndex(inbox_for(self.profile, unread_only=True)[:20], 'notification_unread_idx')
+
+
+class PatientViewTests(TestCase):
+    def test_nearby_donors_api_redirects_anonymous_users_to_patient_login(self):
+        response = self.client.get(reverse('nearby-eligible-donors-api'))
+        self.assertRedirects(response, f"{reverse('patientlogin')}?next={reverse('nearby-eligible-donors-api')}",
+                             fetch_redirect_response=False)
+
+    def test_more_link_keeps_the_page_size(self):
+        for i in range(3):
+            donor = Donor.objects.create(user=User.objects.create_user(f'near{i}'), address='-', mobile=f'07660000{i}',
+                                         bloodgroup='O-', latitude=-1.29 + i / 1000, longitude=36.82)
+            DonorEligibility.objects.create(donor=donor, approved=True)
+        # Signals only reach the snapshot on commit, which TestCase never does
+        donor_snapshot.mark_all_changed()
+        self.addCleanup(donor_snapshot.mark_all_changed)
+        user = User.objects.create_user('seeker')
+        Patient.objects.create(user=user, mobile='0766100000', bloodgroup='O-', latitude=-1.29, longitude=36.82)
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('nearby-eligible-donors'), {'limit': 1})
+        self.assertContains(response, f"?cursor={response.context['next_cursor']}&limit=1")
+        cursor = response.context['next_cursor']
+        response = self.client.get(reverse('nearby-eligible-donors'), {'limit': 1, 'cursor': cursor})
+        self.assertEqual(len(response.context['nearby_donors']), 1)
+        self.assertContains(response, f"{reverse('nearby-eligible-donors')}?limit=1")
+
+
+# Uses the configured cache, so any SQL the cache backend itself runs is counted too
+class NotificationBadgeQueryTests(TestCase):
+    def setUp(self):
+        ContentType.objects.get_for_models(Donor, Patient, Nurse)
+        donor_user = User.objects.create_user('badge-donor')
+        Donor.objects.create(user=donor_user, address='-', mobile='0700000001')
+        patient_user = User.objects.create_user('badge-patient')
+        Patient.objects.create(user=patient_user, mobile='0700000002')
+        nurse_user = User.objects.create_user('badge-nurse')
+        Nurse.objects.create(user=nurse_user, first_name='Badge', last_name='Nurse',
+                             registration_number='BADGE-1', specialization='Blood Bank Nurse')
+        admin_user = User.objects.create_superuser('badge-admin', password='x')
+        self.users = {'donor': donor_user, 'patient': patient_user, 'nurse': nurse_user, 'admin': admin_user}
+        # Start cold without flushing the whole (shared) cache
+        cache.delete_many([ADMIN_COUNTS_KEY] + [
+            key for user in self.users.values()
+            for key in [user_role_key(user.pk)] + [unread_count_key(user.pk, model) for model in RECIPIENT_MODELS]
+        ])
+
+    def make_request(self, user):
+        request = RequestFactory().get('/')
+        # A fresh user each time, as on a real request
+        request.user = user if isinstance(user, AnonymousUser) else User.objects.get(pk=user.pk)
+        return request
+
+    def assertRenderQueries(self, num, template, user):
+        request = self.make_request(user)
+        with self.assertNumQueries(num):
+            render_to_string(template, request=request)
+
+    def test_page_without_badges_runs_no_queries(self):
+        for user in [AnonymousUser(), *self.users.values()]:
+            with self.subTest(user=user):
+                self.assertRenderQueries(0, 'blood/learn_more.html', user)
+
+    def test_base_templates_cold_and_warm(self):
+        # Cold: role lookup and counts; warm: only the template's own profile lookup
+        for role, template, cold, warm in [
+            ('donor', 'donor/donorbase.html', 5, 1),
+            ('patient', 'patient/patientbase.html', 3, 1),
+            ('nurse', 'nurse/nursebase.html', 4, 1),
+            ('admin', 'blood/adminbase.html', 2, 0),
+        ]:
+            with self.subTest(role=role):
+                self.assertRenderQueries(cold, template, self.users[role])
+                self.assertRenderQueries(warm, template, self.users[role])
+
+
+class StockHistoryTests(TestCase):
+    def test_every_day_out_of_stock_counts_as_zero(self):
+        center = make_center()
+        batch = make_batch(center, unit=700)
+        start = timezone.now().date()
+        take_stock_snapshot(start)
+        batch.unit = 0
+        batch.save()
+        for offset in range(1, 7):
+            take_stock_snapshot(start + timedelta(days=offset))
+
+        daily = get_stock_history(start, start + timedelta(days=6), center_id=center.id)
+        self.assertEqual([units for _, units in daily[0]['points']], [700, 0, 0, 0, 0, 0, 0])
+
+        # Weekly/monthly points average these rows, so every zero day must be stored
+        self.assertEqual(StockSnapshot.objects.filter(center=center, bloodgroup='A+', units=0).count(), 6)
+
+class ForecastTests(TestCase):
+    def test_empty_stock_has_no_cover_even_without_demand(self):
+        cover = days_of_cover(np.array([0.0, 500.0]), np.zeros((2, 28)))
+        self.assertEqual(cover[0], 0)
+        self.assertTrue(np.isnan(cover[1]))
+
+    def test_request_and_its_later_deduction_count_once(self):
+        center = make_center()
+        batch = make_batch(center, unit=2000)
+        patient = Patient.objects.create(mobile='0711000000')
+        now = timezone.now()
+        request = BloodRequest.objects.create(
+            request_by_patient=patient, patient_name='P', patient_age=30,
+            bloodgroup='A+', unit=450, donation_center=center, status='completed',
+        )
+        BloodRequest.objects.filter(pk=request.pk).update(created_at=now - timedelta(days=3))
+        fulfilled = StockTransaction.objects.create(
+            stockunit=batch, blood_request=request, transaction_type='deduction', quantity_deducted=450,
+        )
+        walk_in = StockTransaction.objects.create(stockunit=batch, transaction_type='deduction', quantity_deducted=200)
+        StockTransaction.objects.filter(pk=fulfilled.pk).update(transaction_at=now - timedelta(days=2))
+        StockTransaction.objects.filter(pk=walk_in.pk).update(transaction_at=now - timedelta(days=1))
+
+        keys, _, matrix = build_demand_matrix(days=7, today=now.date())
+        self.assertEqual(keys, [(center.id, 'A+')])
+        self.assertEqual(matrix.sum(), 650)
+
+
+class RebalancingDraftTests(TestCase):
+    def test_replacing_drafts_keeps_other_groups(self):
+        source, dest = make_center(name='Source'), make_center(name='Dest')
+        nurse = Nurse.objects.create(
+            user=User.objects.create_user('nurse'), first_name='N', last_name='D', registration_number='RN-1',
+            specialization='Blood Bank Nurse', donation_center=dest,
+        )
+        for group in ('O-', 'A+'):
+            NurseBloodRequest.objects.create(
+                requester=nurse, supplying_center=source, blood_group=group, units=450,
+                status=NurseBloodRequest.STATUS_DRAFT,
+            )
+        move = {'bloodgroup': 'O-', 'source_id': source.id, 'dest_id': dest.id, 'units': 300,
+                'distance_km': 4.2, 'reason': 'surplus'}
+
+        created, skipped = create_draft_requests([move], ['O-'])
+
+        self.assertEqual((len(created), skipped), (1, []))
+        drafts = NurseBloodRequest.objects.filter(status=NurseBloodRequest.STATUS_DRAFT)
+        self.assertEqual(sorted(drafts.values_list('blood_group', 'units')), [('A+', 450), ('O-', 300)])
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.center = make_center()
+        self.a_pos = make_batch(self.center, 'A+', unit=450)
+        self.request = BloodRequest.objects.create(
+            request_by_patient=Patient.objects.create(mobile='0722000000'), patient_name='P', patient_age=30,
+            bloodgroup='A+', unit=450, donation_center=self.center, status='approved',
+        )
+        ok, _ = hold_stock(self.center, self.request)
+        self.assertTrue(ok)
+
+    def test_holds_are_not_used_after_the_group_changes(self):
+        o_neg = make_batch(self.center, 'O-', unit=450)
+        self.request.bloodgroup = 'O-'
+        self.request.save()
+
+        ok, deductions = deduct_for_request(self.center, self.request, allow_substitutes=True)
+
+        self.assertTrue(ok)
+        self.assertEqual([(d['stockunit_id'], d['bloodgroup']) for d in deductions], [(o_neg.id, 'O-')])
+        self.a_pos.refresh_from_db()
+        self.assertEqual(self.a_pos.unit, 450)
+        self.assertFalse(self.request.reservations.exists())
+
+    def test_incompatible_holds_fail_rather_than_issue(self):
+        self.request.bloodgroup = 'O-'
+        self.request.save()
+
+        ok, _ = deduct_for_request(self.center, self.request, allow_substitutes=True)
+
+        self.assertFalse(ok)
+        self.a_pos.refresh_from_db()
+        self.assertEqual(self.a_pos.unit, 450)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class BarcodeConcurrencyTests(TransactionTestCase):
+    """Concurrent allocations on one center must hand out every code exactly once."""
+    WORKERS = 8
+    ROUNDS = 25
+    BATCH = 10
+
+    def test_concurrent_allocations_are_unique_and_gapless(self):
+        center = make_center(name='Stress')
+        codes, failures = [], []
+        lock = threading.Lock()
+        start = threading.Barrier(self.WORKERS)
+
+        def worker():
+            try:
+                start.wait()
+                allocated = []
+                for _ in range(self.ROUNDS):
+                    allocated.extend(allocate_barcodes(center.id, self.BATCH))
+                with lock:
+                    codes.extend(allocated)
+            except Exception as e:
+                with lock:
+                    failures.append(e)
+            finally:
+                connection.close()  # each thread owns its own DB connection
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(failures, [])
+        total = self.WORKERS * self.ROUNDS * self.BATCH
+        self.assertEqual(len(codes), total)
+        self.assertEqual(len(set(codes)), total)
+        self.assertTrue(all(is_valid_barcode(code) for code in codes))
+        # Sequence values 1..total were each used once: no gaps, no overlap
+        self.assertEqual(sorted(int(code.split('-')[2]) for code in codes), list(range(1, total + 1)))
+        self.assertEqual(BarcodeSequence.objects.get(center=center).next_value, total + 1)
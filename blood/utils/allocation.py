@@ -0,0 +1,152 @@
+# blood/utils/allocation.py
+# Allocate a center's batches across all approved requests at once and hold them as reservations
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from blood.models import BloodRequest, DonationCenter, DonorBloodRequest, StockReservation, StockUnit
+from blood.utils.blood_compatibility import get_substitution_order
+from blood.utils.reservations import hold_expiry
+
+URGENCY_RANK = {'Emergency': 0, 'High': 1, 'Medium': 2, 'Low': 3}
+
+
+def solve_allocation(requests, batches, allow_substitutes=True):
+    """
+    Decide which batches serve which requests.
+
+    Requests are served most urgent first, then oldest first, so a small
+    routine request can no longer take the batch an emergency needed. Each
+    request draws from its own group before compatible substitutes, and
+    earliest-expiring batches first within a group so stock is used before
+    it expires. A request is either fully covered or gets nothing, so blood
+    is never held for a request that cannot be completed.
+
+    Args:
+        requests (list): dicts with key, bloodgroup, units, urgency, created_at.
+        batches (list): dicts with id, bloodgroup, unit, expiry_date.
+        allow_substitutes (bool): Serve from compatible groups when the exact one runs out.
+
+    Returns:
+        (allocations, unfilled): allocations maps request key to a list of
+        (batch_id, bloodgroup, ml); unfilled lists keys that could not be covered.
+    """
+    pools = defaultdict(list)
+    for batch in sorted(batches, key=lambda b: (b['expiry_date'], b['id'])):
+        if batch['unit'] > 0:
+            pools[batch['bloodgroup']].append([batch['id'], batch['unit']])
+    # Index of the first batch with blood left in each pool
+    heads = defaultdict(int)
+
+    allocations = {}
+    unfilled = []
+    ordered = sorted(requests, key=lambda r: (URGENCY_RANK.get(r['urgency'], len(URGENCY_RANK)), r['created_at']))
+    for req in ordered:
+        groups = get_substitution_order(req['bloodgroup']) if allow_substitutes else [req['bloodgroup']]
+        needed = req['units']
+        plan = []
+        for bloodgroup in groups:
+            pool = pools.get(bloodgroup, ())
+            position = heads[bloodgroup]
+            while needed > 0 and position < len(pool):
+                batch_id, left = pool[position]
+                take = min(left, needed)
+                plan.append((bloodgroup, position, batch_id, take))
+                needed -= take
+                if take == left:
+                    position += 1
+                else:
+                    break
+            if needed <= 0:
+                break
+
+        if needed > 0:
+            unfilled.append(req['key'])
+            continue
+
+        for bloodgroup, position, batch_id, take in plan:
+            pools[bloodgroup][position][1] -= take
+            if pools[bloodgroup][position][1] == 0:
+                heads[bloodgroup] = position + 1
+        allocations[req['key']] = [(batch_id, bloodgroup, take) for bloodgroup, _, batch_id, take in plan]
+
+    return allocations, unfilled
+
+
+def _approved_requests(center):
+    """Approved, not yet deducted requests at a center as solver input, plus a key -> request map."""
+    requests, by_key = [], {}
+    for model, kind in ((BloodRequest, 'blood_request'), (DonorBloodRequest, 'donor_blood_request')):
+        for obj in model.objects.filter(
+            donation_center=center, status='approved', stock_deducted=False,
+            bloodgroup__isnull=False, unit__gt=0,
+        ).exclude(bloodgroup='').prefetch_related('appointments'):
+            key = (kind, obj.id)
+            by_key[key] = obj
+            requests.append({
+                'key': key,
+                'bloodgroup': obj.bloodgroup,
+                'units': obj.unit,
+                'urgency': obj.urgency_level,
+                'created_at': obj.created_at,
+            })
+    return requests, by_key
+
+
+def allocate_center_stock(center, allow_substitutes=True):
+    """
+    Re-solve the allocation for every approved request at a center and store
+    the result as StockReservations, replacing the previous holds.
+
+    The center's live batches are locked while the plan is written so a
+    concurrent deduction cannot invalidate it.
+
+    Returns:
+        dict: requests, allocated, unfilled, substituted, reserved_ml.
+    """
+    today = timezone.now().date()
+    with transaction.atomic():
+        batches = list(
+            StockUnit.objects.select_for_update()
+            .filter(center=center, unit__gt=0, expiry_date__gte=today)
+            .values('id', 'bloodgroup', 'unit', 'expiry_date')
+        )
+        requests, by_key = _approved_requests(center)
+        allocations, unfilled = solve_allocation(requests, batches, allow_substitutes)
+
+        StockReservation.objects.filter(stockunit__center=center).delete()
+        reservations = []
+        substituted = 0
+        for key, plan in allocations.items():
+            kind, _ = key
+            if any(bloodgroup != by_key[key].bloodgroup for _, bloodgroup, _ in plan):
+                substituted += 1
+            expires_at = hold_expiry(by_key[key])
+            reservations.extend(
+                StockReservation(stockunit_id=batch_id, units=ml, expires_at=expires_at, **{kind: by_key[key]})
+                for batch_id, _, ml in plan
+            )
+        StockReservation.objects.bulk_create(reservations)
+
+    return {
+        'requests': len(requests),
+        'allocated': len(allocations),
+        'unfilled': len(unfilled),
+        'substituted': substituted,
+        'reserved_ml': sum(r.units for r in reservations),
+    }
+
+
+def allocate_all_centers(allow_substitutes=True):
+    """Run allocate_center_stock for every center with approved requests. Returns {center_id: summary}."""
+    center_ids = set(
+        BloodRequest.objects.filter(status='approved', stock_deducted=False).values_list('donation_center_id', flat=True)
+    ) | set(
+        DonorBloodRequest.objects.filter(status='approved', stock_deducted=False).values_list('donation_center_id', flat=True)
+    )
+    center_ids.discard(None)
+    return {
+        center.id: allocate_center_stock(center, allow_substitutes)
+        for center in DonationCenter.objects.filter(id__in=center_ids).order_by('id')
+    }
@@ -1,33 +1,108 @@
 # blood/utils/blood_compatibility.py
+import numpy as np
+
+# Recipient blood type -> donor blood types it can receive
+DONOR_COMPATIBILITY = {
+    "O-": ("O-",),
+    "O+": ("O-", "O+"),
+    "A-": ("O-", "A-"),
+    "A+": ("O-", "O+", "A-", "A+"),
+    "B-": ("O-", "B-"),
+    "B+": ("O-", "O+", "B-", "B+"),
+    "AB-": ("O-", "A-", "B-", "AB-"),
+    "AB+": ("O-", "O+", "A-", "A+", "B-", "B+", "AB-", "AB+"),
+}
+
+# Donor blood type -> recipient blood types it can serve
+RECIPIENT_COMPATIBILITY = {
+    "O-": ("O-", "O+", "A-", "A+", "B-", "B+", "AB-", "AB+"),  # universal donor
+    "O+": ("O+", "A+", "B+", "AB+"),
+    "A-": ("A-", "A+", "AB-", "AB+"),
+    "A+": ("A+", "AB+"),
+    "B-": ("B-", "B+", "AB-", "AB+"),
+    "B+": ("B+", "AB+"),
+    "AB-": ("AB-", "AB+"),
+    "AB+": ("AB+",),
+}
+
+# Bit index of each group; also the column order of stock matrices
+BLOOD_GROUPS = ("A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-")
+GROUP_INDEX = {bt: i for i, bt in enumerate(BLOOD_GROUPS)}
+GROUP_BITS = {bt: 1 << i for i, bt in enumerate(BLOOD_GROUPS)}
+
+# Bitmask of donor groups each recipient can take, and of recipients each donor can serve
+DONOR_MASKS = {
+    recipient: sum(GROUP_BITS[d] for d in donors) for recipient, donors in DONOR_COMPATIBILITY.items()
+}
+RECIPIENT_MASKS = {
+    donor: sum(GROUP_BITS[r] for r in recipients) for donor, recipients in RECIPIENT_COMPATIBILITY.items()
+}
+
+# COMPATIBILITY_MATRIX[donor, recipient] is 1 when the donor group can serve the recipient group
+COMPATIBILITY_MATRIX = np.array(
+    [[(RECIPIENT_MASKS[donor] >> r) & 1 for r in range(len(BLOOD_GROUPS))] for donor in BLOOD_GROUPS],
+    dtype=float,
+)
+COMPATIBILITY_MATRIX.setflags(write=False)
+
+
 # returns the list of donor blood types that are compatible
 def get_compatible_blood_types(blood_type):
     """
     Return a list of compatible blood types for transfusion based on the recipient's blood type.
     """
-    compatibility = {
-        "O-": ["O-"],
-        "O+": ["O-", "O+"],
-        "A-": ["O-", "A-"],
-        "A+": ["O-", "O+", "A-", "A+"],
-        "B-": ["O-", "B-"],
-        "B+": ["O-", "O+", "B-", "B+"],
-        "AB-": ["O-", "A-", "B-", "AB-"],
-        "AB+": ["O-", "O+", "A-", "A+", "B-", "B+", "AB-", "AB+"],
-    }
-    return compatibility.get(blood_type, [blood_type])
+    return list(DONOR_COMPATIBILITY.get(blood_type, (blood_type,)))
 #returns a list of patient blood types compatible as recipients
 def get_compatible_recipient_blood_types(donor_blood_type):
     """
     Return a list of recipient blood types compatible with donor blood type.
     """
-    compatibility = {
-        "O-": ["O-", "O+", "A-", "A+", "B-", "B+", "AB-", "AB+"],  # universal donor
-        "O+": ["O+", "A+", "B+", "AB+"],
-        "A-": ["A-", "A+", "AB-", "AB+"],
-        "A+": ["A+", "AB+"],
-        "B-": ["B-", "B+", "AB-", "AB+"],
-        "B+": ["B+", "AB+"],
-        "AB-": ["AB-", "AB+"],
-        "AB+": ["AB+"],
-    }
-    return compatibility.get(donor_blood_type, [])
\ No newline at end of file
+    return list(RECIPIENT_COMPATIBILITY.get(donor_blood_type, ()))
+
+
+def is_compatible(donor_blood_type, recipient_blood_type):
+    """True if blood of donor_blood_type can be given to recipient_blood_type."""
+    return bool(DONOR_MASKS.get(recipient_blood_type, 0) & GROUP_BITS.get(donor_blood_type, 0))
+
+
+def compatible_supply(stock):
+    """
+    Effective compatible supply for every recipient group, in one matrix multiply.
+
+    Args:
+        stock (array-like): ml per donor group, shape (8,) or (n_centers, 8),
+            columns in BLOOD_GROUPS order.
+
+    Returns:
+        np.ndarray: Same shape; column r is the ml that could serve a recipient
+        of BLOOD_GROUPS[r] (the sum of every compatible donor group). An
+        empty list is no centers and gives shape (0, 8).
+    """
+    stock = np.asarray(stock, dtype=float)
+    if stock.ndim == 1 and not stock.size:
+        return np.zeros((0, len(BLOOD_GROUPS)))
+    return stock @ COMPATIBILITY_MATRIX
+
+
+def compatible_supply_for(stock, recipient_blood_type):
+    """Column of compatible_supply for one recipient group, e.g. ml per center that could serve AB-."""
+    donors = COMPATIBILITY_MATRIX[:, GROUP_INDEX[recipient_blood_type]]
+    return np.asarray(stock, dtype=float) @ donors
+
+# Donor groups in the order they are given as substitutes, least versatile first
+# so universal O- is always used last. Override with settings.BLOOD_SUBSTITUTION_PRIORITY.
+DEFAULT_SUBSTITUTION_PRIORITY = ["AB+", "AB-", "A+", "B+", "A-", "B-", "O+", "O-"]
+
+
+def get_substitution_order(blood_type, priority=None):
+    """
+    Return donor blood types to draw from for a recipient, exact match first,
+    then compatible substitutes in priority order.
+    """
+    if priority is None:
+        from django.conf import settings
+        priority = getattr(settings, "BLOOD_SUBSTITUTION_PRIORITY", DEFAULT_SUBSTITUTION_PRIORITY)
+    rank = {bt: i for i, bt in enumerate(priority)}
+    substitutes = [bt for bt in get_compatible_blood_types(blood_type) if bt != blood_type]
+    substitutes.sort(key=lambda bt: (bt == "O-", rank.get(bt, len(rank))))
+    return [blood_type] + substitutes
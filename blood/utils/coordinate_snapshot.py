@@ -0,0 +1,271 @@
+# blood/utils/coordinate_snapshot.py
+# Per-process NumPy snapshots of donor/patient coordinates for vectorized radius queries
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from blood.utils.blood_compatibility import GROUP_INDEX
+from blood.utils.geolocation import EARTH_RADIUS_KM
+from donor.models import Donor
+from patient.models import Patient
+
+# Beyond this many pending changes a worker reloads the whole snapshot
+SNAPSHOT_MAX_PATCH = 500
+# How long change records stay in the cache for lagging workers to catch up
+SNAPSHOT_CHANGE_TTL = 60 * 60
+# A worker reloads its snapshot at least this often (seconds), even if it has seen no change
+SNAPSHOT_MAX_AGE = 5 * 60
+DONATION_INTERVAL_DAYS = 56
+# Rest beyond this many days since the last donation counts the same when ranking donors
+RANK_REST_CAP_DAYS = 365
+
+
+class CoordinateSnapshot:
+    """
+    Coordinates of one model's searchable rows held as NumPy arrays:
+    ids, latitude/longitude in radians, cos(latitude) and blood group codes
+    (index into BLOOD_GROUPS, -1 if unknown), plus subclass-specific columns.
+
+    Each worker builds its snapshot lazily on first use. Saves and deletes
+    bump a version counter in the Django cache and record the changed id, so
+    every worker patches just those rows on its next query (or reloads if it
+    has fallen too far behind). Cross-worker invalidation needs a shared
+    cache backend; as a backstop (missed signals, bulk writes, a per-process
+    cache) every snapshot is reloaded in full once it is SNAPSHOT_MAX_AGE old.
+    """
+    cache_prefix = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.loaded_at = None
+        # Bumped on every reload or patch, so derived structures know to rebuild
+        self.generation = 0
+        self._load([])
+
+    # -- subclass hooks -------------------------------------------------
+
+    def fetch(self, ids=None):
+        """Rows (id, latitude, longitude[, bloodgroup, *extra]) to include, limited to ids if given."""
+        raise NotImplementedError
+
+    def extra_columns(self, rows):
+        """Subclass arrays built from the extra row values, as {name: array}."""
+        return {}
+
+    # -- versioning -----------------------------------------------------
+
+    @property
+    def _version_key(self):
+        return f"{self.cache_prefix}:version"
+
+    def _change_key(self, version):
+        return f"{self.cache_prefix}:change:{version}"
+
+    def current_version(self):
+        cache.add(self._version_key, 0, timeout=None)
+        return cache.get(self._version_key, 0)
+
+    def mark_changed(self, pk):
+        """Record that the row with this pk changed (called from signals after commit)."""
+        cache.add(self._version_key, 0, timeout=None)
+        try:
+            version = cache.incr(self._version_key)
+        except ValueError:
+            # Evicted between add() and incr(); everyone reloads
+            cache.set(self._version_key, 1, timeout=None)
+            return
+        cache.set(self._change_key(version), pk, SNAPSHOT_CHANGE_TTL)
+
+    def mark_all_changed(self):
+        """Make every worker reload in full, e.g. after bulk writes that send no signals."""
+        cache.add(self._version_key, 0, timeout=None)
+        try:
+            # No change record for this version, so nobody can patch past it
+            cache.incr(self._version_key)
+        except ValueError:
+            cache.set(self._version_key, 1, timeout=None)
+
+    def _expired(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > SNAPSHOT_MAX_AGE
+
+    def refresh(self):
+        """Bring this worker's snapshot up to the current version, reloading it if it is too old."""
+        current = self.current_version()
+        if self.version == current and not self._expired():
+            return
+        with self._lock:
+            if self.version == current and not self._expired():
+                return
+            behind = None if self.version is None else current - self.version
+            if not self._expired() and behind is not None and 0 < behind <= SNAPSHOT_MAX_PATCH:
+                keys = [self._change_key(v) for v in range(self.version + 1, current + 1)]
+                changes = cache.get_many(keys)
+                if len(changes) == len(keys):
+                    self._patch(set(changes.values()))
+                    self.version = current
+                    self.generation += 1
+                    return
+            self._load(list(self.fetch()))
+            self.version = current
+            self.loaded_at = time.monotonic()
+            self.generation += 1
+
+    # -- arrays ---------------------------------------------------------
+
+    def _load(self, rows):
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.lat = np.radians(np.array([r[1] for r in rows], dtype=float))
+        self.lng = np.radians(np.array([r[2] for r in rows], dtype=float))
+        self.cos_lat = np.cos(self.lat)
+        self.groups = np.array([GROUP_INDEX.get(r[3], -1) if len(r) > 3 else -1 for r in rows], dtype=np.int8)
+        for name, values in self.extra_columns(rows).items():
+            setattr(self, name, values)
+
+    def _columns(self):
+        return ['ids', 'lat', 'lng', 'cos_lat', 'groups', *self.extra_columns([])]
+
+    def _patch(self, ids):
+        """Drop the changed ids and append their current rows (if they still qualify)."""
+        keep = ~np.isin(self.ids, list(ids))
+        current = {name: getattr(self, name)[keep] for name in self._columns()}
+        fresh = type(self).__new__(type(self))
+        fresh._load(list(self.fetch(ids)))
+        for name in self._columns():
+            setattr(self, name, np.concatenate([current[name], getattr(fresh, name)]))
+
+    # -- queries --------------------------------------------------------
+
+    def distances(self, lat, lng):
+        """Haversine distance in km from (lat, lng) to every row, in one vectorized pass."""
+        lat1, lng1 = np.radians(lat), np.radians(lng)
+        a = (np.sin((self.lat - lat1) / 2) ** 2
+             + np.cos(lat1) * self.cos_lat * np.sin((self.lng - lng1) / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def search_mask(self, **filters):
+        """Extra row filter for search(); all rows by default."""
+        return np.ones(len(self.ids), dtype=bool)
+
+    def search(self, lat, lng, max_distance_km, bloodgroups=None, limit=None, **filters):
+        """
+        Ids and distances of rows within max_distance_km, closest first.
+
+        Args:
+            bloodgroups (iterable | None): Only rows in these groups.
+            limit (int | None): Return only the closest ``limit`` rows; selected
+                with np.partition so only those are fully sorted.
+
+        Returns:
+            (ids, distances_km) as NumPy arrays.
+        """
+        ids, distances, _ = self.page(lat, lng, max_distance_km, bloodgroups, limit, **filters)
+        return ids, distances
+
+    def page(self, lat, lng, max_distance_km, bloodgroups=None, limit=None, after=None, **filters):
+        """
+        Like search(), ordered by (distance, id) and starting after the
+        ``after`` = (distance_km, id) of the previous page's last row.
+
+        Returns:
+            (ids, distances_km, total) where total counts every match,
+            not just this page.
+        """
+        self.refresh()
+        distance = self.distances(lat, lng)
+        mask = self._match_mask(distance, max_distance_km, bloodgroups, **filters)
+        total = int(mask.sum())
+        if after is not None:
+            after_distance, after_id = after
+            mask &= (distance > after_distance) | ((distance == after_distance) & (self.ids > after_id))
+        rows = np.nonzero(mask)[0]
+        if limit is not None and len(rows) > limit:
+            if limit <= 0:
+                rows = rows[:0]
+            else:
+                # Keep ties with the limit-th distance so the id tie-break below stays exact
+                cutoff = np.partition(distance[rows], limit - 1)[limit - 1]
+                rows = rows[distance[rows] <= cutoff]
+        rows = rows[np.lexsort((self.ids[rows], distance[rows]))][:limit]
+        return self.ids[rows], distance[rows], total
+
+    def _match_mask(self, distance, max_distance_km, bloodgroups=None, **filters):
+        mask = (distance <= max_distance_km) & self.search_mask(**filters)
+        if bloodgroups is not None:
+            codes = [GROUP_INDEX[bg] for bg in bloodgroups if bg in GROUP_INDEX]
+            mask &= np.isin(self.groups, codes)
+        return mask
+
+
+class DonorSnapshot(CoordinateSnapshot):
+    """Medically approved donors with coordinates; the donation interval is checked per query."""
+    cache_prefix = 'coordinate_snapshot:donor'
+
+    def fetch(self, ids=None):
+        donors = Donor.objects.filter(
+            latitude__isnull=False, longitude__isnull=False, donoreligibility__approved=True,
+        )
+        if ids is not None:
+            donors = donors.filter(id__in=ids)
+        return donors.order_by().values_list('id', 'latitude', 'longitude', 'bloodgroup', 'last_donation_date')
+
+    def extra_columns(self, rows):
+        # Day ordinal of the last donation; 0 for never donated
+        return {'last_donation': np.array(
+            [r[4].toordinal() if r[4] else 0 for r in rows], dtype=np.int64
+        )}
+
+    def search_mask(self, today=None, **filters):
+        cutoff = (today or timezone.localdate()) - timedelta(days=DONATION_INTERVAL_DAYS)
+        return self.last_donation <= cutoff.toordinal()
+
+    def ranked(self, lat, lng, max_distance_km, bloodgroups, limit, exclude=(), today=None):
+        """
+        Eligible donors within max_distance_km, best first, for emergency paging.
+
+        The score weighs distance (as a fraction of the radius) equally with
+        rest (days since the last donation, as a fraction of
+        RANK_REST_CAP_DAYS; never donated counts as fully rested), so a donor
+        at the edge of the radius who is fully rested ranks with one next
+        door who has only just become eligible again.
+
+        Args:
+            exclude (iterable): Donor ids to leave out (already paged).
+
+        Returns:
+            (ids, distances_km, rest_days) as NumPy arrays.
+        """
+        self.refresh()
+        today = today or timezone.localdate()
+        distance = self.distances(lat, lng)
+        mask = self._match_mask(distance, max_distance_km, bloodgroups, today=today)
+        if exclude:
+            mask &= ~np.isin(self.ids, list(exclude))
+        rows = np.nonzero(mask)[0]
+        rest = np.minimum(today.toordinal() - self.last_donation[rows], RANK_REST_CAP_DAYS)
+        score = distance[rows] / max_distance_km + 1 - rest / RANK_REST_CAP_DAYS
+        if len(rows) > limit > 0:
+            keep = score <= np.partition(score, limit - 1)[limit - 1]
+            rows, rest, score = rows[keep], rest[keep], score[keep]
+        order = np.lexsort((self.ids[rows], score))[:max(limit, 0)]
+        rows, rest = rows[order], rest[order]
+        return self.ids[rows], distance[rows], rest
+
+
+class PatientSnapshot(CoordinateSnapshot):
+    """Patients with coordinates."""
+    cache_prefix = 'coordinate_snapshot:patient'
+
+    def fetch(self, ids=None):
+        patients = Patient.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        if ids is not None:
+            patients = patients.filter(id__in=ids)
+        return patients.order_by().values_list('id', 'latitude', 'longitude', 'bloodgroup')
+
+
+donor_snapshot = DonorSnapshot()
+patient_snapshot = PatientSnapshot()
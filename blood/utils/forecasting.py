@@ -0,0 +1,221 @@
+# blood/utils/forecasting.py
+# Per-center demand forecasts and days-of-cover, fitted for every series at once with NumPy
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from blood.models import BloodRequest, DemandForecast, DonorBloodRequest, Stock, StockTransaction
+
+DEMAND_HISTORY_DAYS = 120
+FORECAST_HORIZON_DAYS = 28
+# Below this many days of projected cover a center should ask for stock, and should not supply it
+REORDER_COVER_DAYS = 7
+SMOOTHING_ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5)
+# Requests in these states never turned into demand on the shelf
+IGNORED_REQUEST_STATUSES = ('rejected', 'cancelled')
+
+
+def _fill(matrix, index, rows, start):
+    """Add (center_id, bloodgroup, day, ml) rows into matrix."""
+    for center_id, bloodgroup, day, ml in rows:
+        series = index.get((center_id, bloodgroup))
+        offset = (day - start).days
+        if series is not None and 0 <= offset < matrix.shape[1] and ml:
+            matrix[series, offset] += ml
+
+
+def build_demand_matrix(days=DEMAND_HISTORY_DAYS, today=None):
+    """
+    Build daily demand series for every (center, bloodgroup) as one NumPy array.
+
+    Demand on a day is what was requested that day (BloodRequest and
+    DonorBloodRequest, including requests that could not be met) plus stock
+    deducted that day without a linked request. Deductions made for a request
+    are already counted on the day it was raised, whenever they happen, so a
+    request and the deduction that fulfilled it are never counted twice.
+
+    Returns:
+        (keys, start, matrix): keys is a list of (center_id, bloodgroup), start
+        the first date, and matrix a float array of shape (len(keys), days).
+    """
+    today = today or timezone.now().date()
+    start = today - timedelta(days=days)
+
+    requested = {}
+    for model in (BloodRequest, DonorBloodRequest):
+        rows = (
+            model.objects.filter(
+                created_at__date__gte=start,
+                created_at__date__lt=today,
+                donation_center__isnull=False,
+                bloodgroup__isnull=False,
+            )
+            .exclude(status__in=IGNORED_REQUEST_STATUSES)
+            .exclude(bloodgroup='')
+            .annotate(day=TruncDate('created_at'))
+            .values_list('donation_center_id', 'bloodgroup', 'day')
+            .annotate(ml=Sum('unit'))
+        )
+        for center_id, bloodgroup, day, ml in rows:
+            key = (center_id, bloodgroup, day)
+            requested[key] = requested.get(key, 0) + (ml or 0)
+
+    deducted = (
+        StockTransaction.objects.filter(
+            transaction_type='deduction',
+            transaction_at__date__gte=start,
+            transaction_at__date__lt=today,
+            blood_request__isnull=True,
+            donor_blood_request__isnull=True,
+        )
+        .annotate(day=TruncDate('transaction_at'))
+        .values_list('stockunit__center_id', 'stockunit__bloodgroup', 'day')
+        .annotate(ml=Sum('quantity_deducted'))
+    )
+    deducted = list(deducted)
+
+    keys = sorted(
+        {(center_id, bloodgroup) for center_id, bloodgroup, _ in requested}
+        | {(center_id, bloodgroup) for center_id, bloodgroup, _, _ in deducted}
+    )
+    index = {key: i for i, key in enumerate(keys)}
+    matrix = np.zeros((len(keys), days), dtype=float)
+    _fill(matrix, index, ((c, bg, day, ml) for (c, bg, day), ml in requested.items()), start)
+    _fill(matrix, index, deducted, start)
+    return keys, start, matrix
+
+
+def weekday_factors(matrix, start):
+    """
+    Seasonal baseline: each series' mean demand per weekday relative to its
+    overall mean. Returns an array of shape (n_series, 7) indexed by weekday().
+    """
+    n_series, days = matrix.shape
+    weekdays = (start.weekday() + np.arange(days)) % 7
+    totals = np.zeros((n_series, 7))
+    counts = np.bincount(weekdays, minlength=7).astype(float)
+    for weekday in range(7):
+        totals[:, weekday] = matrix[:, weekdays == weekday].sum(axis=1)
+    per_weekday = totals / np.maximum(counts, 1)
+    overall = matrix.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factors = np.where(overall > 0, per_weekday / overall, 1.0)
+    return factors
+
+
+def fit_exponential_smoothing(series, alphas=SMOOTHING_ALPHAS):
+    """
+    Fit simple exponential smoothing to every row of ``series`` at once.
+
+    Each candidate alpha is run over all series in parallel and every series
+    keeps the alpha with the lowest one-step-ahead squared error, so the cost
+    is one vectorized pass per day of history regardless of how many centers
+    there are.
+
+    Returns:
+        (level, alpha): final smoothed level and chosen alpha per series.
+    """
+    alphas = np.asarray(alphas, dtype=float)[:, None]  # (n_alphas, 1)
+    n_series, days = series.shape
+    if days == 0:
+        return np.zeros(n_series), np.full(n_series, alphas[0, 0])
+
+    level = np.repeat(series[None, :, 0], len(alphas), axis=0)  # (n_alphas, n_series)
+    sse = np.zeros_like(level)
+    for t in range(1, days):
+        observed = series[:, t]
+        sse += (observed - level) ** 2
+        level = alphas * observed + (1 - alphas) * level
+
+    best = sse.argmin(axis=0)
+    columns = np.arange(n_series)
+    return level[best, columns], alphas[best, 0]
+
+
+def project_demand(level, factors, first_day, horizon=FORECAST_HORIZON_DAYS):
+    """Return expected ml per day for the next ``horizon`` days, shape (n_series, horizon)."""
+    weekdays = (first_day.weekday() + np.arange(horizon)) % 7
+    return level[:, None] * factors[:, weekdays]
+
+
+def days_of_cover(on_hand, daily_forecast):
+    """
+    How many days on_hand lasts against a daily forecast, per series.
+
+    The day stock runs out is interpolated within that day. Series with no
+    stock have zero cover, even with no forecast demand; series whose stock
+    outlasts the horizon get NaN.
+    """
+    used = np.cumsum(daily_forecast, axis=1)
+    horizon = daily_forecast.shape[1]
+    runs_out = used > on_hand[:, None]
+    day = np.where(runs_out.any(axis=1), runs_out.argmax(axis=1), horizon)
+
+    cover = np.full(on_hand.shape, np.nan)
+    short = day < horizon
+    rows = np.nonzero(short)[0]
+    before = np.where(day[rows] > 0, used[rows, day[rows] - 1], 0.0)
+    today_use = daily_forecast[rows, day[rows]]
+    cover[rows] = day[rows] + (on_hand[rows] - before) / np.maximum(today_use, 1e-9)
+    cover[on_hand <= 0] = 0.0
+    return cover
+
+
+def compute_demand_forecasts(today=None, history_days=DEMAND_HISTORY_DAYS, horizon=FORECAST_HORIZON_DAYS):
+    """
+    Fit demand for every (center, bloodgroup) and store days-of-cover (nightly job).
+
+    Groups with stock but no demand history are stored with zero demand.
+    The previous forecasts are overwritten with a single upsert.
+
+    Returns:
+        int: Number of forecasts written.
+    """
+    today = today or timezone.now().date()
+    keys, start, matrix = build_demand_matrix(history_days, today)
+
+    on_hand_map = {
+        (center_id, bloodgroup): unit
+        for center_id, bloodgroup, unit in Stock.objects.values_list('center_id', 'bloodgroup', 'unit')
+    }
+    known = set(keys)
+    keys = keys + sorted(key for key in on_hand_map if key not in known)
+    matrix = np.vstack([matrix, np.zeros((len(keys) - matrix.shape[0], matrix.shape[1]))])
+
+    factors = weekday_factors(matrix, start)
+    deseasonalized = matrix / np.maximum(factors[:, (start.weekday() + np.arange(matrix.shape[1])) % 7], 1e-9)
+    level, _ = fit_exponential_smoothing(deseasonalized)
+    forecast = project_demand(level, factors, today, horizon)
+
+    on_hand = np.array([on_hand_map.get(key, 0) for key in keys], dtype=float)
+    cover = days_of_cover(on_hand, forecast)
+    horizon_demand = forecast.sum(axis=1)
+
+    forecasts = [
+        DemandForecast(
+            center_id=center_id,
+            bloodgroup=bloodgroup,
+            computed_on=today,
+            daily_demand=round(float(level[i]), 2),
+            horizon_demand=int(round(horizon_demand[i])),
+            on_hand=int(on_hand[i]),
+            days_of_cover=None if np.isnan(cover[i]) else round(float(cover[i]), 2),
+        )
+        for i, (center_id, bloodgroup) in enumerate(keys)
+    ]
+    DemandForecast.objects.bulk_create(
+        forecasts,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['center', 'bloodgroup'],
+        update_fields=['computed_on', 'daily_demand', 'horizon_demand', 'on_hand', 'days_of_cover'],
+    )
+    return len(forecasts)
+
+
+def get_days_of_cover(center):
+    """Return {bloodgroup: DemandForecast} for a center from the last nightly run."""
+    return {f.bloodgroup: f for f in DemandForecast.objects.filter(center=center)}
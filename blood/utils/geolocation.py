@@ -1,17 +1,19 @@
 from math import radians, sin, cos, sqrt, atan2
+import numpy as np
 from blood.models import DonationCenter
 from blood.utils.blood_compatibility import get_compatible_blood_types  
 from donor.models import Donor
-from django.db.models import Q
-from datetime import date, timedelta
 from patient.models import Patient 
 from blood.utils.blood_compatibility import get_compatible_recipient_blood_types
 
+EARTH_RADIUS_KM = 6371.0
+
+
 def haversine(lat1, lon1, lat2, lon2):
     """
     Calculate distance in kilometers between two lat/lon points using the Haversine formula.
     """
-    R = 6371.0  # Earth’s radius in km
+    R = EARTH_RADIUS_KM
     dlat = radians(lat2 - lat1)
     dlon = radians(lon2 - lon1)
 
@@ -21,23 +23,31 @@ def haversine(lat1, lon1, lat2, lon2):
     return distance
 
 
+def haversine_matrix(lats1, lngs1, lats2, lngs2):
+    """
+    Pairwise haversine distances in km between two sets of points.
+    Returns a NumPy array of shape (len(lats1), len(lats2)).
+    """
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lng1 = np.radians(np.asarray(lngs1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lng2 = np.radians(np.asarray(lngs2, dtype=float))[None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
 def find_nearby_centers(lat, lng, max_distance_km=50):
     """
     Return a sorted list of (DonationCenter, distance_km) tuples within max_distance_km.
+    Answered from the in-process center KD-tree.
     """
-    centers = DonationCenter.objects.filter(latitude__isnull=False, longitude__isnull=False)
-
-    nearby_centers = []
-    for center in centers:
-        distance = haversine(lat, lng, center.latitude, center.longitude)
-        if distance <= max_distance_km:
-            nearby_centers.append((center, round(distance, 2)))
+    from blood.utils.spatial_index import centers_within
 
-    nearby_centers.sort(key=lambda x: x[1])  # closest first
-    return nearby_centers
+    return centers_within(lat, lng, max_distance_km)
 
 
-def find_nearby_eligible_donors(lat, lng, patient_bloodgroup, max_distance_km=50):
+def find_nearby_eligible_donors(lat, lng, patient_bloodgroup, max_distance_km=50, limit=None):
     """
     Find donors who:
     - have compatible blood group with the patient,
@@ -45,54 +55,40 @@ def find_nearby_eligible_donors(lat, lng, patient_bloodgroup, max_distance_km=50
     - are medically eligible (DonorEligibility.approved=True),
     - and have not donated in the last 56 days (or never donated).
 
+    Distances come from the in-process coordinate snapshot in one vectorized
+    pass; only the matching donors are loaded from the database.
+
     Returns a sorted list of tuples: (Donor instance, distance in km).
     """
-    compatible_types = get_compatible_blood_types(patient_bloodgroup)
-    eligibility_cutoff_date = date.today() - timedelta(days=56)
-
-    # Query donors matching location, blood group, and medical approval
-    donors_qs = Donor.objects.filter(
-        latitude__isnull=False,
-        longitude__isnull=False,
-        bloodgroup__in=compatible_types,
-        donoreligibility__approved=True,
-    ).filter(
-        Q(last_donation_date__lte=eligibility_cutoff_date) | Q(last_donation_date__isnull=True)
-    )
-
-    nearby_donors = []
-    for donor in donors_qs:
-        distance = haversine(lat, lng, donor.latitude, donor.longitude)
-        if distance <= max_distance_km:
-            nearby_donors.append((donor, round(distance, 2)))
+    from blood.utils.coordinate_snapshot import donor_snapshot
 
-    nearby_donors.sort(key=lambda x: x[1])  # Sort closest first
-    return nearby_donors
+    compatible_types = get_compatible_blood_types(patient_bloodgroup)
+    ids, distances = donor_snapshot.search(lat, lng, max_distance_km, compatible_types, limit)
+    donors = Donor.objects.select_related('user').in_bulk(ids.tolist())
+    return [
+        (donors[pk], round(float(distance), 2))
+        for pk, distance in zip(ids.tolist(), distances) if pk in donors
+    ]
 
 
-def find_nearby_compatible_patients(lat, lng, donor_bloodgroup, max_distance_km=50):
+def find_nearby_compatible_patients(lat, lng, donor_bloodgroup, max_distance_km=50, limit=None):
     """
     Finds patients who:
     - have compatible blood group as recipients for the donor blood type,
     - are within max_distance_km radius,
     - optionally, have active blood requests or other filters as needed.
 
+    Distances come from the in-process coordinate snapshot in one vectorized
+    pass; only the matching patients are loaded from the database.
+
     Returns a sorted list of tuples: (Patient instance, distance in km).
     """
-    compatible_recipient_types = get_compatible_recipient_blood_types(donor_bloodgroup)
+    from blood.utils.coordinate_snapshot import patient_snapshot
 
-    patients_qs = Patient.objects.filter(
-        latitude__isnull=False,
-        longitude__isnull=False,
-        bloodgroup__in=compatible_recipient_types,
-        
-    )
-
-    nearby_patients = []
-    for patient in patients_qs:
-        distance = haversine(lat, lng, patient.latitude, patient.longitude)
-        if distance <= max_distance_km:
-            nearby_patients.append((patient, round(distance, 2)))
-
-    nearby_patients.sort(key=lambda x: x[1])
-    return nearby_patients
+    compatible_recipient_types = get_compatible_recipient_blood_types(donor_bloodgroup)
+    ids, distances = patient_snapshot.search(lat, lng, max_distance_km, compatible_recipient_types, limit)
+    patients = Patient.objects.select_related('user').in_bulk(ids.tolist())
+    return [
+        (patients[pk], round(float(distance), 2))
+        for pk, distance in zip(ids.tolist(), distances) if pk in patients
+    ]
@@ -0,0 +1,142 @@
+# blood/utils/ledger.py
+# Append-only stock ledger: every change to a StockUnit balance is a StockTransaction
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from blood.models import StockTransaction, StockUnit
+
+
+def ledger_entry(stockunit_id, transaction_type, quantity, record=None):
+    """
+    Build (but do not save) a ledger row, putting quantity in the field that
+    matches the direction of transaction_type.
+    """
+    entry = StockTransaction(stockunit_id=stockunit_id, transaction_type=transaction_type, **(record or {}))
+    if transaction_type in StockTransaction.INCOMING_TYPES:
+        entry.quantity_added = quantity
+    else:
+        entry.quantity_deducted = quantity
+    return entry
+
+
+def post_ledger_entries(entries):
+    """Append ledger rows in one INSERT. Callers update the batch balances in the same transaction."""
+    return StockTransaction.objects.bulk_create(list(entries))
+
+
+def replay_batch_balances(stockunit_ids=None):
+    """
+    Rebuild batch balances from the ledger alone.
+
+    Returns:
+        dict: {stockunit_id: (received, balance)}
+    """
+    qs = StockTransaction.objects.all()
+    if stockunit_ids is not None:
+        qs = qs.filter(stockunit_id__in=stockunit_ids)
+
+    incoming = Q(transaction_type__in=StockTransaction.INCOMING_TYPES)
+    rows = qs.values('stockunit_id').annotate(
+        received=Coalesce(Sum('quantity_added', filter=incoming), 0),
+        taken=Coalesce(Sum('quantity_deducted', filter=~incoming), 0),
+    )
+    return {row['stockunit_id']: (row['received'], row['received'] - row['taken']) for row in rows}
+
+
+def verify_stock_ledger(repair=False):
+    """
+    Replay the ledger and compare it with the materialized balances.
+
+    Checks every StockUnit (unit and received) and every Stock aggregate.
+    With repair=True, batch balances are reset from the ledger and the
+    aggregates rebuilt; the ledger itself is never modified. Batches without an
+    opening entry are reported as unledgered and left alone.
+
+    Returns:
+        dict: lists of batch and aggregate mismatches, and unledgered batch ids.
+    """
+    from blood.models import Stock
+    from blood.utils.stock_utils import refresh_stock_aggregates
+
+    today = timezone.now().date()
+    replayed = replay_batch_balances()
+
+    batch_mismatches = []
+    unledgered = []
+    expected_totals = defaultdict(int)
+    for stockunit_id, center_id, bloodgroup, unit, received, expiry_date in StockUnit.objects.values_list(
+        'id', 'center_id', 'bloodgroup', 'unit', 'received', 'expiry_date'
+    ).iterator():
+        if not replayed.get(stockunit_id, (0, 0))[0]:
+            # Pre-ledger batch with no opening entry: trust its balance until it is backfilled
+            if unit or received:
+                unledgered.append(stockunit_id)
+            if expiry_date >= today:
+                expected_totals[(center_id, bloodgroup)] += unit
+            continue
+
+        ledger_received, ledger_balance = replayed[stockunit_id]
+        if unit != ledger_balance or received != ledger_received:
+            batch_mismatches.append({
+                'stockunit_id': stockunit_id,
+                'unit': unit,
+                'ledger_balance': ledger_balance,
+                'received': received,
+                'ledger_received': ledger_received,
+            })
+        if expiry_date >= today:
+            expected_totals[(center_id, bloodgroup)] += ledger_balance
+
+    aggregate_mismatches = [
+        {'center_id': center_id, 'bloodgroup': bloodgroup, 'unit': unit,
+         'ledger_balance': expected_totals.get((center_id, bloodgroup), 0)}
+        for center_id, bloodgroup, unit in Stock.objects.values_list('center_id', 'bloodgroup', 'unit')
+        if unit != expected_totals.get((center_id, bloodgroup), 0)
+    ]
+
+    if repair and (batch_mismatches or aggregate_mismatches):
+        with transaction.atomic():
+            for offset in range(0, len(batch_mismatches), 1000):
+                chunk = batch_mismatches[offset:offset + 1000]
+                ids = [m['stockunit_id'] for m in chunk]
+                StockUnit.objects.filter(id__in=ids).update(
+                    unit=Case(*[When(id=m['stockunit_id'], then=Value(m['ledger_balance'])) for m in chunk],
+                              output_field=IntegerField()),
+                    received=Case(*[When(id=m['stockunit_id'], then=Value(m['ledger_received'])) for m in chunk],
+                                  output_field=IntegerField()),
+                )
+            refresh_stock_aggregates()
+
+    return {'batches': batch_mismatches, 'aggregates': aggregate_mismatches, 'unledgered': unledgered}
+
+
+def backfill_opening_entries():
+    """
+    Give batches created before the ledger existed an opening 'addition' entry
+    equal to what they have received, plus a deduction for any use that was
+    never logged, so replaying them gives their current balance.
+
+    Returns:
+        int: Number of opening entries written.
+    """
+    replayed = replay_batch_balances()
+
+    entries = []
+    for stockunit_id, received, unit in StockUnit.objects.filter(received__gt=0).values_list(
+        'id', 'received', 'unit'
+    ).iterator():
+        ledger_received, ledger_balance = replayed.get(stockunit_id, (0, 0))
+        if ledger_received:
+            continue
+        entries.append(ledger_entry(stockunit_id, 'addition', received, {'notes': "Opening balance"}))
+        unlogged = received + ledger_balance - unit  # ledger_balance is minus what was already logged out
+        if unlogged > 0:
+            entries.append(ledger_entry(stockunit_id, 'deduction', unlogged,
+                                        {'notes': "Opening balance (used before ledger)"}))
+    with transaction.atomic():
+        post_ledger_entries(entries)
+    return len(entries)
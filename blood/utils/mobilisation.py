@@ -0,0 +1,88 @@
+# blood/utils/mobilisation.py
+# Emergency donor mobilisation: rank nearby eligible donors and page the best in one insert
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from blood.models import BloodRequest, Notification
+from blood.utils.blood_compatibility import get_compatible_blood_types
+from blood.utils.coordinate_snapshot import donor_snapshot
+from blood.utils.notifications import invalidate_unread_counts
+from donor.models import Donor
+from patient.models import Patient
+
+EMERGENCY_PAGE_SIZE = 25
+EMERGENCY_RADIUS_KM = 50
+EMERGENCY_ACTION = 'emergency'
+
+
+def request_location(blood_request):
+    """(lat, lng) to search around: the chosen center, else the patient; None if neither is known."""
+    center = blood_request.donation_center
+    if center and center.latitude is not None and center.longitude is not None:
+        return center.latitude, center.longitude
+    patient = blood_request.request_by_patient
+    if patient.latitude is not None and patient.longitude is not None:
+        return patient.latitude, patient.longitude
+    return None
+
+
+def mobilise_donors(blood_request, limit=EMERGENCY_PAGE_SIZE, max_distance_km=EMERGENCY_RADIUS_KM):
+    """
+    Page the best-ranked compatible, eligible donors near a blood request.
+
+    Candidates are ranked in one pass over the in-process donor snapshot
+    (DonorSnapshot.ranked) and their notifications written with a single
+    bulk_create. Donors already paged for the request are skipped, so calling
+    again pages the next ``limit``. Calls for the same request are serialised
+    on its row lock; the notification_emergency_once constraint is the
+    backstop against duplicate pages.
+
+    Returns:
+        int: Number of donors paged (notifications actually inserted).
+    """
+    location = request_location(blood_request)
+    if location is None or not blood_request.bloodgroup:
+        return 0
+
+    with transaction.atomic():
+        # Lock the request so concurrent calls for it page donors one after the other
+        BloodRequest.objects.select_for_update().filter(pk=blood_request.pk).first()
+        already_paged = set(
+            Notification.objects.filter(blood_request=blood_request, action=EMERGENCY_ACTION)
+            .values_list('recipient_object_id', flat=True)
+        )
+        ids, distances, _ = donor_snapshot.ranked(
+            *location, max_distance_km,
+            get_compatible_blood_types(blood_request.bloodgroup), limit, exclude=already_paged,
+        )
+        if not len(ids):
+            return 0
+
+        donor_type = ContentType.objects.get_for_model(Donor)
+        patient_type = ContentType.objects.get_for_model(Patient)
+        center = blood_request.donation_center
+        where = center.name if center else "a donation center near you"
+        bloodgroup = blood_request.bloodgroup
+        Notification.objects.bulk_create([
+            Notification(
+                title=f"🚨 Emergency: {bloodgroup} blood needed",
+                message=(
+                    f"A patient urgently needs {bloodgroup} blood at {where}, {distance:.1f} km from you. "
+                    f"If you are able to donate, please go to or call the center as soon as possible."
+                ),
+                recipient_content_type=donor_type,
+                recipient_object_id=donor_id,
+                sender_content_type=patient_type,
+                sender_object_id=blood_request.request_by_patient_id,
+                action=EMERGENCY_ACTION,
+                bloodgroup=bloodgroup,
+                unit=blood_request.unit,
+                blood_request=blood_request,
+            )
+            for donor_id, distance in zip(ids.tolist(), distances.tolist())
+        ], ignore_conflicts=True)
+        # bulk_create sends no signals; recount these donors' unread badges on their next page view
+        transaction.on_commit(lambda: invalidate_unread_counts(donor_type.id, ids.tolist()))
+        # ignore_conflicts leaves no pks to count, so count the request's pages again
+        paged = Notification.objects.filter(blood_request=blood_request, action=EMERGENCY_ACTION).count()
+        return paged - len(already_paged)
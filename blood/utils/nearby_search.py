@@ -0,0 +1,140 @@
+# blood/utils/nearby_search.py
+# Paginated nearby donor/patient search returning compact records instead of model instances
+from blood.utils.blood_compatibility import get_compatible_blood_types, get_compatible_recipient_blood_types
+from blood.utils.coordinate_snapshot import donor_snapshot, patient_snapshot
+from donor.models import Donor
+from patient.models import Patient
+
+NEARBY_PAGE_SIZE = 20
+NEARBY_MAX_PAGE_SIZE = 100
+NEARBY_MAX_DISTANCE_KM = 50
+
+
+class NearbyDonor:
+    """One row of a nearby donor search."""
+    __slots__ = ('id', 'name', 'bloodgroup', 'mobile', 'last_donation_date', 'distance_km')
+
+    def __init__(self, id, name, bloodgroup, mobile, last_donation_date, distance_km):
+        self.id = id
+        self.name = name
+        self.bloodgroup = bloodgroup
+        self.mobile = mobile
+        self.last_donation_date = last_donation_date
+        self.distance_km = distance_km
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'bloodgroup': self.bloodgroup,
+            'mobile': self.mobile,
+            'last_donation_date': self.last_donation_date.isoformat() if self.last_donation_date else None,
+            'distance_km': self.distance_km,
+        }
+
+
+class NearbyPatient:
+    """One row of a nearby patient search."""
+    __slots__ = ('id', 'name', 'bloodgroup', 'location_name', 'distance_km')
+
+    def __init__(self, id, name, bloodgroup, location_name, distance_km):
+        self.id = id
+        self.name = name
+        self.bloodgroup = bloodgroup
+        self.location_name = location_name
+        self.distance_km = distance_km
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'bloodgroup': self.bloodgroup,
+            'location_name': self.location_name,
+            'distance_km': self.distance_km,
+        }
+
+
+def encode_cursor(distance_km, pk):
+    """Opaque cursor for the row after which the next page starts."""
+    return f"{float(distance_km)!r}_{pk}"
+
+
+def decode_cursor(cursor):
+    """Return (distance_km, id) from a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        distance, pk = cursor.rsplit('_', 1)
+        return float(distance), int(pk)
+    except ValueError:
+        return None
+
+
+def _page_size(limit):
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return NEARBY_PAGE_SIZE
+    return max(1, min(limit, NEARBY_MAX_PAGE_SIZE))
+
+
+def _search(snapshot, queryset, columns, make_record, lat, lng, bloodgroups, max_distance_km, limit, cursor):
+    """
+    Shared paging: take one page (plus one row to detect more) from the
+    snapshot, then load just those rows' columns in a single query.
+
+    Returns:
+        (records, next_cursor, total)
+    """
+    limit = _page_size(limit)
+    ids, distances, total = snapshot.page(
+        lat, lng, max_distance_km, bloodgroups, limit + 1, after=decode_cursor(cursor)
+    )
+    has_more = len(ids) > limit
+    ids, distances = ids[:limit].tolist(), distances[:limit].tolist()
+
+    rows = {row[0]: row[1:] for row in queryset.filter(id__in=ids).order_by().values_list('id', *columns)}
+    records = [
+        make_record(pk, *rows[pk], round(distance, 2))
+        for pk, distance in zip(ids, distances) if pk in rows
+    ]
+    next_cursor = encode_cursor(distances[-1], ids[-1]) if has_more else None
+    return records, next_cursor, total
+
+
+def _full_name(first_name, last_name):
+    return f"{first_name or ''} {last_name or ''}".strip()
+
+
+def search_nearby_donors(lat, lng, patient_bloodgroup, max_distance_km=NEARBY_MAX_DISTANCE_KM,
+                         limit=NEARBY_PAGE_SIZE, cursor=None):
+    """
+    One page of eligible donors compatible with patient_bloodgroup near
+    (lat, lng), closest first, as NearbyDonor records.
+
+    Returns:
+        (records, next_cursor, total): next_cursor is None on the last page.
+    """
+    return _search(
+        donor_snapshot, Donor.objects,
+        ('user__first_name', 'user__last_name', 'bloodgroup', 'mobile', 'last_donation_date'),
+        lambda pk, first, last, *rest: NearbyDonor(pk, _full_name(first, last), *rest),
+        lat, lng, get_compatible_blood_types(patient_bloodgroup), max_distance_km, limit, cursor,
+    )
+
+
+def search_nearby_patients(lat, lng, donor_bloodgroup, max_distance_km=NEARBY_MAX_DISTANCE_KM,
+                           limit=NEARBY_PAGE_SIZE, cursor=None):
+    """
+    One page of patients who can receive donor_bloodgroup near (lat, lng),
+    closest first, as NearbyPatient records.
+
+    Returns:
+        (records, next_cursor, total): next_cursor is None on the last page.
+    """
+    return _search(
+        patient_snapshot, Patient.objects,
+        ('user__first_name', 'user__last_name', 'bloodgroup', 'location_name'),
+        lambda pk, first, last, *rest: NearbyPatient(pk, _full_name(first, last), *rest),
+        lat, lng, get_compatible_recipient_blood_types(donor_bloodgroup), max_distance_km, limit, cursor,
+    )
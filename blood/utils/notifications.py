@@ -0,0 +1,132 @@
+# blood/utils/notifications.py
+# Shared inbox queries and cached unread counters for the generic Notification model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+
+from blood.models import BloodRequest, Notification
+from donor.models import BloodDonate, Donor
+from nurse.models import Nurse
+from patient.models import Patient
+
+RECIPIENT_MODELS = (Donor, Patient, Nurse)
+# Checked in this order, as afterlogin_view does
+ROLE_MODELS = {'patient': Patient, 'nurse': Nurse, 'donor': Donor}
+ROLE_TTL = 24 * 60 * 60
+# Counters are recounted at least this often, bounding drift from missed updates
+UNREAD_COUNT_TTL = 10 * 60
+ADMIN_COUNTS_KEY = 'notification_admin_counts'
+
+
+def inbox_for(profile, unread_only=False):
+    """
+    Notifications addressed to a Donor, Patient or Nurse, newest first.
+
+    The filter and ordering match notification_inbox_idx (and, with
+    unread_only, the partial notification_unread_idx), so both the inbox page
+    and unread counts are index range scans however large the table gets.
+    """
+    notifications = Notification.objects.filter(
+        recipient_content_type=ContentType.objects.get_for_model(profile),
+        recipient_object_id=profile.pk,
+    )
+    if unread_only:
+        notifications = notifications.filter(read=False)
+    return notifications.order_by('-created_at')
+
+
+# -- roles ----------------------------------------------------------------
+
+def user_role_key(user_id):
+    return f"user_role:{user_id}"
+
+
+def user_role(user):
+    """
+    'patient', 'nurse', 'donor' or '' (no profile, e.g. admins and anonymous
+    users), cached per user. Profile saves and deletes clear the cached role
+    (blood.signals.forget_user_role).
+    """
+    if not user.is_authenticated:
+        return ''
+    key = user_role_key(user.pk)
+    role = cache.get(key)
+    if role is None:
+        role = next(
+            (name for name, model in ROLE_MODELS.items() if model.objects.filter(user_id=user.pk).exists()), ''
+        )
+        cache.set(key, role, ROLE_TTL)
+    return role
+
+
+# -- per-user unread counters ------------------------------------------
+
+def unread_count_key(user_id, model):
+    return f"notification_unread:{model._meta.model_name}:{user_id}"
+
+
+def cached_unread_count(user, model):
+    """
+    Unread notifications of the user's Donor, Patient or Nurse profile
+    (0 if they have none), from a per-user counter in the Django cache.
+
+    Keyed by user id so reading needs no profile lookup; a miss costs one
+    COUNT. Notification saves and deletes adjust the counter (see
+    blood.signals.update_unread_counter) with cache.incr/decr, which are
+    atomic on the shared Redis cache (settings.CACHES).
+    """
+    key = unread_count_key(user.pk, model)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(
+            recipient_content_type=ContentType.objects.get_for_model(model),
+            recipient_object_id__in=model.objects.filter(user_id=user.pk).values('pk'),
+            read=False,
+        ).count()
+        cache.add(key, count, UNREAD_COUNT_TTL)
+    return max(count, 0)
+
+
+def _recipient_keys(content_type_id, object_ids):
+    """Counter keys of the users behind these recipients; none for non-profile recipients."""
+    if content_type_id is None:
+        return []
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    if model not in RECIPIENT_MODELS:
+        return []
+    user_ids = model.objects.filter(pk__in=object_ids, user__isnull=False).values_list('user_id', flat=True)
+    return [unread_count_key(user_id, model) for user_id in user_ids]
+
+
+def adjust_unread_count(content_type_id, object_id, delta):
+    """Add delta to a recipient's counter if it is cached (an uncached one is counted on its next read)."""
+    for key in _recipient_keys(content_type_id, [object_id]):
+        try:
+            if delta > 0:
+                cache.incr(key, delta)
+            else:
+                cache.decr(key, -delta)
+        except ValueError:
+            pass
+
+
+def invalidate_unread_counts(content_type_id, object_ids):
+    """Drop recipients' counters, for bulk writes that send no signals."""
+    cache.delete_many(_recipient_keys(content_type_id, list(object_ids)))
+
+
+# -- admin badges -------------------------------------------------------
+
+def admin_badge_counts():
+    """New blood requests and donations not yet seen by an admin, cached until either changes."""
+    counts = cache.get(ADMIN_COUNTS_KEY)
+    if counts is None:
+        counts = {
+            'new_requests_count': BloodRequest.objects.filter(status='pending', is_seen=False).count(),
+            'new_donations_count': BloodDonate.objects.filter(is_seen=False).count(),
+        }
+        cache.add(ADMIN_COUNTS_KEY, counts, UNREAD_COUNT_TTL)
+    return counts
+
+
+def invalidate_admin_counts():
+    cache.delete(ADMIN_COUNTS_KEY)
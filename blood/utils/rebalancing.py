@@ -0,0 +1,236 @@
+# blood/utils/rebalancing.py
+# Network-wide stock rebalancing: move surplus and soon-to-expire blood to centers that will run short
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from blood.models import DemandForecast, DonationCenter, Stock, StockUnit
+from blood.utils.forecasting import REORDER_COVER_DAYS
+from blood.utils.geolocation import haversine_matrix
+from nurse.models import Nurse, NurseBloodRequest
+
+REBALANCE_MAX_DISTANCE_KM = 150
+# Batches closer to expiry than this are not worth putting on the road
+MIN_TRANSFER_SHELF_DAYS = 3
+# Smaller moves are not worth a trip
+MIN_TRANSFER_ML = 100
+# Target level for centers without a fresh forecast (same as Nurse.request_blood)
+LOW_STOCK_THRESHOLD = 500
+
+
+def _expiring_unused(batches, daily_demand, today):
+    """
+    Split a center's batches into ml that will expire before local demand uses them.
+
+    Batches are consumed FIFO at daily_demand ml/day. Returns (movable, stranded):
+    wasted ml in batches that can still be moved, and in batches that cannot.
+    """
+    movable = stranded = 0
+    used = 0.0
+    for unit, expiry_date in batches:
+        days_left = (expiry_date - today).days + 1
+        # What local demand can still take from this batch before it expires
+        takes = min(unit, max(0.0, daily_demand * days_left - used))
+        used += takes
+        wasted = int(unit - takes)
+        if days_left - 1 >= MIN_TRANSFER_SHELF_DAYS:
+            movable += wasted
+        else:
+            stranded += wasted
+    return movable, stranded
+
+
+def _greedy_moves(pool, deficit, distance, max_distance_km):
+    """
+    Assign ml from pool[s] to deficit[t], nearest pairs first.
+
+    Pairs are ranked in one vectorized argsort; the walk stops as soon as
+    either side is exhausted. pool and deficit are modified in place.
+
+    Returns:
+        list: (source_index, dest_index, ml) moves.
+    """
+    feasible = (pool[:, None] > 0) & (deficit[None, :] > 0) & (distance <= max_distance_km)
+    np.fill_diagonal(feasible, False)
+    sources, dests = np.nonzero(feasible)
+    order = np.argsort(distance[sources, dests], kind='stable')
+
+    moves = []
+    remaining_pool, remaining_deficit = pool.sum(), deficit.sum()
+    for s, t in zip(sources[order], dests[order]):
+        if remaining_pool <= 0 or remaining_deficit <= 0:
+            break
+        ml = min(pool[s], deficit[t])
+        if ml < MIN_TRANSFER_ML and ml < deficit[t]:
+            continue
+        if ml <= 0:
+            continue
+        pool[s] -= ml
+        deficit[t] -= ml
+        remaining_pool -= ml
+        remaining_deficit -= ml
+        moves.append((s, t, int(ml)))
+    return moves
+
+
+def plan_rebalancing(today=None, max_distance_km=REBALANCE_MAX_DISTANCE_KM, bloodgroups=None):
+    """
+    Plan inter-center transfers that reduce shortages and expiry wastage.
+
+    Each center's target is its forecast demand over REORDER_COVER_DAYS, or
+    the flat LOW_STOCK_THRESHOLD when no fresh forecast exists. Blood that
+    local demand will not use before it expires is moved first; surplus
+    above target fills the remaining shortages. Both passes send from the
+    nearest source that has blood to spare (vectorized greedy; the planner
+    does not solve an exact min-cost flow).
+
+    Only centers with coordinates take part.
+
+    Returns:
+        (moves, summary): moves is a list of dicts with bloodgroup, source_id,
+        dest_id, units, distance_km and reason; summary holds network totals
+        before and after the plan.
+    """
+    today = today or timezone.now().date()
+    centers = list(
+        DonationCenter.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .order_by('id')
+        .values_list('id', 'latitude', 'longitude')
+    )
+    summary = {'centers': len(centers), 'shortage_ml': 0, 'shortage_after_ml': 0,
+               'expiring_ml': 0, 'expiring_rescued_ml': 0}
+    if len(centers) < 2:
+        return [], summary
+
+    ids = [c[0] for c in centers]
+    distance = haversine_matrix([c[1] for c in centers], [c[2] for c in centers],
+                                [c[1] for c in centers], [c[2] for c in centers])
+    groups = bloodgroups or [bg for bg, _ in Stock.BLOOD_GROUP_CHOICES]
+
+    batches = defaultdict(list)
+    for center_id, bloodgroup, unit, expiry_date in (
+        StockUnit.objects.filter(center_id__in=ids, bloodgroup__in=groups, unit__gt=0, expiry_date__gte=today)
+        .order_by('center_id', 'bloodgroup', 'expiry_date', 'id')
+        .values_list('center_id', 'bloodgroup', 'unit', 'expiry_date')
+    ):
+        batches[(center_id, bloodgroup)].append((unit, expiry_date))
+
+    daily = {
+        (center_id, bloodgroup): demand
+        for center_id, bloodgroup, demand in DemandForecast.objects.filter(
+            center_id__in=ids, bloodgroup__in=groups, computed_on__gte=today - timedelta(days=1)
+        ).values_list('center_id', 'bloodgroup', 'daily_demand')
+    }
+
+    moves = []
+    for bloodgroup in groups:
+        n = len(ids)
+        on_hand = np.zeros(n)
+        target = np.full(n, float(LOW_STOCK_THRESHOLD))
+        expiring = np.zeros(n)
+        stranded = np.zeros(n)
+        for i, center_id in enumerate(ids):
+            key = (center_id, bloodgroup)
+            on_hand[i] = sum(unit for unit, _ in batches.get(key, ()))
+            if key in daily:
+                target[i] = daily[key] * REORDER_COVER_DAYS
+                expiring[i], stranded[i] = _expiring_unused(batches.get(key, ()), daily[key], today)
+
+        useful = on_hand - expiring - stranded
+        deficit = np.floor(np.maximum(target - useful, 0))
+        spare = np.floor(np.maximum(useful - target, 0))
+        summary['shortage_ml'] += int(deficit.sum())
+        summary['expiring_ml'] += int(expiring.sum())
+
+        for reason, pool in (('expiring', expiring.copy()), ('surplus', spare)):
+            before = pool.sum()
+            for s, t, ml in _greedy_moves(pool, deficit, distance, max_distance_km):
+                moves.append({
+                    'bloodgroup': bloodgroup,
+                    'source_id': ids[s],
+                    'dest_id': ids[t],
+                    'units': ml,
+                    'distance_km': round(float(distance[s, t]), 1),
+                    'reason': reason,
+                })
+            if reason == 'expiring':
+                summary['expiring_rescued_ml'] += int(before - pool.sum())
+        summary['shortage_after_ml'] += int(deficit.sum())
+
+    return moves, summary
+
+
+def _urgency(forecast, on_hand):
+    """Map a destination's projected cover to a NurseBloodRequest urgency level."""
+    if forecast is None:
+        return 'critical' if not on_hand else 'medium'
+    cover = forecast.days_of_cover
+    if cover is None:
+        return 'low'
+    if cover < 1:
+        return 'critical'
+    if cover < 3:
+        return 'high'
+    if cover < REORDER_COVER_DAYS:
+        return 'medium'
+    return 'low'
+
+
+def create_draft_requests(moves, bloodgroups=None):
+    """
+    Turn a plan into draft NurseBloodRequests with one bulk insert.
+
+    Each draft is raised on behalf of a nurse at the receiving center; moves to
+    centers with no nurse are skipped. Drafts left over from an earlier run
+    for the blood groups this plan covered (``bloodgroups``, by default the
+    groups in ``moves``) are replaced; drafts for other groups are kept.
+
+    Returns:
+        (created, skipped): the new requests and the moves that had no nurse.
+    """
+    dest_ids = {move['dest_id'] for move in moves}
+    requesters = {}
+    for nurse in Nurse.objects.filter(donation_center_id__in=dest_ids).order_by('id'):
+        requesters.setdefault(nurse.donation_center_id, nurse)
+
+    forecasts = {
+        (f.center_id, f.bloodgroup): f
+        for f in DemandForecast.objects.filter(center_id__in=dest_ids)
+    }
+    on_hand = {
+        (center_id, bloodgroup): unit
+        for center_id, bloodgroup, unit in Stock.objects.filter(center_id__in=dest_ids)
+        .values_list('center_id', 'bloodgroup', 'unit')
+    }
+
+    drafts, skipped = [], []
+    for move in moves:
+        nurse = requesters.get(move['dest_id'])
+        if nurse is None:
+            skipped.append(move)
+            continue
+        key = (move['dest_id'], move['bloodgroup'])
+        drafts.append(NurseBloodRequest(
+            requester=nurse,
+            supplying_center_id=move['source_id'],
+            blood_group=move['bloodgroup'],
+            units=move['units'],
+            urgency_level=_urgency(forecasts.get(key), on_hand.get(key, 0)),
+            status=NurseBloodRequest.STATUS_DRAFT,
+            reason=(
+                f"Rebalancing plan: {move['units']}ml {move['reason']} stock, "
+                f"{move['distance_km']} km away."
+            ),
+        ))
+
+    with transaction.atomic():
+        # A plan for a group covers every center, so its old drafts are superseded wherever they were raised
+        NurseBloodRequest.objects.filter(
+            status=NurseBloodRequest.STATUS_DRAFT,
+            blood_group__in=set(bloodgroups or [move['bloodgroup'] for move in moves]),
+        ).delete()
+        created = NurseBloodRequest.objects.bulk_create(drafts)
+    return created, skipped
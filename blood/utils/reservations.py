@@ -0,0 +1,143 @@
+# blood/utils/reservations.py
+# Stock holds between request approval and completion
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from blood.models import BloodRequest, StockReservation, StockUnit
+from blood.utils.blood_compatibility import get_compatible_blood_types
+from blood.utils.stock_utils import allocate_fifo, apply_deductions, deduct_stock_fifo, held_units
+
+# A hold lasts at least this long, and until a day after the request's appointment
+HOLD_TTL = timedelta(hours=48)
+HOLD_GRACE_AFTER_APPOINTMENT = timedelta(days=1)
+
+
+def hold_expiry(blood_request, now=None):
+    """When a hold for blood_request should lapse if the request is never completed."""
+    expires_at = (now or timezone.now()) + HOLD_TTL
+    for appointment in blood_request.appointments.all():
+        if appointment.date and appointment.date + HOLD_GRACE_AFTER_APPOINTMENT > expires_at:
+            expires_at = appointment.date + HOLD_GRACE_AFTER_APPOINTMENT
+    return expires_at
+
+
+def _request_field(blood_request):
+    """Name of the StockReservation foreign key that points at this kind of request."""
+    return 'blood_request' if isinstance(blood_request, BloodRequest) else 'donor_blood_request'
+
+
+def hold_stock(center, blood_request):
+    """
+    Hold batches for an approved request, earliest expiry first.
+
+    Candidate batches are locked and ml already held for other requests is
+    skipped, so two approvals can never hold the same blood. Any previous
+    holds of this request are replaced.
+
+    Returns:
+        (True, holds) where holds is a list of StockReservation
+        or
+        (False, error_message) if there is not enough unheld stock.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        blood_request.reservations.all().delete()
+        candidates = list(
+            StockUnit.objects.select_for_update()
+            .filter(center=center, bloodgroup=blood_request.bloodgroup, unit__gt=0, expiry_date__gte=now.date())
+            .order_by('expiry_date', 'added_on', 'id')
+            .annotate(held=held_units(stockunit='pk'))
+            .values('id', 'barcode', 'unit', 'held', 'expiry_date')
+        )
+        allocation = allocate_fifo(candidates, blood_request.unit)
+        short_by = blood_request.unit - sum(a['quantity'] for a in allocation)
+        if short_by > 0:
+            return False, f"Not enough unreserved stock to hold: short by {short_by} ml."
+
+        expires_at = hold_expiry(blood_request, now)
+        field = _request_field(blood_request)
+        holds = StockReservation.objects.bulk_create([
+            StockReservation(stockunit_id=a['stockunit_id'], units=a['quantity'], expires_at=expires_at,
+                             **{field: blood_request})
+            for a in allocation
+        ])
+    return True, holds
+
+
+def release_holds(blood_request):
+    """Drop every hold of a request (rejected, cancelled or completed). Returns the number released."""
+    deleted, _ = blood_request.reservations.all().delete()
+    return deleted
+
+
+def release_expired_holds(now=None):
+    """
+    Release stale holds in one DELETE: holds past their expiry time and holds
+    on batches that have expired or run dry.
+
+    Returns:
+        int: Number of holds released.
+    """
+    now = now or timezone.now()
+    stale = (
+        StockReservation.objects.filter(expires_at__lte=now)
+        | StockReservation.objects.filter(stockunit__expiry_date__lt=now.date())
+        | StockReservation.objects.filter(stockunit__unit=0)
+    )
+    deleted, _ = StockReservation.objects.filter(id__in=stale.values('id')).delete()
+    return deleted
+
+
+def deduct_for_request(center, blood_request, record=None, allow_substitutes=False):
+    """
+    Deduct stock for a request, turning its holds into deductions.
+
+    If the request's active holds still cover exactly the requested amount
+    and every held batch can still be given to the request's (possibly
+    changed) blood group, the held batches are deducted directly with no new
+    search, and the holds are released. Held substitute groups only count
+    when allow_substitutes is set. Otherwise the holds are dropped and the
+    request falls back to FIFO on its own group, or on its compatible groups
+    too when allow_substitutes is set.
+
+    Returns:
+        Same as deduct_stock_fifo: (True, deductions) or (False, error_message).
+    """
+    now = timezone.now()
+    bloodgroup = blood_request.bloodgroup
+    usable = set(get_compatible_blood_types(bloodgroup)) if allow_substitutes else {bloodgroup}
+    with transaction.atomic():
+        reservations = list(blood_request.reservations.filter(expires_at__gt=now))
+        if reservations and sum(r.units for r in reservations) == blood_request.unit:
+            reserved = defaultdict(int)
+            for r in reservations:
+                reserved[r.stockunit_id] += r.units
+            batches = list(
+                StockUnit.objects.select_for_update()
+                .filter(id__in=reserved, center=center, expiry_date__gte=now.date())
+                .values('id', 'bloodgroup', 'barcode', 'unit', 'expiry_date')
+            )
+            if len(batches) == len(reserved) and all(
+                b['unit'] >= reserved[b['id']] and b['bloodgroup'] in usable for b in batches
+            ):
+                deductions = [{
+                    'stockunit_id': b['id'],
+                    'barcode': b['barcode'],
+                    'bloodgroup': b['bloodgroup'],
+                    'quantity': reserved[b['id']],
+                    'expiry_date': b['expiry_date'],
+                    'remaining': b['unit'] - reserved[b['id']],
+                } for b in batches]
+                for d in deductions:
+                    if d['bloodgroup'] != bloodgroup:
+                        d['notes'] = f"Substituted {d['bloodgroup']} for {bloodgroup}"
+                apply_deductions(center.id, bloodgroup, deductions, record=record)
+                release_holds(blood_request)
+                return True, deductions
+
+        release_holds(blood_request)
+        return deduct_stock_fifo(center, bloodgroup, blood_request.unit, record=record,
+                                 substitutes=allow_substitutes)
@@ -0,0 +1,169 @@
+# blood/utils/reverse_geocoder.py
+# Offline reverse geocoding against a bundled gazetteer of Kenyan towns, with a refinable per-cell cache
+import csv
+import re
+import threading
+from math import asin, cos, floor, radians, sin
+from pathlib import Path
+
+import numpy as np
+import requests
+from django.conf import settings
+
+from blood.models import GeocodeCache
+from blood.utils.geolocation import EARTH_RADIUS_KM
+from blood.utils.spatial_index import KDTree, to_unit_vectors
+
+GAZETTEER_PATH = Path(__file__).resolve().parent.parent / 'data' / 'kenya_places.csv'
+# One leaf per this many places: a few vectorized leaf scans beat a deep walk for a small file
+GAZETTEER_LEAF_SIZE = 64
+# Points farther than this from every gazetteer place get no name
+MAX_PLACE_DISTANCE_KM = 75
+# GeocodeCache keys are coordinates in hundredths of a degree (cells about 1.1 km across)
+CACHE_KEY_SCALE = 100
+NOMINATIM_REVERSE_URL = 'https://nominatim.openstreetmap.org/reverse'
+NOMINATIM_TIMEOUT = 5
+
+
+class Gazetteer:
+    """
+    Towns and county seats from the bundled CSV (name, county, latitude,
+    longitude), held in a KD-tree for nearest-place lookups and a name table
+    for locating towns. Loaded once per process, from BloodConfig.ready() or
+    on first use.
+    """
+
+    def __init__(self, path=GAZETTEER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = None  # (tree, labels, places), swapped in together
+
+    def load(self):
+        with self._lock:
+            if self._index is None:
+                with open(self.path, newline='', encoding='utf-8') as fh:
+                    rows = list(csv.DictReader(fh))
+                lat = np.radians([float(r['latitude']) for r in rows])
+                lng = np.radians([float(r['longitude']) for r in rows])
+                labels = [
+                    r['name'] if r['name'] == r['county'] else f"{r['name']}, {r['county']}"
+                    for r in rows
+                ]
+                places = {}
+                for r in rows:
+                    point = (float(r['latitude']), float(r['longitude']))
+                    places.setdefault(normalize_place(r['name']), point)
+                    # A county name alone resolves to its first listed town (the county seat)
+                    places.setdefault(normalize_place(r['county']), point)
+                self._index = (KDTree(to_unit_vectors(lat, lng), leaf_size=GAZETTEER_LEAF_SIZE), labels, places)
+        return self._index
+
+    def nearest(self, lat, lng):
+        """(label, distance_km) of the closest place, e.g. ("Thika, Kiambu", 2.4)."""
+        tree, labels, _ = self._index or self.load()
+        lat, lng = radians(lat), radians(lng)
+        point = (cos(lat) * cos(lng), cos(lat) * sin(lng), sin(lat))
+        rows, chords = tree.query(point, 1)
+        if not len(rows):
+            return None, None
+        return labels[rows[0]], 2 * EARTH_RADIUS_KM * asin(min(float(chords[0]) / 2, 1.0))
+
+    def locate(self, *texts):
+        """
+        (latitude, longitude) of the first town or county named in texts,
+        each tried whole and then comma/line by comma/line; None if none match.
+        """
+        _, _, places = self._index or self.load()
+        for text in texts:
+            for part in [text, *re.split(r'[,\n]', text or '')]:
+                point = places.get(normalize_place(part))
+                if point:
+                    return point
+        return None
+
+
+def normalize_place(text):
+    """Lowercase, single-spaced, without a trailing 'town'/'county'/'city': ' Kiambu County' -> 'kiambu'."""
+    text = ' '.join((text or '').lower().split())
+    return re.sub(r' (town|county|city)$', '', text)
+
+
+gazetteer = Gazetteer()
+
+
+def reverse_geocode(lat, lng, max_distance_km=MAX_PLACE_DISTANCE_KM):
+    """Name of the nearest gazetteer place, or None if there is none within max_distance_km."""
+    if lat is None or lng is None:
+        return None
+    label, distance = gazetteer.nearest(lat, lng)
+    return label if distance is not None and distance <= max_distance_km else None
+
+
+def cache_key(lat, lng):
+    """GeocodeCache (lat_key, lng_key) of the cell containing a point."""
+    return floor(lat * CACHE_KEY_SCALE + 0.5), floor(lng * CACHE_KEY_SCALE + 0.5)
+
+
+def cell_bounds(lat_key, lng_key):
+    """(min_lat, max_lat, min_lng, max_lng) of a cache cell; min inclusive, max exclusive."""
+    half = 0.5 / CACHE_KEY_SCALE
+    lat, lng = lat_key / CACHE_KEY_SCALE, lng_key / CACHE_KEY_SCALE
+    return lat - half, lat + half, lng - half, lng + half
+
+
+def resolve_location_name(lat, lng):
+    """
+    Location name for a point without any network call: the refined name
+    cached for its cell if there is one, else the gazetteer name. Cells seen
+    for the first time are recorded so refine_geocodes can improve them later.
+    """
+    lat_key, lng_key = cache_key(lat, lng)
+    entry, _ = GeocodeCache.objects.get_or_create(
+        lat_key=lat_key, lng_key=lng_key,
+        defaults={'name': reverse_geocode(lat, lng) or ''},
+    )
+    return entry.name or None
+
+
+def resolve_location_names(points, known=None, record=True):
+    """
+    Batch resolve_location_name(): {cache_key: name or None} for (lat, lng)
+    points, with one query for cells already cached and one insert for new
+    ones (skipped if record is False). ``known`` ({cache_key: name}) is
+    consulted first and filled in, so callers can carry it across batches.
+    """
+    known = {} if known is None else known
+    wanted = {cache_key(lat, lng): (lat, lng) for lat, lng in points}
+    missing = {key: point for key, point in wanted.items() if key not in known}
+    if missing:
+        cached = GeocodeCache.objects.filter(
+            lat_key__in={key[0] for key in missing}, lng_key__in={key[1] for key in missing},
+        ).values_list('lat_key', 'lng_key', 'name')
+        for lat_key, lng_key, name in cached:
+            if (lat_key, lng_key) in missing:
+                known[lat_key, lng_key] = name or None
+        new = [
+            GeocodeCache(lat_key=key[0], lng_key=key[1], name=reverse_geocode(*point) or '')
+            for key, point in missing.items() if key not in known
+        ]
+        if record:
+            GeocodeCache.objects.bulk_create(new, ignore_conflicts=True)
+        known.update({(entry.lat_key, entry.lng_key): entry.name or None for entry in new})
+    return {key: known[key] for key in wanted}
+
+
+def nominatim_reverse(lat, lng, timeout=NOMINATIM_TIMEOUT):
+    """
+    Place name from Nominatim (city, town or village, else the display name).
+    Raises requests.RequestException on network errors and timeouts.
+    """
+    response = requests.get(
+        NOMINATIM_REVERSE_URL,
+        params={'format': 'json', 'lat': lat, 'lon': lng},
+        headers={'User-Agent': getattr(settings, 'NOMINATIM_USER_AGENT', 'bloodbankmanagement')},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    data = response.json()
+    address = data.get('address', {})
+    return address.get('city') or address.get('town') or address.get('village') or data.get('display_name')
@@ -0,0 +1,191 @@
+# blood/utils/spatial_index.py
+# KD-tree over donation centers (unit-sphere 3D points) for k-nearest and radius lookups
+import heapq
+from math import sin, sqrt
+
+import numpy as np
+
+from blood.models import DonationCenter
+from blood.utils.coordinate_snapshot import CoordinateSnapshot
+from blood.utils.geolocation import EARTH_RADIUS_KM
+
+KDTREE_LEAF_SIZE = 8
+
+
+def to_unit_vectors(lat_rad, lng_rad, cos_lat=None):
+    """Latitude/longitude in radians to (n, 3) points on the unit sphere."""
+    cos_lat = np.cos(lat_rad) if cos_lat is None else cos_lat
+    return np.column_stack([cos_lat * np.cos(lng_rad), cos_lat * np.sin(lng_rad), np.sin(lat_rad)])
+
+
+def km_to_chord(km):
+    """Straight-line distance through the unit sphere for a great-circle distance in km."""
+    return 2 * sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0.0, 1.0))
+
+
+class KDTree:
+    """
+    Static KD-tree over 3D points. Nodes split on their widest axis at the
+    median and keep a bounding box, so searches prune whole subtrees whose
+    box is farther than the current bound. Leaves are scanned vectorized.
+    """
+
+    def __init__(self, points, leaf_size=KDTREE_LEAF_SIZE):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 3)
+        self.leaf_size = leaf_size
+        # Per node: (lo, hi, left, right, indices); children are -1 for leaves
+        self.nodes = []
+        if len(self.points):
+            self._build(np.arange(len(self.points)))
+
+    def _build(self, indices):
+        node = len(self.nodes)
+        pts = self.points[indices]
+        lo, hi = pts.min(axis=0), pts.max(axis=0)
+        axis = int(np.argmax(hi - lo))
+        # Boxes as plain float tuples: per-node bounds are cheaper in Python than on 3-element arrays
+        lo, hi = tuple(lo.tolist()), tuple(hi.tolist())
+        self.nodes.append(None)
+        if len(indices) <= self.leaf_size:
+            self.nodes[node] = (lo, hi, -1, -1, indices)
+            return node
+        order = np.argsort(pts[:, axis], kind='stable')
+        mid = len(indices) // 2
+        left = self._build(indices[order[:mid]])
+        right = self._build(indices[order[mid:]])
+        self.nodes[node] = (lo, hi, left, right, None)
+        return node
+
+    @staticmethod
+    def _box_distance(point, lo, hi):
+        total = 0.0
+        for p, low, high in zip(point, lo, hi):
+            gap = low - p if p < low else p - high if p > high else 0.0
+            total += gap * gap
+        return sqrt(total)
+
+    def query(self, point, k):
+        """Indices and chord distances of the k nearest points, closest first."""
+        if not self.nodes or k <= 0:
+            return np.array([], dtype=int), np.array([])
+        point = np.asarray(point, dtype=float)
+        coords = tuple(point.tolist())
+        best = []  # max-heap of (-distance, index)
+        frontier = [(0.0, 0)]
+        while frontier:
+            bound, node = heapq.heappop(frontier)
+            if len(best) == k and bound > -best[0][0]:
+                break
+            lo, hi, left, right, indices = self.nodes[node]
+            if indices is not None:
+                dist = np.linalg.norm(self.points[indices] - point, axis=1)
+                if len(indices) > k:
+                    # Only a leaf's k closest points can enter the heap
+                    closest = np.argpartition(dist, k - 1)[:k]
+                    dist, indices = dist[closest], indices[closest]
+                for d, i in zip(dist.tolist(), indices.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+                continue
+            for child in (left, right):
+                child_lo, child_hi = self.nodes[child][0], self.nodes[child][1]
+                heapq.heappush(frontier, (self._box_distance(coords, child_lo, child_hi), child))
+        best.sort(reverse=True)
+        return np.array([i for _, i in best], dtype=int), np.array([-d for d, _ in best])
+
+    def query_radius(self, point, radius):
+        """Indices and chord distances of every point within radius, closest first."""
+        if not self.nodes:
+            return np.array([], dtype=int), np.array([])
+        point = np.asarray(point, dtype=float)
+        coords = tuple(point.tolist())
+        found, dists = [], []
+        stack = [0]
+        while stack:
+            lo, hi, left, right, indices = self.nodes[stack.pop()]
+            if self._box_distance(coords, lo, hi) > radius:
+                continue
+            if indices is not None:
+                dist = np.linalg.norm(self.points[indices] - point, axis=1)
+                inside = dist <= radius
+                found.append(indices[inside])
+                dists.append(dist[inside])
+            else:
+                stack.extend((left, right))
+        if not found:
+            return np.array([], dtype=int), np.array([])
+        found, dists = np.concatenate(found), np.concatenate(dists)
+        order = np.argsort(dists, kind='stable')
+        return found[order], dists[order]
+
+
+class CenterIndex(CoordinateSnapshot):
+    """
+    Donation centers with coordinates, indexed by a KD-tree that each worker
+    builds on first use and rebuilds whenever a DonationCenter changes.
+    """
+    cache_prefix = 'coordinate_snapshot:center'
+
+    def __init__(self):
+        super().__init__()
+        # (tree, ids, generation): the ids the tree was built from, swapped in together
+        self._tree = None
+
+    def fetch(self, ids=None):
+        centers = DonationCenter.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        if ids is not None:
+            centers = centers.filter(id__in=ids)
+        return centers.order_by().values_list('id', 'latitude', 'longitude')
+
+    def current_tree(self):
+        """Refresh the snapshot and return (tree, ids), rebuilding the tree if centers changed."""
+        self.refresh()
+        built = self._tree
+        if built is None or built[2] != self.generation:
+            with self._lock:
+                built = (KDTree(to_unit_vectors(self.lat, self.lng, self.cos_lat)), self.ids, self.generation)
+                self._tree = built
+        return built[0], built[1]
+
+    @staticmethod
+    def _point(lat, lng):
+        return to_unit_vectors(np.radians([lat]), np.radians([lng]))[0]
+
+    def k_nearest(self, lat, lng, k):
+        """Ids and distances (km) of the k closest centers, closest first."""
+        tree, ids = self.current_tree()
+        rows, chords = tree.query(self._point(lat, lng), k)
+        return ids[rows], chord_to_km(chords)
+
+    def within(self, lat, lng, km):
+        """Ids and distances (km) of every center within km, closest first."""
+        tree, ids = self.current_tree()
+        rows, chords = tree.query_radius(self._point(lat, lng), km_to_chord(km))
+        return ids[rows], chord_to_km(chords)
+
+
+center_index = CenterIndex()
+
+
+def _with_centers(ids, distances):
+    centers = DonationCenter.objects.in_bulk(ids.tolist())
+    return [
+        (centers[pk], round(float(distance), 2))
+        for pk, distance in zip(ids.tolist(), distances) if pk in centers
+    ]
+
+
+def k_nearest_centers(lat, lng, k):
+    """Return [(DonationCenter, distance_km)] for the k closest centers, closest first."""
+    return _with_centers(*center_index.k_nearest(lat, lng, k))
+
+
+def centers_within(lat, lng, km):
+    """Return [(DonationCenter, distance_km)] for every center within km, closest first."""
+    return _with_centers(*center_index.within(lat, lng, km))
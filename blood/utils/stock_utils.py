@@ -1,8 +1,162 @@
 import json
-import uuid
+from collections import defaultdict
+from datetime import date
+from itertools import islice
+import numpy as np
+from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
-from blood.models import DonationCenter, Stock, StockUnit
+from blood.models import DonationCenter, Stock, StockReservation, StockUnit
+from nurse.models import NurseBloodRequestStockUnit
+from blood.utils.barcodes import allocate_barcode, allocate_barcodes
+from blood.utils.blood_compatibility import BLOOD_GROUPS, GROUP_INDEX, compatible_supply, get_substitution_order
+from blood.utils.ledger import ledger_entry, post_ledger_entries
+
+
+def counted_units(unit, expiry_date, today=None):
+    """
+    Return how many ml of a batch count towards the Stock aggregate.
+    Expired batches contribute nothing.
+    """
+    today = today or timezone.now().date()
+    if not unit or expiry_date is None or expiry_date < today:
+        return 0
+    return unit
+
+
+def apply_stock_deltas(deltas):
+    """
+    Apply signed ml deltas to Stock aggregates with atomic F() updates.
+
+    Args:
+        deltas (dict): {(center_id, bloodgroup): signed_ml}
+
+    Aggregates that do not exist yet are created from a full recompute,
+    so a missing row never ends up holding a partial total.
+    """
+    missing = []
+    with transaction.atomic():
+        for (center_id, bloodgroup), delta in deltas.items():
+            if not delta:
+                continue
+            updated = Stock.objects.filter(center_id=center_id, bloodgroup=bloodgroup).update(
+                unit=Greatest(F('unit') + delta, Value(0))
+            )
+            if not updated:
+                missing.append((center_id, bloodgroup))
+        if missing:
+            refresh_stock_aggregates(missing)
+
+
+def refresh_stock_aggregates(pairs=None):
+    """
+    Recompute Stock aggregates from StockUnit with one grouped SUM query.
+
+    This is the repair path: normal writes go through apply_stock_deltas.
+
+    Args:
+        pairs (iterable | None): (center_id, bloodgroup) pairs to refresh,
+            or None to rebuild every aggregate.
+
+    Returns:
+        int: Number of Stock rows written.
+    """
+    today = timezone.now().date()
+    units_qs = StockUnit.objects.filter(expiry_date__gte=today)
+    stock_qs = Stock.objects.all()
+
+    if pairs is not None:
+        pairs = set(pairs)
+        if not pairs:
+            return 0
+        center_ids = {center_id for center_id, _ in pairs}
+        bloodgroups = {bloodgroup for _, bloodgroup in pairs}
+        units_qs = units_qs.filter(center_id__in=center_ids, bloodgroup__in=bloodgroups)
+        stock_qs = stock_qs.filter(center_id__in=center_ids, bloodgroup__in=bloodgroups)
+
+    totals = defaultdict(int)
+    for row in units_qs.values('center_id', 'bloodgroup').annotate(total=Sum('unit')):
+        totals[(row['center_id'], row['bloodgroup'])] = row['total'] or 0
+
+    wanted = pairs if pairs is not None else set(totals)
+
+    with transaction.atomic():
+        existing = {
+            (stock.center_id, stock.bloodgroup): stock
+            for stock in stock_qs.select_for_update()
+        }
+        to_update = []
+        for key, stock in existing.items():
+            if pairs is not None and key not in pairs:
+                continue
+            if stock.unit != totals[key]:
+                stock.unit = totals[key]
+                to_update.append(stock)
+
+        to_create = [
+            Stock(center_id=center_id, bloodgroup=bloodgroup, unit=totals[(center_id, bloodgroup)])
+            for center_id, bloodgroup in wanted
+            if (center_id, bloodgroup) not in existing
+        ]
+
+        if to_update:
+            Stock.objects.bulk_update(to_update, ['unit'])
+        if to_create:
+            Stock.objects.bulk_create(to_create, ignore_conflicts=True)
+
+    return len(to_update) + len(to_create)
+
+
+def active_holds(now=None):
+    """StockReservations that have not expired, on batches that have not expired either."""
+    now = now or timezone.now()
+    return StockReservation.objects.filter(expires_at__gt=now, stockunit__expiry_date__gte=now.date())
+
+
+def held_units(**outer_refs):
+    """
+    Subquery summing active hold ml, correlated to the outer query by
+    outer_refs, e.g. held_units(stockunit='pk') on StockUnit or
+    held_units(stockunit__center='center', stockunit__bloodgroup='bloodgroup') on Stock.
+    """
+    holds = active_holds().filter(**{field: OuterRef(ref) for field, ref in outer_refs.items()})
+    total = holds.order_by().values(*outer_refs).annotate(total=Sum('units')).values('total')[:1]
+    return Coalesce(Subquery(total, output_field=PositiveIntegerField()), Value(0))
+
+
+def with_available(stock_qs):
+    """
+    Annotate a Stock queryset with ``held`` (ml under active reservations)
+    and ``available`` (on-hand minus held). Runs as part
+    of the same query, backed by reservation_active_idx.
+    """
+    return stock_qs.annotate(
+        held=held_units(stockunit__center='center', stockunit__bloodgroup='bloodgroup'),
+    ).annotate(available=Greatest(F('unit') - F('held'), Value(0)))
+
+
+def stock_matrix(center_ids=None):
+    """
+    Available ml per center and blood group as a NumPy array.
+
+    Returns:
+        (center_ids, matrix): matrix has shape (len(center_ids), 8) with
+        columns in BLOOD_GROUPS order; held stock is excluded.
+    """
+    stock_qs = Stock.objects.all()
+    if center_ids is None:
+        center_ids = list(DonationCenter.objects.order_by('id').values_list('id', flat=True))
+    else:
+        center_ids = list(center_ids)
+        stock_qs = stock_qs.filter(center_id__in=center_ids)
+    row = {center_id: i for i, center_id in enumerate(center_ids)}
+    matrix = np.zeros((len(center_ids), len(BLOOD_GROUPS)))
+    for center_id, bloodgroup, ml in with_available(stock_qs).values_list('center_id', 'bloodgroup', 'available'):
+        if center_id in row and bloodgroup in GROUP_INDEX:
+            matrix[row[center_id], GROUP_INDEX[bloodgroup]] = ml
+    return center_ids, matrix
 
 
 def get_blood_stock_context(selected_center_id=None):
@@ -14,31 +168,26 @@ def get_blood_stock_context(selected_center_id=None):
     centers = DonationCenter.objects.all()
     blood_groups = [bg for bg, _ in Stock.BLOOD_GROUP_CHOICES]
 
-    all_centers_stock_data = []
-    for center in centers:
-        center_stock = {bg: 0 for bg in blood_groups}
-        for stock in Stock.objects.filter(center=center):
-            center_stock[stock.bloodgroup] = stock.unit
-        all_centers_stock_data.append({
-            'center': center,
-            'stock': center_stock
-        })
+    center_ids, available = stock_matrix([center.id for center in centers])
+    # ml that could serve a patient of each group at each center, substitutes included
+    compatible = compatible_supply(available)
 
-    chart_data = [
-        {
-            'center': c['center'].name,
-            'center_id': c['center'].id,
-            'city': c['center'].city,
-            'stock': c['stock'],
-        } for c in all_centers_stock_data
-    ]
+    chart_data = []
+    for i, center in enumerate(centers):
+        chart_data.append({
+            'center': center.name,
+            'center_id': center.id,
+            'city': center.city,
+            'stock': {bg: int(available[i, GROUP_INDEX[bg]]) for bg in blood_groups},
+            'compatible_stock': {bg: int(compatible[i, GROUP_INDEX[bg]]) for bg in blood_groups},
+        })
 
     selected_center = None
     stocks = Stock.objects.none()
     if selected_center_id and selected_center_id != 'all':
         try:
             selected_center = DonationCenter.objects.get(id=int(selected_center_id))
-            stocks = Stock.objects.filter(center=selected_center)
+            stocks = with_available(Stock.objects.filter(center=selected_center))
         except (ValueError, DonationCenter.DoesNotExist):
             selected_center = None
             stocks = Stock.objects.none()
@@ -52,97 +201,472 @@ def get_blood_stock_context(selected_center_id=None):
     }
 
 
-def deduct_stock_fifo(center, bloodgroup, required_units):
+def deduct_stock_fifo(center, bloodgroup, required_units, record=None, substitutes=False, priority=None):
     """
     Deduct required_units (ml) of blood from StockUnits for a given center & bloodgroup,
     using FIFO (earliest expiry first).
 
+    Candidate batches are locked with select_for_update and ml held for other
+    requests is left alone. The whole allocation is worked out in memory and
+    then applied with a single UPDATE ... CASE. The Stock aggregates are
+    adjusted once and one ledger StockTransaction per batch is written with
+    bulk_create in the same transaction.
+
+    With substitutes=True, compatible donor groups are included in the same
+    locked query and drawn from only after the exact group, in the order of
+    get_substitution_order (O- last). Substituted batches are noted on their
+    ledger rows.
+
+    Args:
+        center (DonationCenter): Center to deduct from.
+        bloodgroup (str): Blood group to deduct (the recipient's group).
+        required_units (int): Amount in ml.
+        record (dict | None): Extra StockTransaction fields (appointment, user,
+            blood_request, donor_blood_request, notes) stored on each ledger row.
+        substitutes (bool): Allow compatible groups when the exact one runs short.
+        priority (list | None): Donor group priority overriding the default order.
+
     Returns:
-        (True, deductions) where deductions is a list of dicts with barcode, quantity, expiry_date
+        (True, deductions) where deductions is a list of dicts with stockunit_id,
+        barcode, bloodgroup, quantity, expiry_date
         or
         (False, error_message) if not enough stock.
     """
-    stock_qs = StockUnit.objects.filter(
-        center=center,
-        bloodgroup=bloodgroup,
-        unit__gt=0,
-        expiry_date__gte=timezone.now().date()
-    ).order_by('expiry_date', 'added_on', 'id')  # FIFO ordering
+    groups = get_substitution_order(bloodgroup, priority) if substitutes else [bloodgroup]
+    rank = {bg: i for i, bg in enumerate(groups)}
+
+    with transaction.atomic():
+        candidates = list(
+            StockUnit.objects.select_for_update()
+            .filter(
+                center=center,
+                bloodgroup__in=groups,
+                unit__gt=0,
+                expiry_date__gte=timezone.now().date()
+            )
+            .order_by('expiry_date', 'added_on', 'id')  # FIFO ordering
+            .annotate(held=held_units(stockunit='pk'))
+            .values('id', 'barcode', 'bloodgroup', 'unit', 'held', 'expiry_date')
+        )
+        # Exact group first, then substitutes in priority order; FIFO within each
+        candidates.sort(key=lambda b: rank[b['bloodgroup']])
+
+        deductions = allocate_fifo(candidates, required_units)
+        short_by = required_units - sum(d['quantity'] for d in deductions)
+        if short_by > 0:
+            return False, f"Not enough stock to fulfill request: short by {short_by} ml."
+
+        for d in deductions:
+            if d['bloodgroup'] != bloodgroup:
+                d['notes'] = f"Substituted {d['bloodgroup']} for {bloodgroup}"
+        apply_deductions(center.id, bloodgroup, deductions, record=record)
 
+    return True, deductions
+
+
+def allocate_fifo(candidates, required_units):
+    """
+    Split required_units across candidate batches in the order given.
+
+    Args:
+        candidates (list): dicts with id, barcode, unit, expiry_date and
+            optionally held (ml reserved for other requests, never taken).
+        required_units (int): Amount in ml.
+
+    Returns:
+        list: Deduction receipts (stockunit_id, barcode, bloodgroup, quantity,
+        expiry_date, remaining). May cover less than required_units if stock is short.
+    """
     to_deduct = required_units
     deductions = []
+    for batch in candidates:
+        if to_deduct <= 0:
+            break
+        take = min(batch['unit'] - batch.get('held', 0), to_deduct)
+        if take <= 0:
+            continue
+        deductions.append({
+            'stockunit_id': batch['id'],
+            'barcode': batch['barcode'],
+            'bloodgroup': batch.get('bloodgroup'),
+            'quantity': take,
+            'expiry_date': batch['expiry_date'],
+            'remaining': batch['unit'] - take,
+        })
+        to_deduct -= take
+    return deductions
+
+
+def apply_deductions(center_id, bloodgroup, deductions, record=None, transaction_type='deduction'):
+    """
+    Write an in-memory FIFO allocation back in bulk.
+
+    Depleted batches are kept with unit zero and every deduction is posted
+    to the ledger. A receipt's own bloodgroup (for substitutes) overrides
+    ``bloodgroup`` and its ``notes`` are appended to the record's. The rows
+    must already be locked by the caller.
+    """
+    if not deductions:
+        return
+
+    # DO NOT delete depleted stock units - keep them with unit zero
+    StockUnit.objects.filter(id__in=[d['stockunit_id'] for d in deductions]).update(
+        unit=Case(
+            *[When(id=d['stockunit_id'], then=Value(d['remaining'])) for d in deductions],
+            output_field=PositiveIntegerField(),
+        )
+    )
+    deltas = defaultdict(int)
+    for d in deductions:
+        deltas[(center_id, d.get('bloodgroup') or bloodgroup)] -= d['quantity']
+    apply_stock_deltas(deltas)
+
+    entries = []
+    for d in deductions:
+        entry_record = record
+        if d.get('notes'):
+            notes = ' - '.join(filter(None, [(record or {}).get('notes'), d['notes']]))
+            entry_record = {**(record or {}), 'notes': notes}
+        entries.append(ledger_entry(d['stockunit_id'], transaction_type, d['quantity'], entry_record))
+    post_ledger_entries(entries)
+
+
+def transfer_stock(source, dest, bloodgroup, required_units, record=None, blood_request=None):
+    """
+    Move required_units (ml) of a blood group from one or more supplying
+    centers into dest, earliest expiry first.
+
+    ``source`` may be a single DonationCenter or a list in order of
+    preference (e.g. nearest first); a later center is only drawn from once
+    the earlier ones are exhausted. All candidate batches are locked in one
+    query and the split is worked out in memory. Source decrements and
+    destination top-ups are each one UPDATE ... CASE, new destination
+    batches, ledger rows and request links are each one bulk_create, and the
+    Stock aggregates are adjusted once at the end.
+
+    Received blood is merged into an existing destination batch with the same
+    expiry date, otherwise a new batch with its own barcode is created.
+
+    Args:
+        source (DonationCenter | list): Supplying center(s).
+        dest (DonationCenter): Receiving center.
+        bloodgroup (str): Blood group to move.
+        required_units (int): Amount in ml.
+        record (dict | None): Extra StockTransaction fields (user, notes).
+        blood_request (NurseBloodRequest | None): Request to link the used
+            source batches to through NurseBloodRequestStockUnit.
+
+    Returns:
+        (True, transfers) where transfers is a list of dicts with stockunit_id,
+        barcode, quantity, expiry_date, remaining, center_id, dest_stockunit_id
+        or
+        (False, error_message) if the sources cannot cover the request.
+    """
+    sources = list(source) if isinstance(source, (list, tuple)) else [source]
+    priority = {center.id: rank for rank, center in enumerate(sources)}
+    if dest.id in priority:
+        return False, "A center cannot transfer stock to itself."
 
     with transaction.atomic():
-        for stock in stock_qs:
-            if to_deduct <= 0:
-                break
-            take = min(stock.unit, to_deduct)
-            deductions.append({
-                'barcode': stock.barcode,
-                'quantity': take,
-                'expiry_date': stock.expiry_date,
-            })
-            stock.unit -= take
-            # DO NOT delete depleted stock units - keep them with unit zero
-            stock.save(update_fields=['unit'])
-            to_deduct -= take
-
-        if to_deduct > 0:
-            transaction.set_rollback(True)
-            return False, f"Not enough stock to fulfill request: short by {to_deduct} ml."
+        candidates = sorted(
+            StockUnit.objects.select_for_update()
+            .filter(
+                center_id__in=priority,
+                bloodgroup=bloodgroup,
+                unit__gt=0,
+                expiry_date__gte=timezone.now().date()
+            )
+            .annotate(held=held_units(stockunit='pk'))
+            .values('id', 'center_id', 'barcode', 'unit', 'held', 'expiry_date', 'added_on'),
+            key=lambda b: (priority[b['center_id']], b['expiry_date'], b['added_on'], b['id']),
+        )
 
-    return True, deductions
+        transfers = allocate_fifo(candidates, required_units)
+        short_by = required_units - sum(t['quantity'] for t in transfers)
+        if short_by > 0:
+            return False, f"Not enough stock to fulfill transfer: short by {short_by} ml."
+
+        source_center = {b['id']: b['center_id'] for b in candidates}
+        deltas = defaultdict(int)
+        for t in transfers:
+            t['center_id'] = source_center[t['stockunit_id']]
+            deltas[(t['center_id'], bloodgroup)] -= t['quantity']
+            deltas[(dest.id, bloodgroup)] += t['quantity']
+
+        StockUnit.objects.filter(id__in=[t['stockunit_id'] for t in transfers]).update(
+            unit=Case(
+                *[When(id=t['stockunit_id'], then=Value(t['remaining'])) for t in transfers],
+                output_field=PositiveIntegerField(),
+            )
+        )
+
+        # One receiving batch per expiry date: reuse the destination's, create the rest
+        incoming = defaultdict(int)
+        for t in transfers:
+            incoming[t['expiry_date']] += t['quantity']
+        receiving = {}
+        for batch_id, expiry_date in (
+            StockUnit.objects.select_for_update()
+            .filter(center=dest, bloodgroup=bloodgroup, expiry_date__in=list(incoming))
+            .order_by('-id')
+            .values_list('id', 'expiry_date')
+        ):
+            receiving[expiry_date] = batch_id
 
+        if receiving:
+            StockUnit.objects.filter(id__in=list(receiving.values())).update(
+                unit=F('unit') + Case(
+                    *[When(id=batch_id, then=Value(incoming[expiry])) for expiry, batch_id in receiving.items()],
+                    output_field=PositiveIntegerField(),
+                ),
+                received=F('received') + Case(
+                    *[When(id=batch_id, then=Value(incoming[expiry])) for expiry, batch_id in receiving.items()],
+                    output_field=PositiveIntegerField(),
+                ),
+            )
 
-def add_stock(center, bloodgroup, units, expiry_date):
+        new_expiries = [expiry for expiry in incoming if expiry not in receiving]
+        barcodes = iter(allocate_barcodes(dest.id, len(new_expiries)))
+        created = StockUnit.objects.bulk_create([
+            StockUnit(
+                center=dest,
+                bloodgroup=bloodgroup,
+                unit=incoming[expiry],
+                received=incoming[expiry],
+                expiry_date=expiry,
+                barcode=next(barcodes),
+            )
+            for expiry in new_expiries
+        ])
+        receiving.update((batch.expiry_date, batch.id) for batch in created)
+
+        entries = []
+        for t in transfers:
+            t['dest_stockunit_id'] = receiving[t['expiry_date']]
+            entries.append(ledger_entry(t['stockunit_id'], 'transfer_out', t['quantity'], record))
+            entries.append(ledger_entry(t['dest_stockunit_id'], 'transfer_in', t['quantity'], record))
+        post_ledger_entries(entries)
+
+        if blood_request is not None:
+            NurseBloodRequestStockUnit.objects.bulk_create([
+                NurseBloodRequestStockUnit(
+                    blood_request=blood_request,
+                    stock_unit_id=t['stockunit_id'],
+                    units_used=t['quantity'],
+                )
+                for t in transfers
+            ])
+
+        apply_stock_deltas(deltas)
+
+    return True, transfers
+
+
+def add_stock(center, bloodgroup, units, expiry_date, record=None):
     """
-    Add blood units to StockUnit batch and update aggregate Stock.
-    Creates a new StockUnit batch with a unique barcode.
+    Add blood units to StockUnit batch.
+    Creates a new StockUnit batch with a unique barcode and posts its opening
+    'addition' to the ledger; the aggregate Stock is updated once by the
+    StockUnit signal.
 
     Args:
         center (DonationCenter): The donation center.
         bloodgroup (str): The blood group (e.g., 'A+', 'O-').
         units (int): Quantity in ml to add (must be positive).
         expiry_date (date): Expiry date for this stock unit.
+        record (dict | None): Extra StockTransaction fields (appointment, user, notes).
 
     Returns:
         StockUnit instance: The newly created stock batch.
 
     Raises:
-        ValueError: If units <= 0, or barcode generation fails.
+        ValueError: If units <= 0.
     """
     if units <= 0:
         raise ValueError("Units to add must be positive.")
 
     with transaction.atomic():
-        # Generate unique barcode
-        barcode = None
-        for _ in range(10):
-            candidate = f"STK-{uuid.uuid4().hex[:10].upper()}"
-            if not StockUnit.objects.filter(barcode=candidate).exists():
-                barcode = candidate
-                break
-        if not barcode:
-            raise ValueError("Failed to generate unique barcode.")
+        barcode = allocate_barcode(center.id)
 
-        # Create the new StockUnit batch
+        # Create the new StockUnit batch; the post_save signal adds it to Stock
         batch = StockUnit.objects.create(
             center=center,
             bloodgroup=bloodgroup,
             unit=units,
+            received=units,
             expiry_date=expiry_date,
             barcode=barcode,
         )
+        post_ledger_entries([ledger_entry(batch.id, 'addition', units, record)])
 
-        # Update or create aggregate stock record 
-        stock, created = Stock.objects.get_or_create(
-            center=center,
-            bloodgroup=bloodgroup,
-            defaults={'unit': 0}
+    return batch
+
+
+BULK_STOCK_CHUNK_SIZE = 500
+EXPIRY_SWEEP_CHUNK_SIZE = 1000
+
+
+def _clean_stock_row(row, today, blood_groups):
+    """
+    Validate one intake row and return (bloodgroup, unit, expiry_date, barcode).
+    Raises ValueError with a readable message when the row is invalid.
+    """
+    bloodgroup = (row.get('bloodgroup') or '').strip().upper()
+    if bloodgroup not in blood_groups:
+        raise ValueError(f"invalid blood group '{row.get('bloodgroup')}'")
+
+    try:
+        unit = int(row.get('unit'))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid unit '{row.get('unit')}'")
+    if unit <= 0:
+        raise ValueError("unit must be positive")
+
+    expiry_date = row.get('expiry_date')
+    if not isinstance(expiry_date, date):
+        try:
+            expiry_date = date.fromisoformat(str(expiry_date).strip())
+        except ValueError:
+            raise ValueError(f"invalid expiry date '{row.get('expiry_date')}'")
+    if expiry_date < today:
+        raise ValueError("expiry date cannot be in the past")
+
+    barcode = (row.get('barcode') or '').strip() or None
+    return bloodgroup, unit, expiry_date, barcode
+
+
+def bulk_add_stock(center, rows, chunk_size=BULK_STOCK_CHUNK_SIZE, skip_invalid=False):
+    """
+    Add many StockUnit batches to one center in a single transaction.
+
+    Rows are consumed lazily in chunks, so ``rows`` can be a generator reading a
+    large file. Each chunk is validated in one pass, missing barcodes are
+    pre-allocated and the batches and their ledger entries are inserted with
+    bulk_create. The Stock aggregates are updated once per blood group at the end.
+
+    Args:
+        center (DonationCenter): Receiving donation center.
+        rows (iterable): dicts with bloodgroup, unit, expiry_date and optional barcode.
+        chunk_size (int): Rows validated and inserted per round-trip.
+        skip_invalid (bool): Skip bad rows instead of aborting the import.
+
+    Returns:
+        (created_count, errors) where errors is a list of (row_number, message).
+
+    Raises:
+        ValidationError: If any row is invalid and skip_invalid is False.
+    """
+    today = timezone.now().date()
+    blood_groups = {bg for bg, _ in Stock.BLOOD_GROUP_CHOICES}
+    rows = iter(rows)
+    seen_barcodes = set()
+    added = defaultdict(int)
+    errors = []
+    created = 0
+    row_number = 0
+
+    with transaction.atomic():
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            cleaned = []
+            for row in chunk:
+                row_number += 1
+                try:
+                    bloodgroup, unit, expiry_date, barcode = _clean_stock_row(row, today, blood_groups)
+                    if barcode and barcode in seen_barcodes:
+                        raise ValueError(f"duplicate barcode '{barcode}' in import")
+                except ValueError as e:
+                    errors.append((row_number, str(e)))
+                    continue
+                if barcode:
+                    seen_barcodes.add(barcode)
+                cleaned.append((row_number, bloodgroup, unit, expiry_date, barcode))
+
+            provided = [item[4] for item in cleaned if item[4]]
+            taken = set(StockUnit.objects.filter(barcode__in=provided).values_list('barcode', flat=True))
+            if taken:
+                errors.extend(
+                    (item[0], f"barcode '{item[4]}' already exists")
+                    for item in cleaned if item[4] in taken
+                )
+                cleaned = [item for item in cleaned if item[4] not in taken]
+
+            if errors and not skip_invalid:
+                continue  # keep validating so every problem is reported at once
+
+            fresh_barcodes = iter(allocate_barcodes(center.id, sum(1 for item in cleaned if not item[4])))
+            batches = [
+                StockUnit(
+                    center=center,
+                    bloodgroup=bloodgroup,
+                    unit=unit,
+                    received=unit,
+                    expiry_date=expiry_date,
+                    barcode=barcode or next(fresh_barcodes),
+                )
+                for _, bloodgroup, unit, expiry_date, barcode in cleaned
+            ]
+            StockUnit.objects.bulk_create(batches, batch_size=chunk_size)
+            post_ledger_entries(
+                ledger_entry(batch.id, 'addition', batch.unit, {'notes': "Bulk import"})
+                for batch in batches
+            )
+            created += len(batches)
+            for batch in batches:
+                added[(center.id, batch.bloodgroup)] += batch.unit
+
+        if errors and not skip_invalid:
+            raise ValidationError([f"Row {number}: {message}" for number, message in errors])
+
+        apply_stock_deltas(added)
+
+    return created, errors
+
+
+def sweep_expired_stock(today=None, chunk_size=EXPIRY_SWEEP_CHUNK_SIZE, dry_run=False):
+    """
+    Write off every batch that has expired but still holds blood.
+
+    Expired batches across all centers are found with one query on the
+    partial expiry index. Each one gets an 'expiry' StockTransaction, its
+    units are set to zero and the affected Stock aggregates are refreshed
+    together at the end, so the cost does not grow with the number of centers.
+
+    Returns:
+        dict: batches, ml and aggregates touched.
+    """
+    today = today or timezone.now().date()
+    summary = {'batches': 0, 'units': 0, 'aggregates': 0}
+    pairs = set()
+
+    with transaction.atomic():
+        expired = list(
+            StockUnit.objects.select_for_update()
+            .filter(expiry_date__lt=today, unit__gt=0)
+            .order_by('id')
+            .values_list('id', 'center_id', 'bloodgroup', 'unit', 'expiry_date')
         )
-        stock.unit += units
+        if dry_run:
+            transaction.set_rollback(True)
 
-        
-        stock.save()
+        for offset in range(0, len(expired), chunk_size):
+            chunk = expired[offset:offset + chunk_size]
+            summary['batches'] += len(chunk)
+            summary['units'] += sum(row[3] for row in chunk)
+            pairs.update((row[1], row[2]) for row in chunk)
+            if dry_run:
+                continue
 
-    return batch
+            post_ledger_entries(
+                ledger_entry(stockunit_id, 'expiry', unit, {'notes': f"Expired on {expiry_date.isoformat()}"})
+                for stockunit_id, _, _, unit, expiry_date in chunk
+            )
+            StockUnit.objects.filter(id__in=[row[0] for row in chunk]).update(unit=0)
+
+        if not dry_run:
+            summary['aggregates'] = refresh_stock_aggregates(pairs)
+
+    return summary
@@ -48,10 +48,11 @@ from django.views.decorators.http import require_http_methods
 from .forms import DonationCenterForm
 from django.core.exceptions import PermissionDenied,ValidationError
 from blood.utils.stock_utils import add_stock
-from blood.utils.stock_utils import deduct_stock_fifo
+from blood.utils.stock_utils import deduct_stock_fifo, transfer_stock
 from django.utils import timezone
 from django.db import transaction
 from blood.utils.geolocation import find_nearby_centers
+from blood.utils.blood_compatibility import BLOOD_GROUPS, GROUP_INDEX, compatible_supply
 from django.views.decorators.csrf import csrf_exempt
 from nurse.models import Appointment
 import logging
@@ -64,7 +65,8 @@ from django.views.decorators.http import require_POST
 from django.contrib.admin.views.decorators import staff_member_required
 from blood.models import DonorBloodRequest
 from django.db.models import Prefetch
-import requests
+from blood.utils.reverse_geocoder import resolve_location_name
+from blood.utils.notifications import invalidate_admin_counts
 def home_view(request):
     # Ensure at least one donation center exists
     center = models.DonationCenter.objects.first()
@@ -193,19 +195,6 @@ def admin_dashboard_view(request):
     }
 
     return render(request, "blood/admin_dashboard.html", context)
-def add_stock(center, bloodgroup, units, expiry_date):
-    if units <= 0:
-        raise ValidationError("Units must be positive.")
-    if expiry_date < timezone.now().date():
-        raise ValidationError("Expiry date cannot be in the past.")
-
-    stock_unit = StockUnit(
-        center=center,
-        bloodgroup=bloodgroup,
-        unit=units,
-        expiry_date=expiry_date,
-    )
-    stock_unit.save()
 
 
 @login_required(login_url='adminlogin')
@@ -229,7 +218,8 @@ def admin_blood_view(request):
                             center=cd['center'],
                             bloodgroup=cd['bloodgroup'],
                             units=cd['unit'],
-                            expiry_date=cd['expiry_date']
+                            expiry_date=cd['expiry_date'],
+                            record={'user': request.user, 'notes': "Added by admin"},
                         )
                         messages.success(request, "Blood stock unit added successfully.")
                         return redirect('admin-blood')
@@ -256,7 +246,9 @@ def admin_blood_view(request):
         donation_center_form = DonationCenterForm()
 
     # Aggregate stock for tables and chart
-    aggregated_stock = StockUnit.objects.values(
+    aggregated_stock = StockUnit.objects.filter(
+        expiry_date__gte=timezone.now().date()
+    ).values(
         'center__id', 'center__name', 'bloodgroup'
     ).annotate(total_units=Sum('unit'))
 
@@ -270,6 +262,14 @@ def admin_blood_view(request):
             center_stock_map[center_id] = {'name': center_name, 'stock': {}}
         center_stock_map[center_id]['stock'][bloodgroup] = total_units
 
+    # ml that could serve a patient of each group, substitutes included, for every center at once
+    supply = compatible_supply([
+        [data['stock'].get(bg, 0) for bg in BLOOD_GROUPS] for data in center_stock_map.values()
+    ])
+    for row, data in zip(supply, center_stock_map.values()):
+        # Every group, so one with no stock of its own still shows the supply that could cover it
+        data['rows'] = [(bg, data['stock'].get(bg, 0), int(row[GROUP_INDEX[bg]])) for bg in BLOOD_GROUPS]
+
     chart_data = [{
         'center': data['name'],
         'center_id': center_id,
@@ -465,6 +465,7 @@ def admin_request_view(request):
     # Mark unseen pending requests (both types) as seen
     BloodRequest.objects.filter(status='pending', is_seen=False).update(is_seen=True)
     DonorBloodRequest.objects.filter(status='pending', is_seen=False).update(is_seen=True)
+    invalidate_admin_counts()
 
     # Count unseen pending requests (both types)
     new_requests_count = (
@@ -490,6 +491,7 @@ def admin_donation_view(request):
     """
     # Mark all unseen donations as seen
     BloodDonate.objects.filter(is_seen=False).update(is_seen=True)
+    invalidate_admin_counts()
 
     # Prefetch related appointments with their nurse and user data
     donations = (
@@ -521,7 +523,7 @@ from blood.models import (
     StockUnit,
     StockTransaction,
 )
-from blood.utils.stock_utils import deduct_stock_fifo
+from blood.utils.stock_utils import deduct_stock_fifo, transfer_stock
 
 logger = logging.getLogger(__name__)
 def serialize_deductions(deductions):
@@ -698,8 +700,8 @@ def admin_nurse_blood_requests_view(request):
 
         blood_request = get_object_or_404(NurseBloodRequest, id=request_id)
 
-        # Allow cancel any time except if fulfilled
-        if blood_request.status != NurseBloodRequest.STATUS_PENDING and action != 'cancel':
+        # Allow cancel any time except if fulfilled; planner drafts are reviewed like pending requests
+        if blood_request.status not in (NurseBloodRequest.STATUS_PENDING, NurseBloodRequest.STATUS_DRAFT) and action != 'cancel':
             messages.warning(request,
                 f"Request ID {request_id} is already '{blood_request.status}'. No changes made.")
             return redirect('admin-nurse-blood-requests')
@@ -736,57 +738,21 @@ def admin_nurse_blood_requests_view(request):
                         messages.error(request, "Requesting nurse is not assigned to a donation center.")
                         return redirect('admin-nurse-blood-requests')
 
-                    required_units = blood_request.units
-                    bloodgroup = blood_request.blood_group
-
-                    # Get FIFO StockUnits with available units in supplying_center
-                    fifo_stock_units = StockUnit.objects.select_for_update().filter(
-                        center=supplying_center,
-                        bloodgroup=bloodgroup,
-                        unit__gt=0,
-                        expiry_date__gte=timezone.now().date()
-                    ).order_by('expiry_date', 'added_on')
-
-                    accumulated = 0
-                    used_units_allocation = []
-
-                    for stockunit in fifo_stock_units:
-                        if accumulated >= required_units:
-                            break
-
-                        available = stockunit.unit
-                        needed = required_units - accumulated
-                        use_amount = min(available, needed)
-
-                        # Deduct units from supplying StockUnit
-                        stockunit.unit = F('unit') - use_amount
-                        stockunit.save(update_fields=['unit'])
-
-                        # Add units to requesting center StockUnit (same blood group and expiry)
-                        requesting_stockunit, _ = StockUnit.objects.get_or_create(
-                            center=requesting_center,
-                            bloodgroup=bloodgroup,
-                            expiry_date=stockunit.expiry_date,
-                            defaults={'unit': 0}
-                        )
-                        requesting_stockunit.unit = F('unit') + use_amount
-                        requesting_stockunit.save(update_fields=['unit'])
-
-                        # Record usage for linking later
-                        used_units_allocation.append((stockunit, use_amount))
-                        accumulated += use_amount
-
-                    if accumulated < required_units:
+                    # Lock, split and move the stock in bulk; also links the used batches to the request
+                    success, result = transfer_stock(
+                        supplying_center,
+                        requesting_center,
+                        blood_request.blood_group,
+                        blood_request.units,
+                        record={
+                            'user': request.user,
+                            'notes': f"Nurse blood request #{blood_request.id}: {supplying_center.name} to {requesting_center.name}",
+                        },
+                        blood_request=blood_request,
+                    )
+                    if not success:
                         # Rollback transaction: will happen automatically due to exception
-                        raise ValueError("Insufficient blood stock units available to fulfill the request.")
-
-                    # Record which stockunits were used for this request
-                    for stockunit, units_used in used_units_allocation:
-                        NurseBloodRequestStockUnit.objects.create(
-                            blood_request=blood_request,
-                            stock_unit=stockunit,
-                            units_used=units_used
-                        )
+                        raise ValueError(result)
 
                     # Update request status
                     blood_request.status = NurseBloodRequest.STATUS_FULFILLED
@@ -880,19 +846,8 @@ def save_user_location(request):
         except ValueError:
             return JsonResponse({'status': 'error', 'message': 'Invalid latitude or longitude format'}, status=400)
 
-        location_name = None
-
-        try:
-            url = f'https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}'
-            response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
-            if response.status_code == 200:
-                data = response.json()
-                location_name = data.get('address', {}).get('city') or \
-                                data.get('address', {}).get('town') or \
-                                data.get('address', {}).get('village') or \
-                                data.get('display_name')
-        except Exception as e:
-            location_name = None
+        # Local gazetteer (refined names if refine_geocodes has run); never blocks on the network
+        location_name = resolve_location_name(lat, lon)
 
         user = request.user
 
@@ -913,6 +868,45 @@ def save_user_location(request):
 
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
 from blood.models import StockTransaction
+from blood.utils.stock_history import get_stock_history
+
+
+@login_required(login_url='adminlogin')
+@user_passes_test(lambda u: u.is_staff, login_url='adminlogin')
+def admin_stock_history_json(request):
+    """
+    JSON stock history for charts.
+    GET params: start, end (YYYY-MM-DD), interval (daily/weekly/monthly), center_id, bloodgroup.
+    """
+    today = timezone.now().date()
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else today
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=30)
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be in YYYY-MM-DD format.'}, status=400)
+
+    interval = request.GET.get('interval', 'daily')
+    center_id = request.GET.get('center_id')
+    if center_id in (None, '', 'all'):
+        center_id = None
+    elif not center_id.isdigit():
+        return JsonResponse({'error': 'Invalid center id.'}, status=400)
+    bloodgroup = request.GET.get('bloodgroup')
+    if bloodgroup in (None, '', 'all'):
+        bloodgroup = None
+
+    try:
+        series = get_stock_history(start, end, interval, center_id=center_id, bloodgroup=bloodgroup)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'interval': interval,
+        'series': series,
+    })
+
 
 def blood_request_stock_transactions(request, blood_request_id):
     transactions = StockTransaction.objects.filter(blood_request_id=blood_request_id).select_related('stockunit').order_by('-transaction_at')
@@ -72,10 +72,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
 
                 # Custom context processors
-                'patient.context_processors.patient_notification_count',  
-                'donor.context_processors.donor_notification_count',
-                'blood.context_processors.admin_notification_counts',
-                'nurse.context_processors.nurse_unread_notifications',
+                'blood.context_processors.notification_counts',
 
             ],
         },
@@ -96,6 +93,16 @@ DATABASES = {
     }
 }
 
+# Cache (Redis, shared by every worker: unread notification counters, role
+# lookups and coordinate snapshot versions must agree across processes, and
+# counters and snapshot versions rely on Redis's atomic INCR)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    }
+}
+
 # Primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
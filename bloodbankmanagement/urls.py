@@ -46,6 +46,7 @@ urlpatterns = [
     path('admin-patient/', blood_views.admin_patient_view, name='admin-patient'),
     path('admin-request/', blood_views.admin_request_view, name='admin-request'),
     path('admin-donation/', blood_views.admin_donation_view, name='admin-donation'),
+    path('admin-stock-history/', blood_views.admin_stock_history_json, name='admin-stock-history'),
 
     path('admin-contacts/', blood_views.admin_contacts_view, name='admin_contacts'),
     path('admin-post-notification/', blood_views.admin_post_notification, name='admin-post-notification'),
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donor', '0013_remove_blooddonate_approved_at_admin_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(fields=['latitude', 'longitude'], name='donor_lat_lng_idx'),
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericRelation
-from blood.models import Notification, DonationCenter
+from blood.models import DonationCenter, Notification
 from nurse.models import Nurse
 from django.utils import timezone
 from datetime import date, timedelta
@@ -87,6 +87,9 @@ class Donor(models.Model):
         verbose_name = "Donor"
         verbose_name_plural = "Donors"
         ordering = ['user__username']
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='donor_lat_lng_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.bloodgroup}"
@@ -35,6 +35,11 @@ urlpatterns = [
         views.nearby_compatible_patients_view,
         name='nearby-compatible-patients'
     ),
+    path(
+        'nearby-compatible-patients/api/',
+        views.nearby_compatible_patients_api,
+        name='nearby-compatible-patients-api'
+    ),
     path('edit-profile/', views.donor_edit_profile_view, name='donor-edit-profile'), 
      path('save-location/', save_user_location, name='save-user-location'),
     path('eligibility-status/', views.donor_eligibility_status_view, name='donor-eligibility-status'),
@@ -26,7 +26,8 @@ from .forms import (
 from django.core.exceptions import PermissionDenied
 from blood.models import Notification, BloodRequest, DonationCenter,DonorBloodRequest
 from nurse.forms import AppointmentForm
-from blood.utils.geolocation import find_nearby_compatible_patients
+from blood.utils.nearby_search import search_nearby_patients
+from blood.utils.notifications import cached_unread_count, inbox_for
 from datetime import date
 import logging
 from django.db import transaction
@@ -666,14 +667,9 @@ def donor_details_view(request, donor_id):
 @login_required(login_url='donorlogin')
 def donor_notifications_view(request):
     donor = get_object_or_404(Donor, user=request.user)
-    donor_ct = ContentType.objects.get_for_model(donor)
 
-    notifications = Notification.objects.filter(
-        recipient_content_type=donor_ct,
-        recipient_object_id=donor.id
-    ).order_by('-created_at')
-
-    unread_count = notifications.filter(read=False).count()
+    notifications = inbox_for(donor)
+    unread_count = cached_unread_count(request.user, Donor)
 
     return render(request, 'donor/donor_notifications.html', {
         'notifications': notifications,
@@ -682,8 +678,7 @@ def donor_notifications_view(request):
 @login_required(login_url='donorlogin')
 def mark_notification_read(request, pk):
     donor = get_object_or_404(Donor, user=request.user)
-    donor_ct = ContentType.objects.get_for_model(donor)
-    notification = get_object_or_404(Notification, id=pk, recipient_content_type=donor_ct, recipient_object_id=donor.id)
+    notification = get_object_or_404(inbox_for(donor), id=pk)
     notification.read = True
     notification.save()
     return redirect('donor-notifications')
@@ -716,14 +711,40 @@ def nearby_compatible_patients_view(request):
         messages.error(request, "Please update your location and blood group in profile.")
         return redirect('donor-edit-profile')
 
-    patients = find_nearby_compatible_patients(donor.latitude, donor.longitude, donor.bloodgroup)
+    patients, next_cursor, total = search_nearby_patients(
+        donor.latitude, donor.longitude, donor.bloodgroup,
+        limit=request.GET.get('limit'), cursor=request.GET.get('cursor'),
+    )
 
     return render(request, 'donor/nearby_compatible_patients.html', {
         'nearby_patients': patients,
+        'total_patients': total,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'limit': request.GET.get('limit', ''),
         'user_blood_type': donor.bloodgroup,
     })
 
 
+@login_required(login_url='donorlogin')
+@require_GET
+def nearby_compatible_patients_api(request):
+    """JSON page of nearby compatible patients: ?limit=&cursor= (cursor from the previous page's next_cursor)."""
+    donor = getattr(request.user, 'donor', None)
+    if not donor or donor.latitude is None or donor.longitude is None or not donor.bloodgroup:
+        return JsonResponse({'error': 'Location and blood group must be set in your profile.'}, status=400)
+
+    patients, next_cursor, total = search_nearby_patients(
+        donor.latitude, donor.longitude, donor.bloodgroup,
+        limit=request.GET.get('limit'), cursor=request.GET.get('cursor'),
+    )
+    return JsonResponse({
+        'results': [patient.as_dict() for patient in patients],
+        'next_cursor': next_cursor,
+        'total': total,
+    })
+
+
 @login_required(login_url='donorlogin')
 def donor_eligibility_status_view(request):
     donor = get_object_or_404(Donor, user=request.user)
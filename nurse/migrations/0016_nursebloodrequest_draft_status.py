@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nurse', '0015_remove_appointment_approved_at_admin_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nursebloodrequest',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Draft'), ('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('fulfilled', 'Fulfilled'), ('cancelled', 'Cancelled')], default='pending', help_text='Current status of the blood request.', max_length=20),
+        ),
+    ]
@@ -76,19 +76,30 @@ class Nurse(models.Model):
         Request blood from nearby donation centers based on low stock in nurse's center.
         Avoid import circularity by importing here below.
         """
-        from blood.models import Stock, BloodRequest, StockUnit
+        from blood.models import Stock, BloodRequest, StockUnit, DemandForecast
+        from blood.utils.forecasting import REORDER_COVER_DAYS
+        from blood.utils.stock_utils import with_available
 
-        LOW_STOCK_THRESHOLD = 500  # ml threshold, adjust as needed
+        LOW_STOCK_THRESHOLD = 500  # ml threshold, used without a fresh forecast or when it projects no shortfall
 
         if not self.donation_center:
             return "Nurse is not assigned to any donation center."
 
         try:
-            stock = Stock.objects.get(center=self.donation_center, bloodgroup=bloodgroup)
+            stock = with_available(Stock.objects.filter(center=self.donation_center)).get(bloodgroup=bloodgroup)
         except Stock.DoesNotExist:
             return f"No stock data available for blood group {bloodgroup} at your donation center."
 
-        if stock.unit > LOW_STOCK_THRESHOLD:
+        forecast = DemandForecast.objects.filter(
+            center=self.donation_center,
+            bloodgroup=bloodgroup,
+            computed_on__gte=timezone.now().date() - timedelta(days=1),
+        ).first()
+        if forecast and forecast.days_of_cover is not None:
+            sufficient = forecast.days_of_cover > REORDER_COVER_DAYS
+        else:
+            sufficient = stock.available > LOW_STOCK_THRESHOLD
+        if sufficient:
             return f"Stock level for {bloodgroup} is sufficient in your donation center."
 
         expiry_threshold = timezone.now().date() + timedelta(days=7)
@@ -309,6 +320,7 @@ class Appointment(models.Model):
         self.full_clean()
         super().save(*args, **kwargs)
 class NurseBloodRequest(models.Model):
+    STATUS_DRAFT = 'draft'  # proposed by the rebalancing planner, not yet reviewed
     STATUS_PENDING = 'pending'
     STATUS_APPROVED = 'approved'
     STATUS_REJECTED = 'rejected'
@@ -316,6 +328,7 @@ class NurseBloodRequest(models.Model):
     STATUS_CANCELLED = 'cancelled'
 
     STATUS_CHOICES = [
+        (STATUS_DRAFT, 'Draft'),
         (STATUS_PENDING, 'Pending'),
         (STATUS_APPROVED, 'Approved'),
         (STATUS_REJECTED, 'Rejected'),
@@ -23,8 +23,11 @@ from .models import Nurse, Appointment, NurseBloodRequest
 from .forms import (
     NurseLoginForm, NurseSignupForm, NurseForm, AppointmentForm, BloodRequestForm,
 )
-from blood.models import Notification, Stock, DonationCenter, StockUnit,StockTransaction, DonorBloodRequest
-from blood.utils.stock_utils import deduct_stock_fifo
+from blood.models import Notification, Stock, DonationCenter, StockUnit,StockTransaction, DonorBloodRequest, DemandForecast
+from blood.utils.reservations import deduct_for_request, hold_stock, release_holds
+from blood.utils.stock_utils import with_available
+from blood.utils.forecasting import REORDER_COVER_DAYS
+from blood.utils.notifications import cached_unread_count, inbox_for
 from datetime import datetime
 from donor.models import BloodDonate
 from blood.models import BloodRequest 
@@ -133,7 +136,7 @@ def nurse_dashboard(request):
         blood_stock_summary = StockUnit.objects.filter(center=nurse.donation_center)
 
         bloodgroup_qs = (
-            StockUnit.objects.filter(center=nurse.donation_center)
+            StockUnit.objects.filter(center=nurse.donation_center, expiry_date__gte=today)
             .values('bloodgroup')
             .annotate(
                 total_units=Sum('unit'),
@@ -157,7 +160,7 @@ def nurse_dashboard(request):
             selected_center = DonationCenter.objects.get(id=selected_center_id)
             # Aggregate total units and earliest expiry per blood group at selected center
             other_centers_stock = (
-                StockUnit.objects.filter(center=selected_center)
+                StockUnit.objects.filter(center=selected_center, expiry_date__gte=today)
                 .values('bloodgroup')
                 .annotate(
                     total_units=Sum('unit'),
@@ -367,22 +370,19 @@ def nurse_update_donation_appointment_status(request, appointment_id):
                 # Add stock and create transaction record
                 if center and not donation.stock_added_by_nurse:
                     try:
-                        stock_unit = add_stock(center, donation.bloodgroup, donation.unit, expiry_date)
+                        # add_stock posts the 'addition' ledger entry with this record
+                        stock_unit = add_stock(
+                            center, donation.bloodgroup, donation.unit, expiry_date,
+                            record={
+                                'appointment': appointment,
+                                'user': request.user,
+                                'notes': f"Blood donation completion - {donation.unit}ml {donation.bloodgroup} from donor {donation.donor.user.get_full_name()}",
+                            },
+                        )
                         if stock_unit:
                             generated_barcode = stock_unit.barcode
                             donation.stock_added_by_nurse = True
-                            
-                            # Create StockTransaction record for the addition
-                            from blood.models import StockTransaction
-                            StockTransaction.objects.create(
-                                stockunit=stock_unit,
-                                appointment=appointment,
-                                quantity_added=donation.unit,
-                                transaction_type='addition',
-                                user=request.user,
-                                notes=f"Blood donation completion - {donation.unit}ml {donation.bloodgroup} from donor {donation.patient.get_full_name()}"
-                            )
-                            
+
                     except Exception as e:
                         logger.error(f"Error adding stock for donation {donation.id}: {e}")
                         # Consider whether to fail the entire operation or continue
@@ -426,6 +426,7 @@ def serialize_deductions(deductions):
     for d in deductions:
         serialized.append({
             'barcode': d['barcode'],
+            'bloodgroup': d.get('bloodgroup'),
             'quantity': d['quantity'],
             'expiry_date': d['expiry_date'].isoformat() if d['expiry_date'] else None,
         })
@@ -613,6 +614,12 @@ def nurse_update_bloodrequest_appointment_status(request, appointment_id):
                 message = update_status('approved', 'approved', 
                                       approved_by_nurse=nurse, 
                                       approved_at_nurse=now)
+
+                # Hold the blood now so completion cannot race another request for it
+                if linked_request.donation_center and linked_request.bloodgroup and linked_request.unit:
+                    held, hold_result = hold_stock(linked_request.donation_center, linked_request)
+                    if not held:
+                        message += f" Warning: no stock held yet ({hold_result})"
                 
                 return JsonResponse({
                     'success': True,
@@ -623,6 +630,7 @@ def nurse_update_bloodrequest_appointment_status(request, appointment_id):
                 })
 
             elif action == 'reject':
+                release_holds(linked_request)
                 message = update_status('rejected', 'rejected',
                                       rejected_by='nurse',
                                       rejected_at=now,
@@ -637,6 +645,7 @@ def nurse_update_bloodrequest_appointment_status(request, appointment_id):
                 })
 
             elif action == 'cancelled':
+                release_holds(linked_request)
                 message = update_status('cancelled', 'cancelled',
                                       cancelled_by='nurse',
                                       cancelled_at=now,
@@ -696,16 +705,6 @@ def nurse_update_bloodrequest_appointment_status(request, appointment_id):
                         'error': 'Donation center not specified for this request.'
                     }, status=400)
 
-                # Check stock availability
-                stock = Stock.objects.filter(center=center, bloodgroup=linked_request.bloodgroup).first()
-                available_units = stock.unit if stock else 0
-                
-                if available_units < linked_request.unit:
-                    return JsonResponse({
-                        'success': False, 
-                        'error': f'Insufficient stock: Only {available_units} ml of {linked_request.bloodgroup} blood available at {center.name}. Required: {linked_request.unit} ml.'
-                    }, status=400)
-
                 # Prevent duplicate stock deduction
                 if linked_request.stock_deducted:
                     return JsonResponse({
@@ -713,45 +712,34 @@ def nurse_update_bloodrequest_appointment_status(request, appointment_id):
                         'error': 'Stock has already been deducted for this request.'
                     }, status=400)
 
-                # Perform FIFO stock deduction
-                success, deduction_result = deduct_stock_fifo(center, linked_request.bloodgroup, linked_request.unit)
+                # Deduct the held batches (or FIFO) under row locks, logging one transaction per batch;
+                # availability is checked there, not against an unlocked Stock read
+                transaction_record = {
+                    'appointment': appointment,
+                    'user': nurse.user,
+                    'notes': f"Blood request completion - {linked_request.unit}ml {linked_request.bloodgroup}",
+                }
+                if isinstance(linked_request, BloodRequest):
+                    transaction_record['blood_request'] = linked_request
+                elif isinstance(linked_request, DonorBloodRequest):
+                    transaction_record['donor_blood_request'] = linked_request
+
+                # Emergencies may draw on compatible groups (O- last) rather than fail on the exact one
+                allow_substitutes = (
+                    linked_request.urgency_level == 'Emergency'
+                    or request.POST.get('allow_substitutes') in ('1', 'true', 'on')
+                )
+                success, deduction_result = deduct_for_request(
+                    center, linked_request, record=transaction_record, allow_substitutes=allow_substitutes
+                )
                 
                 if not success:
+                    transaction.set_rollback(True)
                     return JsonResponse({
                         'success': False, 
-                        'error': f'Stock deduction failed: {deduction_result}'
+                        'error': f'Insufficient stock at {center.name}: {deduction_result}'
                     }, status=400)
 
-                # Create stock transactions for audit trail
-                for deduction in deduction_result:
-                    try:
-                        stock_unit = StockUnit.objects.get(barcode=deduction['barcode'])
-                        
-                        # Create transaction with appropriate request link
-                        transaction_data = {
-                            'stockunit': stock_unit,
-                            'appointment': appointment,
-                            'quantity_deducted': deduction['quantity'],
-                            'transaction_type': 'deduction',
-                            'user': nurse.user,
-                            'notes': f"Blood request completion - {linked_request.unit}ml {linked_request.bloodgroup}"
-                        }
-                        
-                        # Link to the appropriate request type
-                        if isinstance(linked_request, BloodRequest):
-                            transaction_data['blood_request'] = linked_request
-                        elif isinstance(linked_request, DonorBloodRequest):
-                            transaction_data['donor_blood_request'] = linked_request
-                            
-                        StockTransaction.objects.create(**transaction_data)
-                        
-                    except StockUnit.DoesNotExist:
-                        logger.warning(f"StockUnit {deduction['barcode']} not found during transaction logging.")
-
-                # Update stock totals
-                stock.unit -= linked_request.unit
-                stock.save()
-
                 # Mark request as completed and stock deducted
                 message = update_status('completed', 'completed',
                                       completed_by_nurse=nurse,
@@ -867,14 +855,9 @@ def nurse_profile_edit_view(request, pk):
 @user_passes_test(is_nurse, login_url='/nurse/nurselogin/')
 def nurse_notifications_view(request):
     nurse = get_object_or_404(Nurse, user=request.user)
-    nurse_ct = ContentType.objects.get_for_model(Nurse)
 
-    notifications = Notification.objects.filter(
-        recipient_content_type=nurse_ct,
-        recipient_object_id=nurse.id
-    ).order_by('-created_at')
-
-    unread_count = notifications.filter(read=False).count()
+    notifications = inbox_for(nurse)
+    unread_count = cached_unread_count(request.user, Nurse)
 
     return render(request, 'nurse/nurse_notifications.html', {
         'notifications': notifications,
@@ -884,14 +867,8 @@ def nurse_notifications_view(request):
 @user_passes_test(is_nurse, login_url='/nurse/nurselogin/')
 def mark_nurse_notification_read(request, pk):
     nurse = get_object_or_404(Nurse, user=request.user)
-    nurse_ct = ContentType.objects.get_for_model(Nurse)
 
-    notification = get_object_or_404(
-        Notification,
-        id=pk,
-        recipient_content_type=nurse_ct,
-        recipient_object_id=nurse.id
-    )
+    notification = get_object_or_404(inbox_for(nurse), id=pk)
     notification.read = True
     notification.save()
 
@@ -1004,7 +981,7 @@ def nurse_blood_stock(request):
     if selected_centre_id:
         try:
             selected_centre = DonationCenter.objects.get(id=selected_centre_id)
-            other_centers_stock = Stock.objects.filter(center=selected_centre)
+            other_centers_stock = with_available(Stock.objects.filter(center=selected_centre))
         except DonationCenter.DoesNotExist:
             selected_centre = None
             other_centers_stock = None
@@ -1036,23 +1013,15 @@ def nurse_stockunit_list(request, highlight_id=None):
 
     stockunits = stockunits.order_by('-added_on')
 
-    # Aggregate deductions per stockunit
-    deductions = StockTransaction.objects.filter(
-        transaction_type='deduction',
-        stockunit__center=center
-    ).values('stockunit').annotate(total_deducted=Sum('quantity_deducted'))
-
-    deducted_map = {item['stockunit']: item['total_deducted'] for item in deductions}
-
-    stockunits_info = []
-    for unit in stockunits:
-        deducted = deducted_map.get(unit.id, 0) or 0
-        remaining = unit.unit - deducted
-        stockunits_info.append({
+    # Balances are materialized on the batch by the stock ledger, no aggregation needed
+    stockunits_info = [
+        {
             'unit': unit,
-            'deducted': deducted,
-            'remaining': remaining,
-        })
+            'deducted': unit.received - unit.unit,
+            'remaining': unit.unit,
+        }
+        for unit in stockunits
+    ]
 
     context = {
         'stockunits_info': stockunits_info,
@@ -1090,9 +1059,15 @@ def create_blood_request(request):
     low_stock_threshold = 500
     sufficient_centres = []
     if blood_group_prefill:
-        stocks = Stock.objects.filter(
-            bloodgroup=blood_group_prefill,
-            unit__gt=low_stock_threshold
+        stocks = with_available(Stock.objects.filter(bloodgroup=blood_group_prefill)).filter(
+            available__gt=low_stock_threshold
+        ).exclude(
+            # Centers forecast to run short themselves are not offered as suppliers
+            center_id__in=DemandForecast.objects.filter(
+                bloodgroup=blood_group_prefill,
+                days_of_cover__lte=REORDER_COVER_DAYS,
+                computed_on__gte=timezone.now().date() - timedelta(days=1),
+            ).values('center_id')
         )
         sufficient_centres = stocks.values_list('center__id', 'center__name').distinct().order_by('center__name')
 
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0005_remove_patient_address'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['latitude', 'longitude'], name='patient_lat_lng_idx'),
+        ),
+    ]
@@ -57,4 +57,9 @@ class Patient(models.Model):
             if (today.month, today.day) < (self.dob.month, self.dob.day):
                 years -= 1
             return years
-        return None
\ No newline at end of file
+        return None
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='patient_lat_lng_idx'),
+        ]
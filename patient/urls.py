@@ -25,6 +25,7 @@ urlpatterns = [
     path('change-password/', PasswordChangeView.as_view(template_name='patient/change_password.html'), name='patient-change-password'),
     path('ajax/get-nurses/', views.get_nurses_by_center, name='ajax_get_nurses'),
     path('nearby-eligible-donors/', views.nearby_eligible_donors_view, name='nearby-eligible-donors'),
+    path('nearby-eligible-donors/api/', views.nearby_eligible_donors_api, name='nearby-eligible-donors-api'),
     path('ajax/center-stock/<int:center_id>/', center_stock_ajax, name='center-stock-ajax'),
     path('cancel-request/<int:request_id>/', views.cancel_request_view, name='cancel-request'),
       path('blood-stock-tracker/', views.blood_stock_tracker_view, name='patient-blood-stock-tracker'),
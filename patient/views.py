@@ -21,16 +21,17 @@ from django.db import transaction
 from .models import Patient
 from datetime import datetime
 from blood.models import DonationCenter, Stock,StockUnit 
+from blood.utils.stock_utils import with_available
 from .forms import PatientForm
 from blood.forms import RequestForm
 from django.http import JsonResponse
 from nurse.models import Nurse
 from django.core.serializers.json import DjangoJSONEncoder
 import json
-from django.db.models import Count, Q,Min
+from django.db.models import Case, Count, Q, Min, Value, When
 from django.views.decorators.csrf import csrf_exempt
 from django.http import  HttpResponse
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
 from django.utils.timezone import localdate
 from django.core.exceptions import PermissionDenied
 from blood.models import Notification
@@ -124,18 +125,40 @@ from .models import Patient
 from nurse.models import Nurse, Appointment
 from blood import models as bmodels  
 from blood.models import BloodRequest
-from blood.utils.geolocation import find_nearby_eligible_donors
+from blood.utils.nearby_search import search_nearby_donors
+from blood.utils.notifications import inbox_for
+from blood.utils.spatial_index import center_index
 
 # -------------------------------
 # Make Blood Request
 # -------------------------------
+NEAREST_CENTERS_LISTED = 10
+
+
+def _centers_nearest_first(patient, k=NEAREST_CENTERS_LISTED):
+    """
+    All donation centers with the patient's k closest first (closest first),
+    then the rest by name, plus {center_id: distance_km} for the k closest.
+    """
+    centers = DonationCenter.objects.all()
+    if patient.latitude is None or patient.longitude is None:
+        return centers, {}
+    ids, distances = center_index.k_nearest(patient.latitude, patient.longitude, k)
+    ids = ids.tolist()
+    if not ids:
+        return centers, {}
+    rank = Case(*[When(id=pk, then=Value(i)) for i, pk in enumerate(ids)], default=Value(len(ids)))
+    ordered = centers.annotate(nearest_rank=rank).order_by('nearest_rank', 'name')
+    return ordered, {pk: round(float(d), 2) for pk, d in zip(ids, distances)}
+
+
 @login_required(login_url='patientlogin')
 def make_request_view(request):
     patient = getattr(request.user, "patient", None)
     if not patient:
         return redirect("patient-dashboard")
 
-    centers = DonationCenter.objects.all()
+    centers, center_distances = _centers_nearest_first(patient)
     form_errors = {}
     appointment_datetime_str = ''
 
@@ -150,7 +173,8 @@ def make_request_view(request):
             "You already have an active blood request appointment. Please complete, reject, or cancel it before making a new request."
         )
         center_data = [
-            {"id": c.id, "name": c.name, "latitude": c.latitude, "longitude": c.longitude}
+            {"id": c.id, "name": c.name, "latitude": c.latitude, "longitude": c.longitude,
+             "distance_km": center_distances.get(c.id)}
             for c in centers
         ]
         return render(request, 'patient/makerequest.html', {
@@ -236,9 +260,11 @@ def make_request_view(request):
                 form_errors.setdefault('date', []).append("Please select appointment date and time.")
     else:
         request_form = RequestForm(user=request.user)
+    request_form.fields['donation_center'].queryset = centers
 
     center_data = [
-        {"id": c.id, "name": c.name, "latitude": c.latitude, "longitude": c.longitude}
+        {"id": c.id, "name": c.name, "latitude": c.latitude, "longitude": c.longitude,
+         "distance_km": center_distances.get(c.id)}
         for c in centers
     ]
 
@@ -338,12 +364,7 @@ def patient_notifications_view(request):
     if not patient:
         return redirect("patient-dashboard")
 
-    patient_ct = ContentType.objects.get_for_model(Patient)
-
-    notifications = Notification.objects.filter(
-        recipient_content_type=patient_ct,
-        recipient_object_id=patient.id
-    ).order_by('-created_at')
+    notifications = inbox_for(patient)
 
     return render(request, 'patient/patient_notifications.html', {
         'notifications': notifications,
@@ -355,7 +376,10 @@ def patient_notifications_view(request):
 
 @login_required
 def mark_notification_read(request, pk):
-    notification = get_object_or_404(Notification, id=pk)
+    patient = get_patient_or_redirect(request.user, request)
+    if not patient:
+        return redirect("patient-dashboard")
+    notification = get_object_or_404(inbox_for(patient), id=pk)
     notification.read = True
     notification.save()
     return redirect('patient-dashboard')
@@ -416,13 +440,13 @@ def get_nurses_by_center(request):
 def center_stock_ajax(request, center_id):
     try:
         center = DonationCenter.objects.get(id=center_id)
-        stock_qs = Stock.objects.filter(center=center).values('bloodgroup', 'unit')
-        stock_dict = {item['bloodgroup']: item['unit'] for item in stock_qs}
+        stock_qs = with_available(Stock.objects.filter(center=center)).values('bloodgroup', 'available')
+        stock_dict = {item['bloodgroup']: item['available'] for item in stock_qs}
         return JsonResponse({'center': center.name, 'stock': stock_dict})
     except DonationCenter.DoesNotExist:
         return JsonResponse({'error': 'Center not found'}, status=404)
 
-@login_required(login_url='login')
+@login_required(login_url='patientlogin')
 def nearby_eligible_donors_view(request):
     patient = get_patient_or_redirect(request.user, request)
     if not patient:
@@ -432,12 +456,40 @@ def nearby_eligible_donors_view(request):
         messages.error(request, "Your location and blood group must be set in your profile to find donors.")
         return redirect('patient-edit-profile', patient_id=patient.id)
 
-    donors = find_nearby_eligible_donors(patient.latitude, patient.longitude, patient.bloodgroup)
+    donors, next_cursor, total = search_nearby_donors(
+        patient.latitude, patient.longitude, patient.bloodgroup,
+        limit=request.GET.get('limit'), cursor=request.GET.get('cursor'),
+    )
 
     return render(request, 'patient/nearby_eligible_donors.html', {
         'nearby_donors': donors,
+        'total_donors': total,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'limit': request.GET.get('limit', ''),
         'user_blood_type': patient.bloodgroup,
     })
+
+
+@login_required(login_url='patientlogin')
+@require_GET
+def nearby_eligible_donors_api(request):
+    """JSON page of nearby eligible donors: ?limit=&cursor= (cursor from the previous page's next_cursor)."""
+    patient = getattr(request.user, 'patient', None)
+    if not patient or patient.latitude is None or patient.longitude is None or not patient.bloodgroup:
+        return JsonResponse({'error': 'Location and blood group must be set in your profile.'}, status=400)
+
+    donors, next_cursor, total = search_nearby_donors(
+        patient.latitude, patient.longitude, patient.bloodgroup,
+        limit=request.GET.get('limit'), cursor=request.GET.get('cursor'),
+    )
+    return JsonResponse({
+        'results': [donor.as_dict() for donor in donors],
+        'next_cursor': next_cursor,
+        'total': total,
+    })
+
+
 @login_required
 def blood_stock_tracker_view(request):
     centers = DonationCenter.objects.all().order_by('name')
@@ -449,7 +501,7 @@ def blood_stock_tracker_view(request):
         try:
             selected_center = DonationCenter.objects.get(id=selected_center_id)
             stock_data = (
-                StockUnit.objects.filter(center=selected_center)
+                StockUnit.objects.filter(center=selected_center, expiry_date__gte=localdate())
                 .values('bloodgroup')
                 .annotate(
                     total_units=Sum('unit'),